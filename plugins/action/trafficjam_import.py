@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+from ansible_collections.wwt.trafficjam.plugins.plugin_utils.trafficjam_source import TrafficJamSourceActionModule
+
+
+class ActionModule(TrafficJamSourceActionModule):
+    pass
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+DOCUMENTATION = '''
+---
+name: trafficjam
+
+type: aggregate
+
+short_description: Reports the latency of TrafficJam API requests made during a playbook run
+
+description:
+    - "Collects the request timings returned as trafficjam_requests by the trafficjam_* modules."
+    - "At the end of the run, prints the request count, errors, latency percentiles, response bytes and retries
+      per TrafficJam host, module, HTTP method and URL template."
+    - "IDs in request paths are replaced by {id}, so every request to the same endpoint is grouped together."
+    - "Optionally writes the latency histograms to a JSON file and to a Prometheus textfile."
+
+requirements:
+    - Enable the callback with callbacks_enabled = wwt.trafficjam.trafficjam in ansible.cfg
+
+options:
+    output_file:
+        description:
+            - Path of a JSON file to write the summary and latency histograms to.
+        env:
+            - name: TRAFFICJAM_METRICS_FILE
+        ini:
+            - section: callback_trafficjam
+              key: output_file
+        type: path
+    prometheus_file:
+        description:
+            - Path of a Prometheus textfile to write the latency histograms to, for the node_exporter textfile collector.
+            - The file is replaced atomically.
+        env:
+            - name: TRAFFICJAM_PROMETHEUS_FILE
+        ini:
+            - section: callback_trafficjam
+              key: prometheus_file
+        type: path
+    buckets:
+        description:
+            - Upper bounds, in seconds, of the latency histogram buckets.
+        env:
+            - name: TRAFFICJAM_LATENCY_BUCKETS
+        ini:
+            - section: callback_trafficjam
+              key: buckets
+        type: list
+        elements: float
+        default: [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+author:
+    - Nick Thompson (nick.thompson@wwt.com)
+'''
+
+import bisect
+import json
+import os
+import tempfile
+
+from ansible.plugins.callback import CallbackBase
+from ansible_collections.wwt.trafficjam.plugins.module_utils.latency import percentile
+
+# Printed and written percentiles
+PERCENTILES = [50, 90, 95, 99]
+
+
+def prometheus_labels(_labels):
+    _escaped = []
+    for _name, _value in _labels:
+        _value = str(_value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        _escaped.append(f'{_name}="{_value}"')
+    return '{' + ','.join(_escaped) + '}'
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'wwt.trafficjam.trafficjam'
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self, display=None):
+        super(CallbackModule, self).__init__(display=display)
+        # Maps (host, module, method, url template) to the timings of its requests
+        self.series = {}
+
+    def v2_runner_on_ok(self, result):
+        self.collect(result)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self.collect(result)
+
+    def collect(self, result):
+        # Looped tasks report every item under 'results'
+        task_result = result._result
+        item_results = [task_result] + [_item for _item in task_result.get('results', []) if isinstance(_item, dict)]
+
+        module = (getattr(result._task, 'resolved_action', None) or result._task.action).split('.')[-1]
+        for _item in item_results:
+            for _method, _template, _host, _status, _elapsed, _bytes, _retries in _item.get('trafficjam_requests') or []:
+                _series = self.series.setdefault((_host, module, _method, _template),
+                                                 {'elapsed': [], 'statuses': {}, 'bytes': 0, 'retries': 0})
+                _series['elapsed'].append(_elapsed)
+                _series['statuses'][_status] = _series['statuses'].get(_status, 0) + 1
+                _series['bytes'] += _bytes
+                _series['retries'] += _retries
+
+    def summarize(self):
+        _buckets = sorted(float(_bound) for _bound in self.get_option('buckets'))
+        _summary = []
+        for (_host, _module, _method, _template), _series in sorted(self.series.items()):
+            _elapsed = sorted(_series['elapsed'])
+
+            # Counts per bucket, the last one holding everything above the highest bound
+            _histogram = [0] * (len(_buckets) + 1)
+            for _value in _elapsed:
+                _histogram[bisect.bisect_left(_buckets, _value)] += 1
+
+            _entry = dict(
+                host=_host,
+                module=_module,
+                method=_method,
+                url=_template,
+                count=len(_elapsed),
+                errors=sum(_count for _status, _count in _series['statuses'].items() if not 200 <= _status <= 299),
+                statuses=dict((str(_status), _count) for _status, _count in sorted(_series['statuses'].items())),
+                bytes=_series['bytes'],
+                retries=_series['retries'],
+                sum=sum(_elapsed),
+                mean=sum(_elapsed) / len(_elapsed),
+                max=_elapsed[-1],
+                buckets=_buckets,
+                histogram=_histogram
+            )
+            for _percent in PERCENTILES:
+                _entry[f'p{_percent}'] = percentile(_elapsed, _percent)
+            _summary.append(_entry)
+
+        return _summary
+
+    def v2_playbook_on_stats(self, stats):
+        if not self.series:
+            return
+
+        summary = self.summarize()
+        self.print_summary(summary)
+
+        if self.get_option('output_file'):
+            self.write_file(self.get_option('output_file'), json.dumps({'requests': summary}, indent=2) + '\n')
+        if self.get_option('prometheus_file'):
+            self.write_file(self.get_option('prometheus_file'), self.prometheus(summary))
+
+    def print_summary(self, summary):
+        self._display.banner("TRAFFICJAM API LATENCY")
+
+        def ms(_seconds):
+            return f"{_seconds * 1000:.1f}"
+
+        header = ['host', 'module', 'method', 'url', 'count', 'errors'] + [f'p{_percent}' for _percent in PERCENTILES] + \
+            ['max', 'bytes', 'retries']
+        rows = [header]
+        for _entry in summary:
+            rows.append([_entry['host'], _entry['module'], _entry['method'], _entry['url'], str(_entry['count']),
+                         str(_entry['errors'])] + [ms(_entry[f'p{_percent}']) for _percent in PERCENTILES] +
+                        [ms(_entry['max']), str(_entry['bytes']), str(_entry['retries'])])
+
+        widths = [max(len(_row[_column]) for _row in rows) for _column in range(len(header))]
+        for _row in rows:
+            self._display.display('  '.join(_cell.ljust(_width) for _cell, _width in zip(_row, widths)).rstrip())
+        self._display.display("latencies in milliseconds")
+
+        # The histograms are only printed in verbose mode
+        for _entry in summary:
+            _bounds = [f"<={ms(_bound)}" for _bound in _entry['buckets']] + ['+Inf']
+            _histogram = ' '.join(f"{_bound}:{_count}" for _bound, _count in zip(_bounds, _entry['histogram']) if _count)
+            self._display.verbose(f"{_entry['host']} {_entry['module']} {_entry['method']} {_entry['url']}: {_histogram}")
+
+    def prometheus(self, summary):
+        lines = [
+            "# HELP trafficjam_api_request_duration_seconds Latency of TrafficJam API requests.",
+            "# TYPE trafficjam_api_request_duration_seconds histogram"
+        ]
+        for _entry in summary:
+            _labels = [('trafficjam_host', _entry['host']), ('module', _entry['module']),
+                       ('method', _entry['method']), ('url', _entry['url'])]
+            _cumulative = 0
+            for _bound, _count in zip(_entry['buckets'] + ['+Inf'], _entry['histogram']):
+                _cumulative += _count
+                lines.append(f"trafficjam_api_request_duration_seconds_bucket{prometheus_labels(_labels + [('le', _bound)])} {_cumulative}")
+            lines.append(f"trafficjam_api_request_duration_seconds_sum{prometheus_labels(_labels)} {_entry['sum']}")
+            lines.append(f"trafficjam_api_request_duration_seconds_count{prometheus_labels(_labels)} {_entry['count']}")
+
+        counters = [
+            ('trafficjam_api_requests_total', 'TrafficJam API requests by status code, 0 when no response was received.'),
+            ('trafficjam_api_response_bytes_total', 'Bytes received from the TrafficJam API.'),
+            ('trafficjam_api_retries_total', 'Retried TrafficJam API requests.')
+        ]
+        for _name, _help in counters:
+            lines.append(f"# HELP {_name} {_help}")
+            lines.append(f"# TYPE {_name} counter")
+            for _entry in summary:
+                _labels = [('trafficjam_host', _entry['host']), ('module', _entry['module']),
+                           ('method', _entry['method']), ('url', _entry['url'])]
+                if _name == 'trafficjam_api_requests_total':
+                    for _status, _count in _entry['statuses'].items():
+                        lines.append(f"{_name}{prometheus_labels(_labels + [('status_code', _status)])} {_count}")
+                elif _name == 'trafficjam_api_response_bytes_total':
+                    lines.append(f"{_name}{prometheus_labels(_labels)} {_entry['bytes']}")
+                else:
+                    lines.append(f"{_name}{prometheus_labels(_labels)} {_entry['retries']}")
+
+        return '\n'.join(lines) + '\n'
+
+    def write_file(self, path, content):
+        # Write to a temporary file first so readers never see a partial file
+        path = os.path.abspath(os.path.expanduser(path))
+        try:
+            _fd, _temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.trafficjam')
+            with os.fdopen(_fd, 'w') as _file:
+                _file.write(content)
+            os.chmod(_temporary, 0o644)
+            os.replace(_temporary, path)
+        except OSError as e:
+            self._display.warning(f"trafficjam: unable to write {path}: {e}")
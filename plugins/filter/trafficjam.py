@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Filters for the objects returned by the trafficjam_* modules.
+#
+# Each filter makes a single pass over its input, replacing json_query and
+# selectattr chains which walk a large response once per lookup.  They take a
+# list of objects, or a registered module result, whose response list is used:
+#
+#   {{ interfaces | wwt.trafficjam.tj_index('name') }}
+#       maps each name to its object, e.g. ['eth0'].id
+#   {{ subinterfaces | wwt.trafficjam.tj_group_by('physical_id') }}
+#       maps each physical_id to the list of its subinterfaces
+#   {{ subinterfaces | wwt.trafficjam.tj_join(vrfs, 'vrf_id', 'id', into='vrf') }}
+#       adds the VRF each subinterface is bound to as 'vrf', or None
+#   {{ subinterfaces | wwt.trafficjam.tj_free_vlans('100-199', count=10) }}
+#       the first 10 VLAN IDs between 100 and 199 no subinterface uses
+#
+# Objects lacking the key a filter looks at are left out of indexes and groups.
+#
+
+from ansible.errors import AnsibleFilterError
+
+# VLAN IDs which can be assigned to a subinterface
+VLAN_RANGE = [1, 4094]
+
+
+def objects(_value, _filter):
+    # The list of objects to work on, taken from the response of a module result when one is passed
+    if isinstance(_value, dict) and 'response' in _value:
+        _value = _value['response']
+    if _value is None or _value == '':
+        return []
+    if not isinstance(_value, (list, tuple)):
+        raise AnsibleFilterError(f"{_filter} expects a list of objects or a module result, got {type(_value).__name__}")
+    return _value
+
+
+def tj_index(_value, _key='id'):
+    # Map the value of _key to its object.  A later object with the same value replaces an earlier one.
+    _index = {}
+    for _object in objects(_value, 'tj_index'):
+        if isinstance(_object, dict) and _object.get(_key) is not None:
+            _index[_object[_key]] = _object
+    return _index
+
+
+def tj_group_by(_value, _key):
+    # Map the value of _key to the list of objects carrying it, in their original order
+    _groups = {}
+    for _object in objects(_value, 'tj_group_by'):
+        if isinstance(_object, dict) and _object.get(_key) is not None:
+            _groups.setdefault(_object[_key], []).append(_object)
+    return _groups
+
+
+def tj_join(_value, _other, _on, _other_on=None, into=None):
+    #
+    # Left join the objects of _value with those of _other where _value's _on equals _other's _other_on (default _on).
+    #
+    # With into, the matching object of _other is added under that key, or None
+    # when there is none.  Otherwise its fields are merged into a copy of the
+    # object, whose own fields win.  Objects without a match are kept as they are.
+    #
+    _index = tj_index(objects(_other, 'tj_join'), _other_on or _on)
+
+    _joined = []
+    for _object in objects(_value, 'tj_join'):
+        if not isinstance(_object, dict):
+            raise AnsibleFilterError(f"tj_join expects a list of objects, got {type(_object).__name__} in the list")
+        _match = _index.get(_object.get(_on))
+        if into is not None:
+            _joined.append(dict(_object, **{into: _match}))
+        elif _match is not None:
+            _joined.append(dict(_match, **_object))
+        else:
+            _joined.append(_object)
+    return _joined
+
+
+def vlan_range(_range):
+    # Accepts [first, last] or "first-last"
+    try:
+        if isinstance(_range, str):
+            _first, _separator, _last = _range.partition('-')
+            _range = [_first, _last or _first]
+        _first, _last = [int(_bound) for _bound in _range]
+    except (TypeError, ValueError):
+        raise AnsibleFilterError(f"tj_free_vlans expects a range as [first, last] or 'first-last', got {_range!r}")
+
+    if not VLAN_RANGE[0] <= _first <= _last <= VLAN_RANGE[1]:
+        raise AnsibleFilterError(f"tj_free_vlans range must lie within {VLAN_RANGE[0]}-{VLAN_RANGE[1]}, got {_first}-{_last}")
+    return _first, _last
+
+
+def tj_free_vlans(_value, _range=None, count=None):
+    # The VLAN IDs within _range which none of the subinterfaces use, lowest first, up to count of them
+    _first, _last = vlan_range(_range or VLAN_RANGE)
+    _count = _last - _first + 1 if count is None else int(count)
+
+    _used = set()
+    for _object in objects(_value, 'tj_free_vlans'):
+        if isinstance(_object, dict) and _object.get('vlan_id') is not None:
+            try:
+                _used.add(int(_object['vlan_id']))
+            except (TypeError, ValueError):
+                continue
+
+    _free = []
+    for _vlan in range(_first, _last + 1):
+        if len(_free) >= _count:
+            break
+        if _vlan not in _used:
+            _free.append(_vlan)
+    return _free
+
+
+class FilterModule(object):
+
+    def filters(self):
+        return {
+            'tj_index': tj_index,
+            'tj_group_by': tj_group_by,
+            'tj_join': tj_join,
+            'tj_free_vlans': tj_free_vlans
+        }
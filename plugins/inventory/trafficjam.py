@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+DOCUMENTATION = '''
+---
+name: trafficjam
+
+short_description: Builds an inventory of the interfaces of a TrafficJam instance
+
+description:
+    - "Every interface of the WWT ATC Tool TrafficJam becomes a host: physical, bridge, dummy and loopback interfaces
+      under their name, subinterfaces as <parent>.<vlan_id>."
+    - "Hosts are grouped per interface type, per VRF they are bound to and per bridge they belong to.
+      Their hostvars carry every field of the interface prefixed with trafficjam_, along with the VRF name and
+      the address of the TrafficJam instance to pass on to the trafficjam_* modules."
+    - "All collections are fetched concurrently, then the subinterfaces of every physical and bridge interface concurrently."
+    - "With cache enabled, the API responses are stored in the configured inventory cache plugin and later runs
+      within cache_timeout build the inventory without contacting TrafficJam."
+    - "The inventory source must be a YAML file whose name ends with trafficjam.yml or trafficjam.yaml."
+
+extends_documentation_fragment:
+    - constructed
+    - inventory_cache
+
+options:
+    plugin:
+        description:
+            - Marks the file as a source for this plugin.
+        required: true
+        choices: ['wwt.trafficjam.trafficjam']
+    host:
+        description:
+            - Address for TrafficJam instance.
+        required: true
+        type: str
+    port:
+        description:
+            - HTTP Port for TrafficJam instance.  Defaults to 80, or 443 when scheme is https.
+        required: false
+        type: str
+    scheme:
+        description:
+            - Scheme used to reach the TrafficJam instance.
+        required: false
+        type: str
+        choices: ['http', 'https']
+        default: http
+    validate_certs:
+        description:
+            - Verify the TLS certificate of the TrafficJam instance when scheme is https.
+        required: false
+        type: bool
+        default: true
+    unix_socket:
+        description:
+            - Path of a unix domain socket to reach a TrafficJam instance on the same machine through, instead of TCP.
+        required: false
+        type: path
+    timeout:
+        description:
+            - HTTP Timeout
+        required: false
+        type: int
+        default: 10
+    max_workers:
+        description:
+            - Maximum number of concurrent requests
+        required: false
+        type: int
+        default: 8
+    subinterfaces:
+        description:
+            - Add the subinterfaces of every physical and bridge interface as hosts.
+            - Costs one request per physical and bridge interface when the cache is cold.
+        required: false
+        type: bool
+        default: true
+    group_prefix:
+        description:
+            - Prefix of the groups built from types, VRFs and bridges, e.g. trafficjam_physical, trafficjam_vrf_blue and trafficjam_bridge_br0.
+        required: false
+        type: str
+        default: trafficjam_
+
+author:
+    - Nick Thompson (nick.thompson@wwt.com)
+'''
+
+EXAMPLES = '''
+# lab.trafficjam.yml
+plugin: wwt.trafficjam.trafficjam
+host: trafficjam
+
+# Cached for an hour, tasks run against TrafficJam from the controller
+plugin: wwt.trafficjam.trafficjam
+host: trafficjam
+cache: true
+cache_plugin: ansible.builtin.jsonfile
+cache_connection: ~/.cache/trafficjam-inventory
+cache_timeout: 3600
+compose:
+  ansible_connection: "'local'"
+keyed_groups:
+  - key: trafficjam_mtu | string
+    prefix: mtu
+'''
+
+from ansible.errors import AnsibleParserError
+from ansible.inventory.group import to_safe_group_name
+from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable, Constructable
+from ansible_collections.wwt.trafficjam.plugins.module_utils.client import DEFAULT_PORTS, TrafficJamClient, TrafficJamError
+from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import run_concurrently
+
+# Interface collections and the type of their interfaces
+COLLECTIONS = {
+    'interfaces/physicals': 'physical',
+    'interfaces/bridges': 'bridge',
+    'interfaces/dummies': 'dummy',
+    'interfaces/loopback': 'loopback'
+}
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+
+    NAME = 'wwt.trafficjam.trafficjam'
+
+    def verify_file(self, path):
+        return super(InventoryModule, self).verify_file(path) and path.endswith(('trafficjam.yml', 'trafficjam.yaml'))
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path, cache)
+        self._read_config_data(path)
+        self._params = self.params()
+
+        # The API responses are cached, so the groups and composed variables always follow the current configuration
+        cache_key = self.get_cache_key(path)
+        use_cache = self.get_option('cache') and cache
+        update_cache = self.get_option('cache') and not cache
+
+        collections = None
+        if use_cache:
+            try:
+                collections = self._cache[cache_key]
+            except KeyError:
+                update_cache = True
+
+        if collections is None:
+            collections = self.fetch()
+        if update_cache:
+            self._cache[cache_key] = collections
+
+        self.populate(collections)
+
+    def params(self):
+        # The parameters of the instance, shaped like the module parameters module_utils expects
+        _scheme = self.get_option('scheme')
+        return dict(host=self.get_option('host'), port=self.get_option('port') or DEFAULT_PORTS[_scheme], scheme=_scheme,
+                    timeout=self.get_option('timeout'), max_workers=self.get_option('max_workers'),
+                    validate_certs=self.get_option('validate_certs'), unix_socket=self.get_option('unix_socket'))
+
+    def fetch(self):
+        # Fetch every collection concurrently, then the subinterfaces of each physical and bridge interface concurrently
+        _params = self._params
+        _client = TrafficJamClient.from_params(_params)
+
+        def fetch(_path):
+            try:
+                return _client.call("get", _path)
+            except TrafficJamError as _error:
+                raise AnsibleParserError(f"unable to fetch {_path} from TrafficJam: status_code {_error.status_code}")
+            except Exception as _error:
+                raise AnsibleParserError(f"unable to reach TrafficJam at {_client.netloc}: {_error}")
+
+        _paths = ['vrfs'] + list(COLLECTIONS)
+        _collections = dict(zip(_paths, run_concurrently(fetch, _paths, _params['max_workers'])))
+
+        # There is a single loopback interface
+        if isinstance(_collections['interfaces/loopback'], dict):
+            _collections['interfaces/loopback'] = [_collections['interfaces/loopback']]
+
+        _parents = []
+        if self.get_option('subinterfaces'):
+            _parents = [f"{_path}/{_interface['id']}" for _path in ['interfaces/physicals', 'interfaces/bridges']
+                        for _interface in _collections[_path] or [] if _interface.get('id') is not None]
+        _subinterfaces = run_concurrently(lambda _parent: fetch(f"{_parent}/subinterfaces"), _parents, _params['max_workers'])
+        _collections['subinterfaces'] = dict(zip(_parents, _subinterfaces))
+
+        return _collections
+
+    def add_group(self, _name):
+        return self.inventory.add_group(to_safe_group_name(f"{self.get_option('group_prefix')}{_name}"))
+
+    def add_interface(self, _hostname, _interface, _kind, _vrfs, _bridges, _parent=None):
+        _params = self._params
+        self.inventory.add_host(_hostname, group=self.add_group(_kind))
+
+        _hostvars = dict((f"trafficjam_{_field}", _value) for _field, _value in _interface.items())
+        _hostvars.update(trafficjam_kind=_kind, trafficjam_host=_params['host'], trafficjam_port=_params['port'],
+                         trafficjam_scheme=_params['scheme'])
+        if _parent is not None:
+            _hostvars['trafficjam_parent'] = _parent
+
+        _vrf = _vrfs.get(_interface.get('vrf_id'))
+        if _vrf is not None:
+            _hostvars['trafficjam_vrf'] = _vrf.get('name')
+            self.inventory.add_child(self.add_group(f"vrf_{_vrf.get('name') or _vrf['id']}"), _hostname)
+
+        # A bridge belongs to its own group along with its members and subinterfaces
+        _bridge = _bridges.get(_interface['id'] if _kind == 'bridge' else _interface.get('bridge_id'))
+        if _bridge is not None:
+            self.inventory.add_child(self.add_group(f"bridge_{_bridge.get('name') or _bridge['id']}"), _hostname)
+
+        for _name, _value in _hostvars.items():
+            self.inventory.set_variable(_hostname, _name, _value)
+
+        _strict = self.get_option('strict')
+        self._set_composite_vars(self.get_option('compose'), _hostvars, _hostname, strict=_strict)
+        self._add_host_to_composed_groups(self.get_option('groups'), _hostvars, _hostname, strict=_strict)
+        self._add_host_to_keyed_groups(self.get_option('keyed_groups'), _hostvars, _hostname, strict=_strict)
+
+    def populate(self, _collections):
+        _vrfs = dict((_vrf['id'], _vrf) for _vrf in _collections['vrfs'] or [] if _vrf.get('id') is not None)
+        _bridges = dict((_bridge['id'], _bridge) for _bridge in _collections['interfaces/bridges'] or [] if _bridge.get('id') is not None)
+
+        _names = {}
+        for _path, _kind in COLLECTIONS.items():
+            for _interface in _collections[_path] or []:
+                if _interface.get('id') is None:
+                    continue
+                _hostname = _interface.get('name') or f"{_kind}{_interface['id']}"
+                _names[f"{_path}/{_interface['id']}"] = _hostname
+                self.add_interface(_hostname, _interface, _kind, _vrfs, _bridges)
+
+        for _parent, _subinterfaces in _collections.get('subinterfaces', {}).items():
+            for _subinterface in _subinterfaces or []:
+                if _subinterface.get('id') is None:
+                    continue
+                # Subinterfaces of a bridge are members of that bridge
+                if _parent.startswith('interfaces/bridges/'):
+                    _subinterface = dict(_subinterface, bridge_id=int(_parent.rpartition('/')[2]))
+                _hostname = f"{_names[_parent]}.{_subinterface.get('vlan_id', _subinterface['id'])}"
+                self.add_interface(_hostname, _subinterface, 'subinterface', _vrfs, _bridges, _parent=_names[_parent])
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Record and replay of TrafficJam API traffic.
+#
+# A transport is a function taking (method, url, payload, timeout) and
+# returning (status_code, body bytes).  make_request sends every request
+# through one.  When TRAFFICJAM_CASSETTE is set in the environment of a task,
+# the transport is wrapped with one which records to or replays from that file:
+#
+#   TRAFFICJAM_CASSETTE=/tmp/lab.jsonl TRAFFICJAM_CASSETTE_MODE=record ansible-playbook lab.yml
+#   TRAFFICJAM_CASSETTE=/tmp/lab.jsonl TRAFFICJAM_CASSETTE_MODE=replay ansible-playbook lab.yml
+#
+# A cassette holds one JSON object per line with the method, url, payload,
+# status_code, body and elapsed seconds of a request.  Every module run
+# appends to it while recording.
+#
+# Replay serves the recorded responses for the same method, url and payload
+# in recorded order, repeating the last one once they run out, without
+# contacting TrafficJam.  Set TRAFFICJAM_REPLAY_LATENCY to 1 (or true) to
+# wait for the recorded elapsed time before answering, or to any other
+# number to scale it.
+#
+# Every task runs in a new process, so the replay position is kept next to
+# the cassette in <cassette>.position.  Delete it to replay from the start
+# again.  Recording removes it.
+#
+
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+CASSETTE_ENV = 'TRAFFICJAM_CASSETTE'
+CASSETTE_MODE_ENV = 'TRAFFICJAM_CASSETTE_MODE'
+REPLAY_LATENCY_ENV = 'TRAFFICJAM_REPLAY_LATENCY'
+
+
+class CassetteError(Exception):
+    pass
+
+
+def request_key(_method, _url, _payload):
+    # Payloads are sent as query parameters, so only their string values matter
+    _payload = dict((str(_key), str(_value)) for _key, _value in (_payload or {}).items())
+    return json.dumps([_method.lower(), _url, _payload], sort_keys=True)
+
+
+def replay_latency_factor():
+    _value = os.environ.get(REPLAY_LATENCY_ENV, '').strip().lower()
+    if _value in ('', '0', 'false', 'no', 'off'):
+        return 0.0
+    if _value in ('true', 'yes', 'on'):
+        return 1.0
+    try:
+        return float(_value)
+    except ValueError:
+        raise CassetteError(f"{REPLAY_LATENCY_ENV} must be a boolean or a number, got '{_value}'")
+
+
+def position_path(_path):
+    return f"{_path}.position"
+
+
+def record_transport(_path, _transport):
+    _lock = threading.Lock()
+    if os.path.exists(position_path(_path)):
+        os.remove(position_path(_path))
+
+    def record(_method, _url, _payload, _timeout):
+        _started = time.monotonic()
+        _status_code, _body = _transport(_method, _url, _payload, _timeout)
+        _elapsed = time.monotonic() - _started
+
+        _line = json.dumps(dict(
+            method=_method.lower(),
+            url=_url,
+            payload=_payload,
+            status_code=_status_code,
+            body=_body.decode('utf-8', 'surrogateescape'),
+            elapsed=round(_elapsed, 6)
+        ), default=str) + '\n'
+
+        # Forks of the same play append to the cassette concurrently
+        with _lock, open(_path, 'a') as _file:
+            if HAS_FCNTL:
+                fcntl.flock(_file, fcntl.LOCK_EX)
+            _file.write(_line)
+
+        return _status_code, _body
+
+    return record
+
+
+def load_cassette(_path):
+    # Maps a request key to the recorded interactions, in recorded order
+    _interactions = {}
+    try:
+        with open(_path) as _file:
+            for _number, _line in enumerate(_file, 1):
+                if not _line.strip():
+                    continue
+                try:
+                    _interaction = json.loads(_line)
+                    _key = request_key(_interaction['method'], _interaction['url'], _interaction['payload'])
+                except (ValueError, KeyError) as _error:
+                    raise CassetteError(f"invalid interaction on line {_number} of cassette {_path}: {_error}")
+                _interactions.setdefault(_key, []).append(_interaction)
+    except OSError as _error:
+        raise CassetteError(f"unable to read cassette {_path}: {_error}")
+
+    return _interactions
+
+
+def next_position(_path, _key):
+    # Advance the replay position of _key, shared by every process replaying the cassette
+    with open(position_path(_path), 'a+') as _file:
+        if HAS_FCNTL:
+            fcntl.flock(_file, fcntl.LOCK_EX)
+        _file.seek(0)
+        _positions = json.loads(_file.read() or '{}')
+        _position = _positions.get(_key, 0)
+        _positions[_key] = _position + 1
+        _file.seek(0)
+        _file.truncate()
+        _file.write(json.dumps(_positions))
+
+    return _position
+
+
+def replay_transport(_path):
+    _interactions = load_cassette(_path)
+    _factor = replay_latency_factor()
+    _lock = threading.Lock()
+
+    def replay(_method, _url, _payload, _timeout):
+        _key = request_key(_method, _url, _payload)
+        _recorded = _interactions.get(_key)
+        if not _recorded:
+            raise CassetteError(f"cassette {_path} has no response for {_method.upper()} {_url} {_payload or ''}")
+
+        with _lock:
+            _interaction = _recorded[min(next_position(_path, _key), len(_recorded) - 1)]
+
+        if _factor:
+            time.sleep(_interaction['elapsed'] * _factor)
+        return _interaction['status_code'], _interaction['body'].encode('utf-8', 'surrogateescape')
+
+    return replay
+
+
+def cassette_transport(_transport):
+    #
+    # Wrap _transport according to the cassette environment variables.
+    # Returns _transport itself when no cassette is configured.
+    #
+    _path = os.environ.get(CASSETTE_ENV)
+    if not _path:
+        return _transport
+
+    _path = os.path.expanduser(_path)
+    _mode = os.environ.get(CASSETTE_MODE_ENV, 'replay').lower()
+    if _mode == 'record':
+        return record_transport(_path, _transport)
+    if _mode == 'replay':
+        return replay_transport(_path)
+    raise CassetteError(f"{CASSETTE_MODE_ENV} must be record or replay, got '{_mode}'")
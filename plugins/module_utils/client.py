@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Python client of the TrafficJam API, for the modules and for harnesses and tools.
+#
+# send_request is the data path of every request the modules make: it sends
+# through the pooled transport of module_utils/transport.py (or a cassette,
+# see module_utils/cassette.py), records the timing returned as
+# trafficjam_requests and decodes the JSON body.
+#
+# TrafficJamClient wraps it for one instance, with an accessor per resource:
+#
+#   client = TrafficJamClient('trafficjam', port=8080)
+#   vrf = client.vrfs.create(name='customer-a', table=1100)
+#   client.physicals.subinterfaces(3).create(vlan_id=100, vrf_id=vrf['id'])
+#   client.loopback.update(description='lab')
+#
+# Accessors return the decoded objects and raise TrafficJamError when the
+# instance answers with an error.  request returns the response dict the
+# modules work with instead.  A client holds no state of its own, so one client
+# may be shared by any number of threads; they share the pooled connections.
+#
+# AsyncTrafficJamClient offers the same accessors as coroutines.  It speaks
+# HTTP/1.1 over asyncio streams with its own pool of keep-alive connections,
+# so thousands of requests can be in flight on one event loop while at most
+# max_connections are open:
+#
+#   async with AsyncTrafficJamClient('trafficjam') as client:
+#       await asyncio.gather(*[client.dummies.create(name=f"d{n}") for n in range(5000)])
+#
+# The asyncio client does not use cassettes or TRAFFICJAM_TRANSPORT.  asyncio is
+# only imported by its methods, it would add a tenth of the startup time of a module.
+#
+
+import json
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+from ansible_collections.wwt.trafficjam.plugins.module_utils.cassette import cassette_transport
+from ansible_collections.wwt.trafficjam.plugins.module_utils.records import (
+    decode_records,
+    records_enabled
+)
+from ansible_collections.wwt.trafficjam.plugins.module_utils.transport import (
+    IDEMPOTENT_METHODS,
+    USER_AGENT,
+    configure_endpoint,
+    last_retries,
+    query_string,
+    select_transport,
+    ssl_context
+)
+
+# Port used when 'port' is not set
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+# Timing of every request sent during this module run, returned as 'trafficjam_requests'.
+# Each entry is [method, url template, host, status_code, elapsed seconds, response bytes, retries].
+_request_log = []
+_request_log_lock = threading.Lock()
+_url_id = re.compile(r'/\d+(?=/|$)')
+
+# The transport requests are sent with, wrapped for recording or replay when a cassette is configured.
+# See module_utils/transport.py and module_utils/cassette.py.
+_transport = None
+_transport_lock = threading.Lock()
+
+
+class TrafficJamError(Exception):
+
+    def __init__(self, method, path, status_code, response):
+        super(TrafficJamError, self).__init__(f"{method.upper()} {path} returned {status_code}: {response}")
+        self.status_code = status_code
+        self.response = response
+
+
+def endpoint_netloc(_host, _port):
+    # IPv6 addresses are bracketed in URLs
+    if ':' in _host:
+        return f"[{_host}]:{_port}"
+    return f"{_host}:{_port}"
+
+
+def get_transport():
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = cassette_transport(select_transport())
+    return _transport
+
+
+def record_request(_method, _url, _status_code, _elapsed, _bytes, _retries=0):
+    # IDs in the path are replaced so requests are grouped per endpoint, e.g. /vrfs/{id}
+    _host, _separator, _path = _url.partition('://')[2].partition('/')
+    _template = _url_id.sub('/{id}', '/' + _path.split('?')[0])
+    with _request_log_lock:
+        _request_log.append([_method.upper(), _template, _host, _status_code, round(_elapsed, 6), _bytes, _retries])
+
+
+def request_metrics():
+    # Return and clear the requests recorded so far
+    with _request_log_lock:
+        _metrics = list(_request_log)
+        del _request_log[:]
+    return _metrics
+
+
+def decode_response(_status_code, _body, _record_type=None):
+    # Objects of a successful response are decoded as records of _record_type when records are enabled, see module_utils/records.py
+    _records = _record_type is not None and 200 <= _status_code <= 299 and records_enabled()
+
+    # Make sure we got a valid response from the webservice
+    try:
+        _responsejson = decode_records(_body, _record_type) if _records else json.loads(_body)
+    except ValueError:
+        _responsejson = None
+
+    # Construct a dictionary to return from the function
+    return {'response': _responsejson, 'status_code': _status_code}
+
+
+def send_request(_method, _url, _payload, _timeout, _record=True, _record_type=None):
+    _started = time.monotonic()
+    try:
+        _status_code, _body = get_transport()(_method, _url, _payload, _timeout)
+    except Exception:
+        # Requests which never got an answer are recorded with status_code 0
+        if _record:
+            record_request(_method, _url, 0, time.monotonic() - _started, 0, last_retries())
+        raise
+
+    if _record:
+        record_request(_method, _url, _status_code, time.monotonic() - _started, len(_body), last_retries())
+    return decode_response(_status_code, _body, _record_type)
+
+
+class Collection(object):
+    # A collection of the API, e.g. vrfs or interfaces/physicals/3/subinterfaces.
+    # Each method returns what the client's call returns: the decoded object, or a coroutine for the asyncio client.
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+
+    def list(self):
+        return self.client.call("get", self.path)
+
+    def get(self, object_id):
+        return self.client.call("get", f"{self.path}/{object_id}")
+
+    def create(self, **fields):
+        return self.client.call("post", self.path, fields)
+
+    def update(self, object_id, **fields):
+        return self.client.call("put", f"{self.path}/{object_id}", fields)
+
+    def delete(self, object_id, **fields):
+        # Physical interfaces are not deleted, the fields given are cleared instead
+        return self.client.call("delete", f"{self.path}/{object_id}", fields or None)
+
+    def subinterfaces(self, parent_id):
+        return Collection(self.client, f"{self.path}/{parent_id}/subinterfaces")
+
+
+class Loopback(object):
+    # The single loopback interface
+
+    def __init__(self, client):
+        self.client = client
+        self.path = "interfaces/loopback"
+
+    def get(self):
+        return self.client.call("get", self.path)
+
+    def update(self, **fields):
+        return self.client.call("put", self.path, fields)
+
+    def clear(self, **fields):
+        return self.client.call("delete", self.path, fields)
+
+
+class BaseClient(object):
+    # Addressing and resource accessors shared by both clients
+
+    def __init__(self, host, port=None, scheme='http', timeout=10, validate_certs=True, unix_socket=None, record_requests=False):
+        self.host = host
+        self.port = str(port or DEFAULT_PORTS[scheme])
+        self.scheme = scheme
+        self.timeout = timeout
+        self.validate_certs = validate_certs
+        self.unix_socket = unix_socket
+        self.record_requests = record_requests
+        self.netloc = endpoint_netloc(host, self.port)
+        self.base_url = f"{scheme}://{self.netloc}/trafficjam/api/"
+
+        self.vrfs = Collection(self, "vrfs")
+        self.interfaces = Collection(self, "interfaces")
+        self.physicals = Collection(self, "interfaces/physicals")
+        self.bridges = Collection(self, "interfaces/bridges")
+        self.dummies = Collection(self, "interfaces/dummies")
+        self.loopback = Loopback(self)
+
+    @classmethod
+    def from_params(cls, _params, **kwargs):
+        # A client of the instance of module parameters
+        return cls(_params['host'], _params['port'], _params['scheme'], _params['timeout'], _params.get('validate_certs', True),
+                   _params.get('unix_socket'), **kwargs)
+
+    def url(self, path):
+        return self.base_url + path
+
+
+class TrafficJamClient(BaseClient):
+
+    def __init__(self, *args, **kwargs):
+        super(TrafficJamClient, self).__init__(*args, **kwargs)
+        configure_endpoint(self.netloc, validate_certs=self.validate_certs, unix_socket=self.unix_socket)
+
+    def request(self, method, path, payload=None, timeout=None, record_type=None, record=True):
+        # Returns the response dict, with the decoded body under 'response' and 'status_code'.  timeout overrides the client's.
+        # record=False leaves the request out of trafficjam_requests even when the client records requests.
+        return send_request(method, self.url(path), payload, timeout or self.timeout, self.record_requests and record, record_type)
+
+    def call(self, method, path, payload=None):
+        _response = self.request(method, path, payload)
+        if not 200 <= _response['status_code'] <= 299:
+            raise TrafficJamError(method, path, _response['status_code'], _response['response'])
+        return _response['response']
+
+
+class AsyncTrafficJamClient(BaseClient):
+
+    # Idle connections kept open
+    MAX_IDLE_CONNECTIONS = 64
+
+    def __init__(self, *args, max_connections=100, **kwargs):
+        super(AsyncTrafficJamClient, self).__init__(*args, **kwargs)
+        self.max_connections = max_connections
+        self._slots = None
+        self._idle = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        _idle, self._idle = self._idle, []
+        for _reader, _writer in _idle:
+            _writer.close()
+
+    async def request(self, method, path, payload=None):
+        # Returns the response dict, with the decoded body under 'response' and 'status_code'
+        _url = self.url(path)
+        _target = urlsplit(_url).path
+        _query = query_string(payload)
+        if _query:
+            _target = f"{_target}?{_query}"
+
+        import asyncio
+
+        # Created on first use, so it belongs to the loop the client is used on
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_connections)
+
+        _started = time.monotonic()
+        try:
+            async with self._slots:
+                _status_code, _body, _retries = await self.exchange(method, _target)
+        except BaseException:
+            if self.record_requests:
+                record_request(method, _url, 0, time.monotonic() - _started, 0)
+            raise
+
+        if self.record_requests:
+            record_request(method, _url, _status_code, time.monotonic() - _started, len(_body), _retries)
+        return decode_response(_status_code, _body)
+
+    async def call(self, method, path, payload=None):
+        _response = await self.request(method, path, payload)
+        if not 200 <= _response['status_code'] <= 299:
+            raise TrafficJamError(method, path, _response['status_code'], _response['response'])
+        return _response['response']
+
+    async def connect(self):
+        import asyncio
+
+        if self.unix_socket:
+            return await asyncio.open_unix_connection(self.unix_socket)
+        if self.scheme == 'https':
+            return await asyncio.open_connection(self.host, int(self.port), ssl=ssl_context(self.validate_certs), server_hostname=self.host)
+        return await asyncio.open_connection(self.host, int(self.port))
+
+    async def exchange(self, _method, _target):
+        # Send one request over an idle connection or a new one.  Returns (status_code, body bytes, retries).
+        import asyncio
+
+        _retries = 0
+        while True:
+            _reused = bool(self._idle)
+            if _reused:
+                _reader, _writer = self._idle.pop()
+                if _reader.at_eof():
+                    # Closed by the server while idle
+                    _writer.close()
+                    continue
+            else:
+                _reader, _writer = await asyncio.wait_for(self.connect(), self.timeout)
+
+            try:
+                _status_code, _body, _keep_alive = await asyncio.wait_for(self.roundtrip(_reader, _writer, _method, _target), self.timeout)
+            except (ConnectionResetError, BrokenPipeError):
+                # The server closed a reused connection, maybe before it got the request, see module_utils/transport.py
+                _writer.close()
+                if _reused and _method.lower() in IDEMPOTENT_METHODS:
+                    _retries += 1
+                    continue
+                raise
+            except BaseException:
+                _writer.close()
+                raise
+
+            if _keep_alive and len(self._idle) < self.MAX_IDLE_CONNECTIONS:
+                self._idle.append((_reader, _writer))
+            else:
+                _writer.close()
+            return _status_code, _body, _retries
+
+    async def roundtrip(self, _reader, _writer, _method, _target):
+        _head = f"{_method.upper()} {_target} HTTP/1.1\r\nHost: {self.netloc}\r\nAccept: application/json\r\nUser-Agent: {USER_AGENT}\r\n"
+        if _method.lower() != "get":
+            _head += "Content-Length: 0\r\n"
+        _writer.write(f"{_head}\r\n".encode('latin-1'))
+        await _writer.drain()
+
+        _status_line = await _reader.readline()
+        if not _status_line:
+            raise ConnectionResetError("connection closed by TrafficJam")
+        _version, _status_code = _status_line.split(None, 2)[:2]
+
+        _headers = {}
+        while True:
+            _line = await _reader.readline()
+            if _line in (b'\r\n', b'\n', b''):
+                break
+            _name, _separator, _value = _line.decode('latin-1').partition(':')
+            _headers[_name.strip().lower()] = _value.strip()
+
+        _keep_alive = _version != b'HTTP/1.0' and _headers.get('connection', '').lower() != 'close'
+        if 'chunked' in _headers.get('transfer-encoding', '').lower():
+            _body = bytearray()
+            while True:
+                _size = int((await _reader.readline()).split(b';')[0], 16)
+                if _size == 0:
+                    while (await _reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                _body += await _reader.readexactly(_size)
+                await _reader.readexactly(2)
+            _body = bytes(_body)
+        elif 'content-length' in _headers:
+            _body = await _reader.readexactly(int(_headers['content-length']))
+        elif int(_status_code) in (204, 304):
+            _body = b''
+        else:
+            # Without a length the body ends with the connection
+            _body = await _reader.read()
+            _keep_alive = False
+
+        return int(_status_code), _body, _keep_alive
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Shared health cache of TrafficJam instances.
+#
+# When a TrafficJam instance cannot be reached, it is marked down in a small
+# file per host:port.  Every task running on the same machine reads it, so
+# for health_ttl seconds the following tasks fail immediately instead of each
+# waiting for the full timeout.
+#
+# Once health_ttl has passed the breaker is half-open: the next task probes
+# the instance with a short TCP connection.  If it connects the mark is
+# removed and the task goes ahead, otherwise the instance stays down for
+# another health_ttl seconds.
+#
+
+import json
+import os
+import re
+import socket
+import ssl
+import tempfile
+import time
+
+from ansible_collections.wwt.trafficjam.plugins.module_utils.transport import (
+    ConnectError,
+    connect_failed
+)
+
+# Longest time spent probing an instance whose mark expired
+PROBE_TIMEOUT = 2
+
+
+def health_directory():
+    # One directory per user, shared by all of their tasks
+    _uid = os.getuid() if hasattr(os, 'getuid') else 'shared'
+    return os.path.join(tempfile.gettempdir(), f"trafficjam-health-{_uid}")
+
+
+def health_path(_host, _port):
+    _name = re.sub(r'[^A-Za-z0-9.-]', '_', f"{_host}-{_port}")
+    return os.path.join(health_directory(), f"{_name}.json")
+
+
+def is_connection_error(_error):
+    #
+    # True when _error shows the instance could not be connected to, which marks it down.
+    #
+    # The transports raise ConnectError when a connection was refused, the name
+    # did not resolve, the host was unreachable or connecting timed out.  Read
+    # timeouts and connection resets come from an instance which is up but
+    # slow, e.g. answering a large query, and TLS errors from one which
+    # answered, so they only fail the task.  A bare timeout cannot be told apart
+    # from a read timeout and does not count either.
+    #
+    if isinstance(_error, ConnectError):
+        return True
+    return connect_failed(_error) and not isinstance(_error, (TimeoutError, ssl.SSLError))
+
+
+def read_mark(_host, _port):
+    try:
+        with open(health_path(_host, _port)) as _file:
+            return json.load(_file)
+    except (OSError, ValueError):
+        return None
+
+
+def mark_down(_host, _port, _error):
+    _mark = dict(down_since=time.time(), error=str(_error))
+
+    # Keep the time the instance first went down across failed probes
+    _previous = read_mark(_host, _port)
+    if _previous is not None:
+        _mark['down_since'] = _previous.get('down_since', _mark['down_since'])
+    _mark['checked'] = time.time()
+
+    try:
+        os.makedirs(health_directory(), exist_ok=True)
+        _fd, _temporary = tempfile.mkstemp(dir=health_directory())
+        with os.fdopen(_fd, 'w') as _file:
+            json.dump(_mark, _file)
+        os.replace(_temporary, health_path(_host, _port))
+    except OSError:
+        # The cache only saves time, a task must not fail because of it
+        pass
+
+
+def mark_up(_host, _port):
+    try:
+        os.remove(health_path(_host, _port))
+    except OSError:
+        pass
+
+
+def probe(_params):
+    _timeout = min(_params['timeout'], PROBE_TIMEOUT)
+    try:
+        if _params.get('unix_socket'):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as _socket:
+                _socket.settimeout(_timeout)
+                _socket.connect(_params['unix_socket'])
+        else:
+            socket.create_connection((_params['host'], int(_params['port'])), timeout=_timeout).close()
+        return None
+    except OSError as _error:
+        return _error
+
+
+def check_health(_params):
+    #
+    # Returns an error message while the instance of _params is marked down, otherwise None.
+    # Probes the instance once the mark is older than health_ttl.
+    #
+    _ttl = _params.get('health_ttl')
+    if not _ttl:
+        return None
+
+    _host, _port = _params['host'], _params['port']
+    _mark = read_mark(_host, _port)
+    if _mark is None:
+        return None
+
+    _age = time.time() - _mark.get('checked', 0)
+    if _age >= _ttl:
+        _error = probe(_params)
+        if _error is None:
+            mark_up(_host, _port)
+            return None
+        mark_down(_host, _port, _error)
+        _mark = read_mark(_host, _port) or _mark
+        _age = 0
+
+    _since = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(_mark.get('down_since', 0)))
+    return (f"TrafficJam at {_host}:{_port} is marked down since {_since} ({_mark.get('error')}), "
+            f"not retrying for another {int(_ttl - _age)}s")
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Checkpoint journal making large runs resumable.
+#
+# With the journal option set, every write request (POST, PUT and DELETE) is
+# appended to the journal file as pending before it is sent, and as done with
+# its status_code, returned id and response once TrafficJam accepted it.  Each
+# entry of batch which succeeded is appended with its result as well.
+#
+# When a run fails, the journal is kept.  Rerunning the same task skips every
+# batch entry and write request the journal confirms, returning the recorded
+# result instead.  Writes which are only pending may or may not have been
+# applied, so they are not skipped: the entries they belong to run again and
+# check the current state first, like any entry which was never started.
+#
+# The journal is removed once a run succeeds, so the next run starts from
+# the actual state again.  It assumes nothing else changed the objects it
+# confirms between the failed run and the rerun; remove the file to start
+# over.  Use a journal per TrafficJam instance, for example one named after
+# inventory_hostname.
+#
+# The journal is a file of JSON lines:
+#
+#   {"kind": "pending", "key": "<operation key>"}
+#   {"kind": "done", "key": "<operation key>", "id": 12, "status_code": 200, "response": {...}}
+#   {"kind": "entry", "key": "<entry key>", "result": {...}}
+#
+# The key of an operation covers its method, URL and a hash of its payload.
+#
+
+import hashlib
+import json
+import os
+import threading
+
+# The active journal, if any
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def payload_hash(_payload):
+    _encoded = json.dumps(_payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(_encoded).hexdigest()[:16]
+
+
+def operation_key(_method, _url, _payload):
+    return f"{_method.upper()} {_url} {payload_hash(_payload)}"
+
+
+def entry_key(_entry):
+    return payload_hash(_entry)
+
+
+def load_journal(_path):
+    # Returns the confirmed operations and entries of an earlier run
+    _done, _entries = {}, {}
+    try:
+        with open(_path) as _file:
+            for _line in _file:
+                try:
+                    _record = json.loads(_line)
+                except ValueError:
+                    # A line cut short when the run was killed
+                    continue
+                if _record.get('kind') == 'done':
+                    _done.setdefault(_record['key'], []).append(_record)
+                elif _record.get('kind') == 'entry':
+                    _entries[_record['key']] = _record['result']
+    except FileNotFoundError:
+        pass
+    return _done, _entries
+
+
+def open_journal(_path):
+    global _journal
+
+    if not _path or _journal is not None:
+        return
+
+    _done, _entries = load_journal(_path)
+    _directory = os.path.dirname(_path)
+    if _directory:
+        os.makedirs(_directory, exist_ok=True)
+
+    _journal = dict(path=_path, file=open(_path, 'a'), done=_done, entries=_entries, seen={},
+                    skipped_operations=0, skipped_entries=0, recorded=0)
+
+
+def journal_active():
+    return _journal is not None
+
+
+def append(_record):
+    # One write per record, flushed, so a killed run leaves at most its last line incomplete
+    with _journal_lock:
+        _journal['file'].write(json.dumps(_record, default=str) + '\n')
+        _journal['file'].flush()
+        _journal['recorded'] += 1
+
+
+def confirmed_operation(_key):
+    #
+    # Returns the recorded 'done' record when the journal confirms this occurrence of the operation, otherwise None.
+    # An operation made n times by a run is only skipped as often as it was confirmed.
+    #
+    with _journal_lock:
+        _occurrence = _journal['seen'].get(_key, 0)
+        _journal['seen'][_key] = _occurrence + 1
+        _done = _journal['done'].get(_key, [])
+        if _occurrence < len(_done):
+            _journal['skipped_operations'] += 1
+            return _done[_occurrence]
+    return None
+
+
+def record_pending(_key):
+    append(dict(kind='pending', key=_key))
+
+
+def record_done(_key, _status_code, _response):
+    _id = _response.get('id') if isinstance(_response, dict) else None
+    append(dict(kind='done', key=_key, id=_id, status_code=_status_code, response=_response))
+
+
+def confirmed_entry(_key):
+    with _journal_lock:
+        _result = _journal['entries'].get(_key)
+        if _result is not None:
+            _journal['skipped_entries'] += 1
+    return _result
+
+
+def record_entry(_key, _result):
+    append(dict(kind='entry', key=_key, result=_result))
+
+
+def close_journal(_succeeded):
+    #
+    # Close the journal and return its summary, or None when no journal is used.
+    # The file is removed when the run succeeded, otherwise it is kept for the rerun.
+    #
+    global _journal
+
+    if _journal is None:
+        return None
+
+    _journal['file'].close()
+    if _succeeded:
+        try:
+            os.remove(_journal['path'])
+        except OSError:
+            pass
+
+    _summary = dict(path=_journal['path'], kept=not _succeeded, recorded=_journal['recorded'],
+                    skipped_operations=_journal['skipped_operations'], skipped_entries=_journal['skipped_entries'])
+    _journal = None
+    return _summary
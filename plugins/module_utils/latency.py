@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Latency percentiles, shared by trafficjam_churn, the trafficjam callback
+# plugin and tools/load_driver.py.
+#
+# This file imports nothing from the collection, so tools can load it
+# straight from the checkout.
+#
+
+# Percentiles of latency_summary
+PERCENTILES = [50, 90, 99, 99.9]
+
+
+def percentile(_sorted, _percent):
+    # Nearest rank percentile of an already sorted list, 0.0 for an empty one
+    if not _sorted:
+        return 0.0
+    _rank = max(1, int(-(-len(_sorted) * _percent // 100)))
+    return _sorted[min(_rank, len(_sorted)) - 1]
+
+
+def latency_summary(_values, _percentiles=PERCENTILES):
+    # Count, percentiles as p50, p99.9 and so on, and maximum of _values, rounded to microseconds
+    _values = sorted(_values)
+    _summary = {'count': len(_values)}
+    for _percent in _percentiles:
+        _summary[f"p{_percent:g}"] = round(percentile(_values, _percent), 6)
+    _summary['max'] = round(_values[-1], 6) if _values else 0.0
+    return _summary
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Locks shared by every task running on the same machine.
+#
+# A create checks that the object does not exist yet and then POSTs it.  Two
+# forks creating the same object could both pass the check, so the check and
+# the POST run while holding a lock on the object's key, for example
+# 127.0.0.1:80/interfaces/dummies/name=dummy1.  Each key is a file below the
+# temporary directory, locked with flock.  The lock is released when the file
+# is closed, also when the process holding it dies.
+#
+# Threads of the same module run take their own file handle and so exclude
+# each other as well.  Without fcntl, as on Windows, locking is a no-op.
+#
+
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+
+def lock_directory():
+    # One directory per user, shared by all of their tasks
+    _uid = os.getuid() if hasattr(os, 'getuid') else 'shared'
+    return os.path.join(tempfile.gettempdir(), f"trafficjam-locks-{_uid}")
+
+
+def lock_path(_key):
+    return os.path.join(lock_directory(), hashlib.sha1(_key.encode('utf-8')).hexdigest() + '.lock')
+
+
+@contextmanager
+def object_locks(_keys):
+    #
+    # Hold the lock of every key in _keys.
+    # Keys are locked in sorted order, so tasks locking overlapping keys cannot deadlock.
+    #
+    _files = []
+    try:
+        if HAS_FCNTL:
+            os.makedirs(lock_directory(), exist_ok=True)
+            for _key in sorted(set(_keys)):
+                _file = open(lock_path(_key), 'a')
+                _files.append(_file)
+                fcntl.flock(_file, fcntl.LOCK_EX)
+        yield
+    finally:
+        for _file in reversed(_files):
+            _file.close()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Kinds of objects described by rows, as read by trafficjam_import and
+# compared by trafficjam_audit.
+#
+# A row holds the fields of one object, e.g. a subinterface:
+#
+#   {"physical_id": 3, "vlan_id": 100, "description": "Customer A"}
+#
+# The object lives in the collection named by its kind's path, filled in
+# from the row, and is identified within it by its key field.  Rows come from
+# CSV or JSON-lines files, read one at a time, or from lists.
+#
+# Objects are compared through fingerprints: a tuple of the normalized values
+# of the fields a module would send in its payload.  Desired and live objects
+# are joined on their identity through dicts, so comparing n objects costs n
+# lookups rather than n scans.
+#
+
+import csv
+import json
+
+from ansible_collections.wwt.trafficjam.plugins.module_utils.records import record_type
+from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import (
+    api_url,
+    make_request,
+    process_response,
+    query_subinterfaces,
+    send_request
+)
+from ansible_collections.wwt.trafficjam.plugins.module_utils.validation import (
+    compile_constraints,
+    validate_configs
+)
+
+# Fields of the rows of each kind.
+# path is the collection the objects are created in, named after the parent
+# field for subinterfaces.  key identifies an existing object within it and
+# updates are the fields a PUT may change.
+KINDS = {
+    'vrfs': dict(
+        path="vrfs",
+        parent=None,
+        key='name',
+        fields=['name', 'table'],
+        updates=[]
+    ),
+    'dummies': dict(
+        path="interfaces/dummies",
+        parent=None,
+        key='name',
+        fields=['name', 'description', 'vrf_id', 'v4_address', 'v6_address'],
+        updates=['description', 'vrf_id', 'v4_address', 'v6_address']
+    ),
+    'physical_subinterfaces': dict(
+        path="interfaces/physicals/{physical_id}/subinterfaces",
+        parent='physical_id',
+        key='vlan_id',
+        fields=['physical_id', 'vlan_id', 'description', 'v4_address', 'v6_address', 'vrf_id', 'bridge_id'],
+        updates=['description', 'v4_address', 'v6_address', 'vrf_id', 'bridge_id']
+    ),
+    'bridge_subinterfaces': dict(
+        path="interfaces/bridges/{bridge_id}/subinterfaces",
+        parent='bridge_id',
+        key='vlan_id',
+        fields=['bridge_id', 'vlan_id', 'description', 'vrf_id', 'v4_address', 'v6_address'],
+        updates=['description', 'vrf_id', 'v4_address', 'v6_address']
+    )
+}
+
+INTEGER_FIELDS = ['table', 'vrf_id', 'bridge_id', 'physical_id', 'vlan_id']
+
+# Constraints on the rows of each kind, validated by module_utils.validation
+CONSTRAINTS = {
+    'vrfs': compile_constraints([dict(required_one_of=[['name']])]),
+    'dummies': compile_constraints([dict(required_one_of=[['name']])]),
+    'physical_subinterfaces': compile_constraints([dict(required_one_of=[['physical_id', 'vlan_id']])]),
+    'bridge_subinterfaces': compile_constraints([dict(required_one_of=[['bridge_id', 'vlan_id']])])
+}
+
+
+def payload_fields(_kind):
+    # The fields sent when creating an object, everything but the parent named in the path
+    return [_field for _field in KINDS[_kind]['fields'] if _field != KINDS[_kind]['parent']]
+
+
+def object_path(_kind, _object):
+    return KINDS[_kind]['path'].format(**_object)
+
+
+def object_identity(_kind, _object):
+    # Identifies an object across desired and live state: its collection and its key
+    return object_path(_kind, _object), normalize(KINDS[_kind]['key'], _object.get(KINDS[_kind]['key']))
+
+
+def identity_function(_kind):
+    # object_identity for many objects of _kind, with the path split around its parent field once rather than formatted per object
+    _key = KINDS[_kind]['key']
+    _parent = KINDS[_kind]['parent']
+    _path = KINDS[_kind]['path']
+    if _parent is None:
+        return lambda _object: (_path, normalize(_key, _object.get(_key)))
+
+    _prefix, _suffix = _path.split('{' + _parent + '}')
+    return lambda _object: (f"{_prefix}{_object.get(_parent)}{_suffix}", normalize(_key, _object.get(_key)))
+
+
+def source_format(_path, _format=None):
+    if _format is not None:
+        return _format
+    return 'csv' if _path.lower().endswith('.csv') else 'jsonl'
+
+
+def read_rows(_path, _format, _kind):
+    #
+    # Yield (line, row, error) for every row of the file at _path, one at a time.
+    # row is a dict of the raw values, or None with error set when the line cannot be parsed.
+    #
+    _fields = KINDS[_kind]['fields']
+
+    # utf-8-sig skips the byte order mark spreadsheet exports often start with
+    with open(_path, newline='', encoding='utf-8-sig') as _file:
+        if source_format(_path, _format) == 'csv':
+            _reader = csv.DictReader(_file)
+            _unknown = [_column for _column in _reader.fieldnames or [] if _column not in _fields]
+            if _unknown:
+                raise ValueError(f"unknown column(s) in {_path}: {', '.join(_unknown)}")
+            for _row in _reader:
+                if None in _row:
+                    yield _reader.line_num, None, "more values than columns"
+                else:
+                    yield _reader.line_num, _row, None
+            return
+
+        for _line, _text in enumerate(_file, 1):
+            if not _text.strip():
+                continue
+            try:
+                _row = json.loads(_text)
+            except ValueError as _error:
+                yield _line, None, f"invalid JSON: {_error}"
+                continue
+            if not isinstance(_row, dict):
+                yield _line, None, "expected a JSON object"
+                continue
+            yield _line, _row, None
+
+
+def list_rows(_objects):
+    # Rows of a list, numbered from 1 like the lines of a file
+    for _line, _row in enumerate(_objects, 1):
+        if isinstance(_row, dict):
+            yield _line, _row, None
+        else:
+            yield _line, None, "expected a dict"
+
+
+def parse_row(_kind, _row):
+    # Returns the row with a typed value for every field of _kind, and an error message or None
+    _unknown = sorted(str(_field) for _field in _row if _field not in KINDS[_kind]['fields'])
+    if _unknown:
+        return None, f"unknown field(s): {', '.join(_unknown)}"
+
+    _parsed = {}
+    for _field in KINDS[_kind]['fields']:
+        _value = _row.get(_field)
+        if isinstance(_value, str):
+            _value = _value.strip() or None
+        if _value is not None and _field in INTEGER_FIELDS:
+            try:
+                _value = int(_value)
+            except (TypeError, ValueError):
+                return None, f"{_field} must be an integer, got '{_value}'"
+        elif _value is not None:
+            _value = str(_value)
+        _parsed[_field] = _value
+
+    if _parsed.get('vlan_id') is not None and not 1 <= _parsed['vlan_id'] <= 4094:
+        return None, f"vlan_id must be between 1 and 4094, got {_parsed['vlan_id']}"
+    return _parsed, None
+
+
+def validate_rows(_kind, _rows):
+    #
+    # Parse and validate rows as yielded by read_rows, one at a time.
+    # Yields (line, row, error) with the parsed row, or None and the error when the row is invalid.
+    # A row repeating the identity of an earlier row is invalid as well.
+    #
+    _identity_of = identity_function(_kind)
+    _seen = {}
+    for _line, _row, _error in _rows:
+        if _error is None:
+            _row, _error = parse_row(_kind, _row)
+        if _error is None:
+            _missing = validate_configs(CONSTRAINTS[_kind], {}, [_row])
+            if _missing:
+                _error = _missing[0][1]
+        if _error is None:
+            _identity = _identity_of(_row)
+            if _identity in _seen:
+                _error = f"duplicate of line {_seen[_identity]}"
+            else:
+                _seen[_identity] = _line
+        yield _line, (_row if _error is None else None), _error
+
+
+def normalize(_field, _value):
+    # Live values compared like the parsed rows, TrafficJam may return integers as strings
+    if _value is None:
+        return None
+    if _field in INTEGER_FIELDS:
+        try:
+            return int(_value)
+        except (TypeError, ValueError):
+            return _value
+    return str(_value)
+
+
+def fingerprint(_object, _fields):
+    #
+    # Tuple of the normalized values of _fields, equal only for objects which agree on all of them.
+    # The tuple itself is compared rather than its hash, hashes of different values may collide.
+    #
+    return tuple(normalize(_field, _object.get(_field)) for _field in _fields)
+
+
+def fetch_objects(_params, _kind, _parent_ids=None, _fresh=False, _skip_missing=False):
+    #
+    # Fetch every live object of _kind with one request per collection, or only
+    # the subinterfaces of _parent_ids.  _fresh sends the requests even within a batch.
+    # _skip_missing counts parents which do not exist as having no subinterfaces, see query_subinterfaces.
+    # Objects are records when records are enabled, see module_utils/records.py, and subinterfaces carry their parent field.
+    # Returns the list of objects, or None and an error message.
+    #
+    if KINDS[_kind]['parent'] is not None:
+        _parents_path = KINDS[_kind]['path'].partition('/{')[0]
+        _response = query_subinterfaces(_params, _parents_path, _parent_ids, KINDS[_kind]['parent'], _fresh, _skip_missing)
+        if 'msg' in _response:
+            return None, _response['msg']
+        return _response['response'], None
+
+    _get = send_request if _fresh else make_request
+    _response = _get("get", api_url(_params, KINDS[_kind]['path']), None, _params['timeout'], _record_type=record_type(KINDS[_kind]['path']))
+    if not process_response(_response) or not isinstance(_response['response'], list):
+        return None, f"unable to fetch {KINDS[_kind]['path']}"
+    return _response['response'], None
+
+
+def compare_objects(_kind, _desired, _live):
+    #
+    # Hash join desired rows with live objects of _kind on their identity.
+    #
+    # _desired yields (line, row) tuples of validated rows, _live yields objects.
+    # Only the payload fields set in a desired row are compared; fields it leaves
+    # unset are not managed.  The fields which differ are only worked out for
+    # objects whose fingerprints differ.
+    #
+    # Yields ('in_sync' | 'differing' | 'missing' | 'unexpected', entry) with
+    # the identity, id, line and differing fields of each object.
+    #
+    _fields = payload_fields(_kind)
+    _identity_of = identity_function(_kind)
+
+    _index = {}
+    for _line, _row in _desired:
+        _compared = tuple(_field for _field in _fields if _row[_field] is not None)
+        _index[_identity_of(_row)] = (_line, _row, _compared, fingerprint(_row, _compared))
+
+    for _object in _live:
+        _identity = _identity_of(_object)
+        _match = _index.pop(_identity, None)
+        if _match is None:
+            yield 'unexpected', dict(path=_identity[0], key=_identity[1], id=_object.get('id'))
+            continue
+
+        _line, _row, _compared, _fingerprint = _match
+        if fingerprint(_object, _compared) == _fingerprint:
+            yield 'in_sync', dict(path=_identity[0], key=_identity[1], id=_object.get('id'), line=_line)
+            continue
+
+        _differences = dict((_field, dict(desired=_row[_field], live=_object.get(_field))) for _field in _compared
+                            if normalize(_field, _object.get(_field)) != _row[_field])
+        yield 'differing', dict(path=_identity[0], key=_identity[1], id=_object.get('id'), line=_line, fields=_differences)
+
+    # Whatever is left was not found live
+    for _identity, (_line, _row, _compared, _fingerprint) in _index.items():
+        yield 'missing', dict(path=_identity[0], key=_identity[1], line=_line)
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Offline planning of a topology change, without starting Ansible.
+#
+# A topology file lists the desired objects of each kind, as rows like those of
+# trafficjam_import (see module_utils/objects.py), in YAML or JSON:
+#
+#   vrfs:
+#     - {name: customer-a, table: 1100}
+#   physical_subinterfaces:
+#     - {physical_id: 3, vlan_id: 100, description: Customer A, vrf_id: 2}
+#
+# It is compared with a live instance, or with a state file saved from one
+# earlier, and the requests which would bring the instance in line are printed
+# in dependency waves with an estimate of how long they take:
+#
+#   cd ~/.ansible/collections
+#   python -m ansible_collections.wwt.trafficjam.plugins.module_utils.plan topology.yml --host trafficjam --save-state lab.json
+#   python -m ansible_collections.wwt.trafficjam.plugins.module_utils.plan topology.yml --state lab.json --detailed-exitcode
+#
+# Only the kinds listed in the topology are planned.  Live objects missing from
+# the topology are deleted with --prune only.  A pruned VRF which objects of
+# the planned kinds stay bound to is reported as a conflict instead; objects of
+# other kinds are not fetched and not seen.  New VRFs without a table are given
+# one from --vrf-table-range, as the modules do.  Every request of a wave can be
+# sent concurrently once the previous waves completed: objects leave a VRF
+# before it is deleted, and a deleted VRF frees its table before a new VRF takes
+# it.  The waves are ordered by deletion_waves, as for trafficjam_purge.
+#
+# The exit status is 1 when the plan cannot be made, e.g. for an invalid row.
+# With --detailed-exitcode it is 2 when the plan has requests and 0 otherwise.
+#
+
+import argparse
+import json
+import sys
+import time
+
+from ansible_collections.wwt.trafficjam.plugins.module_utils.objects import (
+    KINDS,
+    compare_objects,
+    fetch_objects,
+    list_rows,
+    normalize,
+    payload_fields,
+    validate_rows
+)
+from ansible_collections.wwt.trafficjam.plugins.module_utils.records import plain
+from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import (
+    DEFAULT_PORTS,
+    allocate_tables,
+    deletion_waves,
+    endpoint_netloc,
+    instance_client,
+    request_metrics,
+    run_concurrently
+)
+
+# Seconds per request assumed by the estimate when no live instance was measured
+DEFAULT_LATENCY = 0.05
+
+# Routing Tables allocated to new VRFs without a table, as the default vrf_table_range of the modules
+DEFAULT_TABLE_RANGE = [1000, 65535]
+
+
+def load_file(_path):
+    # YAML is only parsed when the file is not JSON, so JSON topologies never import yaml
+    with open(_path, encoding='utf-8') as _file:
+        _text = _file.read()
+    try:
+        return json.loads(_text)
+    except ValueError:
+        pass
+
+    import yaml
+    _loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return yaml.load(_text, Loader=_loader)
+
+
+def load_topology(_path):
+    #
+    # Returns the valid rows of every kind of the topology as lists of (line, row), and the errors found.
+    #
+    _topology = load_file(_path)
+    if not isinstance(_topology, dict):
+        return {}, [f"{_path}: expected a mapping of kinds to lists of objects"]
+
+    _desired, _errors = {}, []
+    for _kind, _objects in _topology.items():
+        if _kind not in KINDS:
+            _errors.append(f"{_path}: unknown kind {_kind}, expected {', '.join(KINDS)}")
+            continue
+        if not isinstance(_objects, list):
+            _errors.append(f"{_path}: {_kind} must be a list")
+            continue
+        _desired[_kind] = []
+        for _line, _row, _error in validate_rows(_kind, list_rows(_objects)):
+            if _error is not None:
+                _errors.append(f"{_path}: {_kind} item {_line}: {_error}")
+            else:
+                _desired[_kind].append((_line, _row))
+    return _desired, _errors
+
+
+def fetch_state(_params, _kinds):
+    # Fetch the live objects of every kind concurrently.  Returns them per kind, and the errors found.
+    instance_client(_params)
+    _fetched = run_concurrently(lambda _kind: fetch_objects(_params, _kind), _kinds, _params['max_workers'])
+
+    _state, _errors = {}, []
+    for _kind, (_objects, _error) in zip(_kinds, _fetched):
+        if _objects is None:
+            _errors.append(_error)
+        else:
+            _state[_kind] = _objects
+    return _state, _errors
+
+
+def measured_latency():
+    # Mean seconds of the requests made so far, or None when none were made
+    _elapsed = [_request[4] for _request in request_metrics()]
+    if not _elapsed:
+        return None
+    return sum(_elapsed) / len(_elapsed)
+
+
+def build_plan(_desired, _state, _prune, _table_range=DEFAULT_TABLE_RANGE):
+    #
+    # Compare the desired rows with the live objects of each kind.
+    #
+    # Returns the requests keyed by "METHOD path", with the key of the object
+    # for creates as they all go to the collection's path, each listing under
+    # depends_on the requests which must complete before it, and the conflicts:
+    # desired fields which TrafficJam does not allow to change, VRFs pruned
+    # while objects stay bound to them and VRFs left without a free table.
+    #
+    _requests, _conflicts = {}, []
+
+    def add(_method, _path, _payload, _kind, _line=None, _key=None):
+        _request_key = f"{_method} {_path}" if _key is None else f"{_method} {_path} {_key}"
+        _requests[_request_key] = dict(method=_method, path=_path, payload=_payload, kind=_kind, line=_line, depends_on=[])
+        return _request_key
+
+    # VRF IDs an object leaves, by the request moving or deleting it, to order them before the VRF is deleted
+    _leaving = {}
+    _live_vrfs = {}
+
+    # Objects still bound to each VRF ID once the plan ran, as (kind, path, key, line)
+    _bound = {}
+
+    def bind(_vrf_id, _kind, _entry):
+        if _vrf_id is not None:
+            _bound.setdefault(normalize('vrf_id', _vrf_id), []).append((_kind, _entry['path'], _entry['key'], _entry.get('line')))
+
+    for _kind, _rows in _desired.items():
+        _live = _state.get(_kind, [])
+        _by_id = dict((_object.get('id'), _object) for _object in _live)
+        _lines = dict(_rows)
+        _updates = KINDS[_kind]['updates']
+
+        for _status, _entry in compare_objects(_kind, _rows, _live):
+            if _status == 'missing':
+                _row = _lines[_entry['line']]
+                _payload = dict((_field, _row[_field]) for _field in payload_fields(_kind) if _row[_field] is not None)
+                add('POST', _entry['path'], _payload, _kind, _entry['line'], _entry['key'])
+                bind(_row.get('vrf_id'), _kind, _entry)
+            elif _status == 'in_sync' or (_status == 'unexpected' and not _prune):
+                bind(_by_id[_entry['id']].get('vrf_id'), _kind, _entry)
+            elif _status == 'differing':
+                _fixed = sorted(_field for _field in _entry['fields'] if _field not in _updates)
+                if _fixed:
+                    _conflicts.append(dict(kind=_kind, path=_entry['path'], key=_entry['key'], line=_entry['line'],
+                                           msg=f"{', '.join(_fixed)} cannot be changed"))
+                    bind(_by_id[_entry['id']].get('vrf_id'), _kind, _entry)
+                    continue
+                _payload = dict((_field, _values['desired']) for _field, _values in _entry['fields'].items())
+                _key = add('PUT', f"{_entry['path']}/{_entry['id']}", _payload, _kind, _entry['line'])
+                if 'vrf_id' in _payload and _by_id[_entry['id']].get('vrf_id') is not None:
+                    _leaving.setdefault(normalize('vrf_id', _by_id[_entry['id']]['vrf_id']), []).append(_key)
+                bind(_payload['vrf_id'] if 'vrf_id' in _payload else _by_id[_entry['id']].get('vrf_id'), _kind, _entry)
+            elif _status == 'unexpected':
+                _key = add('DELETE', f"{_entry['path']}/{_entry['id']}", None, _kind)
+                if _kind == 'vrfs':
+                    _live_vrfs[normalize('vrf_id', _entry['id'])] = (_key, _entry['key'])
+                elif _by_id[_entry['id']].get('vrf_id') is not None:
+                    _leaving.setdefault(normalize('vrf_id', _by_id[_entry['id']]['vrf_id']), []).append(_key)
+
+    # A VRF which objects stay bound to cannot be deleted
+    for _vrf_id, (_key, _name) in list(_live_vrfs.items()):
+        if _vrf_id in _bound:
+            _users = ', '.join(f"{_path} {_object_key}" for _kind, _path, _object_key, _line in _bound[_vrf_id][:5])
+            _more = f" and {len(_bound[_vrf_id]) - 5} more" if len(_bound[_vrf_id]) > 5 else ''
+            _conflicts.append(dict(kind='vrfs', path='vrfs', key=_name, line=None,
+                                   msg=f"pruned while still bound to {_users}{_more}"))
+            del _requests[_key]
+            del _live_vrfs[_vrf_id]
+
+    # New VRFs without a table get one allocated like the modules do, around the tables in use and those asked for
+    _unallocated = [_key for _key, _request in _requests.items()
+                    if _request['kind'] == 'vrfs' and _request['method'] == 'POST' and _request['payload'].get('table') is None]
+    if _unallocated:
+        _used = list(_state.get('vrfs', [])) + [dict(table=_request['payload'].get('table')) for _request in _requests.values()
+                                                 if _request['kind'] == 'vrfs' and _request['method'] == 'POST']
+        _tables = allocate_tables(_used, len(_unallocated), _table_range)
+        for _key, _table in zip(_unallocated, _tables):
+            _requests[_key]['payload']['table'] = _table
+        for _key in _unallocated[len(_tables):]:
+            _request = _requests.pop(_key)
+            _conflicts.append(dict(kind='vrfs', path=_request['path'], key=_request['payload'].get('name'), line=_request['line'],
+                                   msg="no free routing table left in the VRF table range"))
+
+    # A VRF is deleted once nothing is left in it, and its table is only reused once it is deleted
+    _freed_tables = dict((normalize('table', _object.get('table')), _live_vrfs[normalize('vrf_id', _object['id'])][0])
+                         for _object in _state.get('vrfs', []) if normalize('vrf_id', _object.get('id')) in _live_vrfs)
+    for _key, _request in _requests.items():
+        if _request['kind'] != 'vrfs':
+            continue
+        if _request['method'] == 'DELETE':
+            _request['depends_on'] += _leaving.get(int(_request['path'].rpartition('/')[2]), [])
+        elif _request['method'] == 'POST' and _request['payload'].get('table') in _freed_tables:
+            _request['depends_on'].append(_freed_tables[_request['payload']['table']])
+
+    return _requests, _conflicts
+
+
+def plan_waves(_requests):
+    # deletion_waves puts every node before the nodes it lists, so the waves are reversed to put dependencies first
+    _nodes = dict((_key, dict(depends_on=_request['depends_on'])) for _key, _request in _requests.items())
+    return list(reversed(deletion_waves(_nodes)))
+
+
+def estimate(_waves, _latency, _max_workers):
+    # Every wave takes one round trip per max_workers of its requests
+    return sum(-(-len(_wave) // _max_workers) for _wave in _waves) * _latency
+
+
+def make_plan(_args):
+    #
+    # Returns the plan as a dict, with 'errors' when it could not be made.
+    #
+    _started = time.perf_counter()
+    _desired, _errors = load_topology(_args.topology)
+    if _errors:
+        return dict(errors=_errors)
+
+    _latency = _args.latency
+    if _args.state is not None:
+        _state = load_file(_args.state)
+        if not isinstance(_state, dict):
+            return dict(errors=[f"{_args.state}: expected a mapping of kinds to lists of objects"])
+    else:
+        _port = _args.port or DEFAULT_PORTS[_args.scheme]
+        _params = dict(host=_args.host, port=_port, scheme=_args.scheme, timeout=_args.timeout, max_workers=_args.max_workers,
+                       validate_certs=not _args.insecure, unix_socket=_args.unix_socket)
+        try:
+            _state, _errors = fetch_state(_params, list(_desired))
+        except Exception as _error:
+            return dict(errors=[f"unable to reach TrafficJam at {endpoint_netloc(_args.host, _port)}: {_error}"])
+        if _errors:
+            return dict(errors=_errors)
+        if _latency is None:
+            _latency = measured_latency()
+        if _args.save_state is not None:
+            with open(_args.save_state, 'w', encoding='utf-8') as _file:
+                json.dump(_state, _file, default=plain)
+
+    if _latency is None:
+        _latency = DEFAULT_LATENCY
+
+    _requests, _conflicts = build_plan(_desired, _state, _args.prune, _args.vrf_table_range)
+    _waves = plan_waves(_requests)
+
+    _counts = dict(create=0, update=0, delete=0, conflicts=len(_conflicts))
+    _kinds = {}
+    for _request in _requests.values():
+        _action = dict(POST='create', PUT='update', DELETE='delete')[_request['method']]
+        _counts[_action] += 1
+        _kinds.setdefault(_request['kind'], dict(create=0, update=0, delete=0))[_action] += 1
+
+    return dict(
+        counts=_counts,
+        kinds=_kinds,
+        waves=[[dict(method=_requests[_key]['method'], path=_requests[_key]['path'], payload=_requests[_key]['payload'])
+                for _key in _wave] for _wave in _waves],
+        conflicts=_conflicts,
+        estimated_duration=round(estimate(_waves, _latency, _args.max_workers), 3),
+        latency=round(_latency, 6),
+        max_workers=_args.max_workers,
+        elapsed=round(time.perf_counter() - _started, 3)
+    )
+
+
+def print_plan(_plan, _summary, _output):
+    _counts = _plan['counts']
+    _output.write(f"Plan: {_counts['create']} to create, {_counts['update']} to update, {_counts['delete']} to delete, "
+                  f"{_counts['conflicts']} conflict(s)\n")
+    for _kind, _kind_counts in sorted(_plan['kinds'].items()):
+        _output.write(f"  {_kind}: {_kind_counts['create']} create, {_kind_counts['update']} update, {_kind_counts['delete']} delete\n")
+
+    for _number, _wave in enumerate(_plan['waves'], 1):
+        _output.write(f"\nWave {_number}: {len(_wave)} request(s)\n")
+        if _summary:
+            continue
+        for _request in _wave:
+            _payload = '' if _request['payload'] is None else ' ' + json.dumps(_request['payload'], sort_keys=True)
+            _output.write(f"  {_request['method']:<6} {_request['path']}{_payload}\n")
+
+    if _plan['conflicts']:
+        _output.write("\nConflicts:\n")
+        for _conflict in _plan['conflicts']:
+            _where = f"item {_conflict['line']}" if _conflict['line'] is not None else 'live object'
+            _output.write(f"  {_conflict['kind']} {_where} ({_conflict['path']} {_conflict['key']}): {_conflict['msg']}\n")
+
+    _output.write(f"\nEstimated duration: {_plan['estimated_duration']}s ({len(_plan['waves'])} wave(s), "
+                  f"{_plan['max_workers']} concurrent requests at {_plan['latency'] * 1000:.1f}ms)\n")
+    _output.write(f"Planned in {_plan['elapsed']}s\n")
+
+
+def main(_argv=None):
+    parser = argparse.ArgumentParser(prog='plan', description='Print the requests a TrafficJam topology change makes, without running Ansible.')
+    parser.add_argument('topology', help='YAML or JSON file of desired objects per kind')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--host', help='TrafficJam instance to compare with')
+    source.add_argument('--state', help='JSON file of live objects per kind, as written by --save-state')
+    parser.add_argument('--port', help='defaults to 80, or 443 with --scheme https')
+    parser.add_argument('--scheme', choices=['http', 'https'], default='http')
+    parser.add_argument('--insecure', action='store_true', help='do not verify the TLS certificate')
+    parser.add_argument('--unix-socket', help='reach the instance through a unix domain socket')
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--max-workers', type=int, default=8, help='concurrent requests, for fetching and for the estimate')
+    parser.add_argument('--save-state', help='write the live objects fetched from --host to this file')
+    parser.add_argument('--prune', action='store_true', help='delete live objects of the planned kinds missing from the topology')
+    parser.add_argument('--vrf-table-range', type=int, nargs=2, default=DEFAULT_TABLE_RANGE, metavar=('FIRST', 'LAST'),
+                        help='routing tables allocated to new VRFs without a table, as vrf_table_range of the modules')
+    parser.add_argument('--latency', type=float, help='seconds per request for the estimate, measured from --host by default')
+    parser.add_argument('--summary', action='store_true', help='print the counts of each wave without its requests')
+    parser.add_argument('--json', action='store_true', help='print the plan as JSON')
+    parser.add_argument('--detailed-exitcode', action='store_true', help='exit with 2 when the plan has requests')
+    args = parser.parse_args(_argv)
+
+    if args.max_workers < 1:
+        parser.error('--max-workers must be at least 1')
+    if args.vrf_table_range[0] > args.vrf_table_range[1]:
+        parser.error('--vrf-table-range must be FIRST LAST')
+
+    try:
+        plan = make_plan(args)
+    except (OSError, ValueError) as _error:
+        plan = dict(errors=[str(_error)])
+
+    if 'errors' in plan:
+        for _error in plan['errors']:
+            sys.stderr.write(f"error: {_error}\n")
+        return 1
+
+    if args.json:
+        json.dump(plan, sys.stdout)
+        sys.stdout.write('\n')
+    else:
+        print_plan(plan, args.summary, sys.stdout)
+
+    if args.detailed_exitcode and plan['waves']:
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Opt-in profiling of a module run.
+#
+# Set the environment variable TRAFFICJAM_PROFILE on the task to profile the
+# module with cProfile and tracemalloc.  The value is the directory the
+# profile is written to, or 1/true/yes for the temporary directory:
+#
+#   - wwt.trafficjam.trafficjam_interfaces:
+#       host: trafficjam
+#     environment:
+#       TRAFFICJAM_PROFILE: /tmp/trafficjam-profiles
+#
+# Two files are written per run, <module>-<pid>-<time>.pstats (load it with
+# python -m pstats) and <module>-<pid>-<time>.allocations.txt.  The module
+# result carries their paths and a summary as 'trafficjam_profile', so the
+# files can be collected with the fetch module.
+#
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+PROFILE_ENV = 'TRAFFICJAM_PROFILE'
+
+# Number of functions and allocation sites included in the summary
+PROFILE_TOP = 20
+
+# The active profile, if any
+_session = None
+
+
+def profile_directory():
+    # Returns the directory to write profiles to, or None when profiling is disabled
+    _value = os.environ.get(PROFILE_ENV, '').strip()
+    if _value.lower() in ('', '0', 'false', 'no', 'off'):
+        return None
+    if _value.lower() in ('1', 'true', 'yes', 'on'):
+        return tempfile.gettempdir()
+    return os.path.expanduser(_value)
+
+
+def start_profile(_name):
+    global _session
+
+    _directory = profile_directory()
+    if _directory is None or _session is not None:
+        return
+
+    # The profilers are only imported when needed, to keep the startup of every other run short
+    import cProfile
+    import tracemalloc
+
+    _session = dict(name=_name, directory=_directory, started=time.monotonic(), profiles=[], result=None)
+
+    # cProfile only follows the thread it was enabled in.  Worker threads get
+    # their own profiler, which is merged at the end.  From Python 3.12 a single
+    # profiler already covers every thread and enabling a second one fails.
+    def profile_thread(*_args):
+        sys.setprofile(None)
+        _profile = cProfile.Profile()
+        try:
+            _profile.enable()
+        except ValueError:
+            return
+        _session['profiles'].append(_profile)
+
+    tracemalloc.start(10)
+    _profile = cProfile.Profile()
+    _session['profiles'].append(_profile)
+    threading.setprofile(profile_thread)
+    _profile.enable()
+
+
+def finish_profile():
+    #
+    # Stop profiling, write the profile files and return the summary.
+    # Returns None when profiling is disabled.  Further calls return the same summary.
+    #
+    if _session is None or _session['result'] is not None:
+        return _session and _session['result']
+
+    import pstats
+    import tracemalloc
+
+    threading.setprofile(None)
+    _session['profiles'][0].disable()
+    _elapsed = time.monotonic() - _session['started']
+    _snapshot = tracemalloc.take_snapshot()
+    _current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    _stats = pstats.Stats(_session['profiles'][0])
+    for _profile in _session['profiles'][1:]:
+        _stats.add(_profile)
+
+    _functions = []
+    for (_file, _line, _function), (_primitive, _calls, _total, _cumulative, _callers) in \
+            sorted(_stats.stats.items(), key=lambda _item: _item[1][3], reverse=True)[:PROFILE_TOP]:
+        _functions.append(dict(function=f"{_file}:{_line}({_function})", calls=_calls,
+                               tottime=round(_total, 6), cumtime=round(_cumulative, 6)))
+
+    _allocations = []
+    _statistics = _snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).statistics('lineno')
+    for _statistic in _statistics[:PROFILE_TOP]:
+        _allocations.append(dict(location=str(_statistic.traceback[0]), size=_statistic.size, count=_statistic.count))
+
+    _session['result'] = result = dict(
+        elapsed=round(_elapsed, 6),
+        threads=len(_session['profiles']),
+        memory_current=_current,
+        memory_peak=_peak,
+        functions=_functions,
+        allocations=_allocations
+    )
+
+    # The summary is returned even if the files cannot be written
+    _base = os.path.join(_session['directory'], f"{_session['name']}-{os.getpid()}-{int(time.time())}")
+    try:
+        os.makedirs(_session['directory'], exist_ok=True)
+        _stats.dump_stats(f"{_base}.pstats")
+        with open(f"{_base}.allocations.txt", 'w') as _file:
+            _file.write(f"peak {_peak} bytes, current {_current} bytes\n\n")
+            for _statistic in _statistics[:100]:
+                _file.write(f"{_statistic}\n")
+        result['pstats'] = f"{_base}.pstats"
+        result['allocations_file'] = f"{_base}.allocations.txt"
+    except OSError as _error:
+        result['error'] = f"unable to write profile to {_session['directory']}: {_error}"
+
+    return result
+
+
+def run_profiled(_run_module):
+    #
+    # Run a module's run_module() under the profiler when TRAFFICJAM_PROFILE is set.
+    # run_on_hosts adds the summary to the result.  The profile is also written
+    # when the module exits some other way, such as failing validation.
+    #
+    _spec = _run_module.__globals__.get('__spec__')
+    start_profile(_spec.name.rpartition('.')[2] if _spec is not None else 'trafficjam')
+    try:
+        _run_module()
+    finally:
+        finish_profile()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Compact records of TrafficJam objects.
+#
+# A dict per object costs a couple of hundred bytes before any of its values.
+# A record keeps the fields of its type in __slots__ instead, without a
+# per-object dict:
+#
+#   _response = make_request("get", _url, None, _timeout, SubinterfaceRecord)
+#   _response['response'][0]['vlan_id']
+#
+# Records are opt-in: set the environment variable TRAFFICJAM_RECORDS on the
+# task to decode list responses as records.  Without it _record_type is
+# ignored and every response holds plain dicts.  The values of the objects,
+# mostly strings, take most of their memory, and records are built in Python,
+# so tools/records_benchmark.py measures about 20% less memory for 100k
+# subinterfaces at about four times the decode time, plus the conversion back to
+# dicts before exit_json.  That only pays off for very large collections.
+#
+# So only the listings of whole collections pass a record type: the
+# subinterfaces read by query_subinterfaces, for the subinterface queries of
+# trafficjam_physical_interfaces and trafficjam_bridge_interfaces and for
+# trafficjam_churn, and the collections read by fetch_objects, for
+# trafficjam_audit, trafficjam_wait and module_utils/plan.py.  The queries the
+# modules build with generate_url go back to the playbook as they are and
+# always return dicts.
+#
+# decode_records builds the records while the body is parsed, one top-level
+# element at a time, so the dicts of a large list never exist all at once.
+# Only the objects of the list itself become records; objects nested in them
+# stay dicts.  Fields outside the record type are kept under extra, so nothing
+# returned by TrafficJam is lost.  Fields TrafficJam did not return are marked
+# unset rather than set to None.
+#
+# Records read like the dicts they replace through get, [] and in, so code
+# working with objects takes either.  plain converts them back to dicts, which
+# run_on_hosts does for the result right before exit_json.
+#
+
+import json
+import os
+import re
+
+# Environment variable enabling records
+RECORDS_ENV = 'TRAFFICJAM_RECORDS'
+
+# Whitespace allowed between JSON tokens
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# Value of the slots of fields TrafficJam did not return
+_UNSET = object()
+
+
+class Record(object):
+    # Fields of the record type, kept in __slots__ by every subclass
+    FIELDS = ()
+    __slots__ = ('extra',)
+
+    def __init__(self, **fields):
+        for _field in self.FIELDS:
+            setattr(self, _field, _UNSET)
+        self.extra = None
+        for _field, _value in fields.items():
+            self[_field] = _value
+
+    @classmethod
+    def from_dict(cls, _object):
+        _record = cls.__new__(cls)
+        _found = 0
+        for _field in cls.FIELDS:
+            _value = _object.get(_field, _UNSET)
+            setattr(_record, _field, _value)
+            if _value is not _UNSET:
+                _found += 1
+        _record.extra = None
+        if _found < len(_object):
+            _record.extra = dict((_field, _value) for _field, _value in _object.items() if _field not in cls.FIELDS)
+        return _record
+
+    def get(self, _field, _default=None):
+        if _field in self.FIELDS:
+            _value = getattr(self, _field)
+            return _default if _value is _UNSET else _value
+        if self.extra is not None:
+            return self.extra.get(_field, _default)
+        return _default
+
+    def __getitem__(self, _field):
+        _value = self.get(_field, _UNSET)
+        if _value is _UNSET:
+            raise KeyError(_field)
+        return _value
+
+    def __setitem__(self, _field, _value):
+        if _field in self.FIELDS:
+            setattr(self, _field, _value)
+        elif self.extra is None:
+            self.extra = {_field: _value}
+        else:
+            self.extra[_field] = _value
+
+    def __contains__(self, _field):
+        return self.get(_field, _UNSET) is not _UNSET
+
+    def __eq__(self, _other):
+        if isinstance(_other, Record):
+            _other = _other.as_dict()
+        return self.as_dict() == _other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.as_dict()!r})"
+
+    def items(self):
+        return self.as_dict().items()
+
+    def keys(self):
+        return self.as_dict().keys()
+
+    def as_dict(self):
+        _object = {}
+        for _field in self.FIELDS:
+            _value = getattr(self, _field)
+            if _value is not _UNSET:
+                _object[_field] = _value
+        if self.extra is not None:
+            _object.update(self.extra)
+        return _object
+
+    def replace(self, **fields):
+        # A copy with fields changed, e.g. a subinterface annotated with its parent.  Responses may be shared, so they are not changed in place.
+        _record = type(self).__new__(type(self))
+        for _field in self.FIELDS:
+            setattr(_record, _field, getattr(self, _field))
+        _record.extra = dict(self.extra) if self.extra is not None else None
+        for _field, _value in fields.items():
+            _record[_field] = _value
+        return _record
+
+
+class VrfRecord(Record):
+    FIELDS = ('id', 'name', 'table', 'interfaces')
+    __slots__ = FIELDS
+
+
+class PhysicalRecord(Record):
+    FIELDS = ('id', 'name', 'kind', 'description', 'mtu', 'v4_address', 'v6_address', 'vrf_id', 'bridge_id')
+    __slots__ = FIELDS
+
+
+class BridgeRecord(Record):
+    FIELDS = ('id', 'name', 'kind', 'description', 'mtu', 'v4_address', 'v6_address', 'vrf_id')
+    __slots__ = FIELDS
+
+
+class DummyRecord(Record):
+    FIELDS = ('id', 'name', 'kind', 'description', 'v4_address', 'v6_address', 'vrf_id')
+    __slots__ = FIELDS
+
+
+class LoopbackRecord(Record):
+    FIELDS = ('id', 'name', 'kind', 'description', 'v4_address', 'v6_address')
+    __slots__ = FIELDS
+
+
+class SubinterfaceRecord(Record):
+    # physical_id or bridge_id names the parent once a query annotated it
+    FIELDS = ('id', 'vlan_id', 'description', 'v4_address', 'v6_address', 'vrf_id', 'bridge_id', 'physical_id', 'mtu')
+    __slots__ = FIELDS
+
+
+# Record type of the objects of each collection
+RECORD_TYPES = {
+    'vrfs': VrfRecord,
+    'interfaces/physicals': PhysicalRecord,
+    'interfaces/bridges': BridgeRecord,
+    'interfaces/dummies': DummyRecord,
+    'interfaces/loopback': LoopbackRecord,
+    'subinterfaces': SubinterfaceRecord
+}
+
+
+def records_enabled():
+    return os.environ.get(RECORDS_ENV, '').strip().lower() not in ('', '0', 'false', 'no', 'off')
+
+
+def decode_records(_body, _record_type):
+    #
+    # Decode a JSON body, turning a top-level object, or every object of a top-level list, into a _record_type.
+    # Raises ValueError like json.loads for an invalid body.
+    #
+    if isinstance(_body, bytes):
+        _body = _body.decode('utf-8')
+    _decoder = json.JSONDecoder()
+    _index = _WHITESPACE.match(_body).end()
+    if not _body.startswith('[', _index):
+        _value = _decoder.decode(_body)
+        return _record_type.from_dict(_value) if isinstance(_value, dict) else _value
+
+    # Each element is parsed and converted before the next one, see the header
+    _records = []
+    _index = _WHITESPACE.match(_body, _index + 1).end()
+    if _body.startswith(']', _index):
+        _index += 1
+    else:
+        while True:
+            _value, _index = _decoder.raw_decode(_body, _index)
+            _records.append(_record_type.from_dict(_value) if isinstance(_value, dict) else _value)
+            _index = _WHITESPACE.match(_body, _index).end()
+            if _body.startswith(']', _index):
+                _index += 1
+                break
+            if not _body.startswith(',', _index):
+                raise ValueError(f"expected ',' or ']' at position {_index}")
+            _index = _WHITESPACE.match(_body, _index + 1).end()
+
+    if _WHITESPACE.match(_body, _index).end() != len(_body):
+        raise ValueError(f"extra data at position {_index}")
+    return _records
+
+
+def record_type(_path):
+    # Record type of the objects at an API path, e.g. interfaces/physicals/3/subinterfaces.  None for other paths.
+    _segments = _path.strip('/').split('/')
+    if _segments[-1] == 'subinterfaces' or (len(_segments) > 1 and _segments[-2] == 'subinterfaces'):
+        return SubinterfaceRecord
+    if _segments[-1].isdigit():
+        _segments = _segments[:-1]
+    return RECORD_TYPES.get('/'.join(_segments))
+
+
+def with_fields(_object, **fields):
+    # A copy of a record or dict with fields changed
+    if isinstance(_object, Record):
+        return _object.replace(**fields)
+    return dict(_object, **fields)
+
+
+def plain(_value):
+    #
+    # _value with every record converted to a dict, for exit_json and anything else serializing it.
+    # Lists and dicts are converted in place, so a large result which holds no records is not copied.
+    #
+    if isinstance(_value, Record):
+        _value = _value.as_dict()
+    if isinstance(_value, dict):
+        for _key, _item in _value.items():
+            if isinstance(_item, (Record, dict, list)):
+                _value[_key] = plain(_item)
+    elif isinstance(_value, list):
+        for _index, _item in enumerate(_value):
+            if isinstance(_item, (Record, dict, list)):
+                _value[_index] = plain(_item)
+    return _value
@@ -3,49 +3,159 @@
 # Copyright: (c) 2020, World Wide Technology, All Rights Reserved
 # Written By: Nick Thompson (nick.thompson@wwt.com)
 
-try:
-    import requests
-    HAS_REQUESTS = True
-except ImportError:
-    HAS_REQUESTS = False
+import threading
+from urllib.parse import urlsplit
+
+from ansible_collections.wwt.trafficjam.plugins.module_utils.client import (
+    DEFAULT_PORTS,
+    TrafficJamClient,
+    endpoint_netloc,
+    request_metrics
+)
+from ansible_collections.wwt.trafficjam.plugins.module_utils.health import (
+    check_health,
+    is_connection_error,
+    mark_down
+)
+from ansible_collections.wwt.trafficjam.plugins.module_utils.journal import (
+    close_journal,
+    confirmed_entry,
+    confirmed_operation,
+    entry_key,
+    journal_active,
+    open_journal,
+    operation_key,
+    record_done,
+    record_entry,
+    record_pending
+)
+from ansible_collections.wwt.trafficjam.plugins.module_utils.locking import object_locks
+from ansible_collections.wwt.trafficjam.plugins.module_utils.profiling import finish_profile
+from ansible_collections.wwt.trafficjam.plugins.module_utils.records import (
+    SubinterfaceRecord,
+    plain,
+    record_type,
+    with_fields
+)
 
 
 def trafficjam_base_argspec():
-    return dict(host=dict(type='str', required=True),
-                port=dict(type='str', required=False, default='80'),
-                timeout=dict(type='int', default=10))
-
-
-def make_request(_method, _url, _payload, _timeout):
-    # Construct the Request based on the defined method
-    if _method == "get":
-        _response = requests.get(_url, timeout=_timeout)
-    elif _method == "post":
-        _response = requests.post(_url, params=_payload, timeout=_timeout)
-    elif _method == "put":
-        _response = requests.put(_url, params=_payload, timeout=_timeout)
-    elif _method == "delete":
-        _response = requests.delete(_url, params=_payload, timeout=_timeout)
-
-    # Make sure we got a valid response from the webservice
-    try:
-        _responsejson = _response.json()
-    except ValueError:
-        _responsejson = None
+    return dict(host=dict(type='str', required=False),
+                hosts=dict(type='list', elements='str', required=False),
+                port=dict(type='str', required=False),
+                scheme=dict(type='str', choices=['http', 'https'], default='http'),
+                validate_certs=dict(type='bool', default=True),
+                unix_socket=dict(type='path', required=False),
+                timeout=dict(type='int', default=10),
+                max_workers=dict(type='int', default=8),
+                health_ttl=dict(type='int', default=30),
+                journal=dict(type='path', required=False),
+                batch=dict(type='list', elements='dict', required=False))
 
-    # Construct a dictionary to return from the function
-    _response_dict = {'response': _responsejson, 'status_code': _response.status_code}
-    return _response_dict
 
+# While a batch is running, GET requests are shared between its items.
+# Maps a URL to an Event and the response of the first request made for it.
+_shared_reads = None
+_shared_reads_lock = threading.Lock()
 
-def parse_query_return(_json_object, _key, _value):
-    for _dict in _json_object:
-        if _dict[_key] == _value:
-            _result = True
-        else:
-            _result = False
+# TrafficJamClients of the instances contacted by the run, by the base URL of their API
+_clients = {}
+_clients_lock = threading.Lock()
 
-    return _result
+# Path of the API on every instance
+API_PATH = "/trafficjam/api/"
+
+# Routing Tables reserved by the kernel (default, main and local)
+RESERVED_TABLES = [253, 254, 255]
+
+
+def describe_endpoint(_params):
+    # host:port of the instance, with the socket it is reached through
+    _endpoint = endpoint_netloc(_params['host'], _params['port'])
+    if _params.get('unix_socket'):
+        return f"{_endpoint} (unix socket {_params['unix_socket']})"
+    return _endpoint
+
+
+def api_url(_params, _path):
+    # URL of an API path on the TrafficJam instance of _params, e.g. api_url(_params, "vrfs")
+    return f"{_params['scheme']}://{endpoint_netloc(_params['host'], _params['port'])}{API_PATH}{_path}"
+
+
+def instance_client(_params):
+    # The TrafficJamClient of the instance of _params, see module_utils/client.py.  Creating it configures the endpoint's transport.
+    _client = TrafficJamClient.from_params(_params, record_requests=True)
+    with _clients_lock:
+        _clients[_client.base_url] = _client
+    return _client
+
+
+def send_request(_method, _url, _payload, _timeout, _record_type=None, _record=True):
+    #
+    # Send a request through the TrafficJamClient of the instance _url points at.
+    # Unlike make_request it neither shares reads within a batch nor uses the journal,
+    # for callers which need the current state.  _record=False leaves it out of
+    # trafficjam_requests, for callers which send too many to return them all.
+    #
+    _base, _separator, _path = _url.partition(API_PATH)
+    _client = _clients.get(_base + API_PATH)
+    if _client is None:
+        # Instances not set up through _execute_safely, e.g. by a tool, use the default settings
+        _parts = urlsplit(_url)
+        _client = instance_client(dict(host=_parts.hostname, port=_parts.port, scheme=_parts.scheme, timeout=_timeout))
+    return _client.request(_method, _path, _payload, _timeout, _record_type, _record)
+
+
+def make_request(_method, _url, _payload, _timeout, _record_type=None):
+    # GET responses are decoded as records of _record_type when set and records are enabled, see module_utils/records.py
+    if _method == "get" and _shared_reads is not None:
+        return shared_read(_url, _timeout, _record_type)
+
+    if _method != "get" and journal_active():
+        return journaled_request(_method, _url, _payload, _timeout)
+
+    return send_request(_method, _url, _payload, _timeout, _record_type)
+
+
+def journaled_request(_method, _url, _payload, _timeout):
+    # Writes confirmed by the journal of an earlier run are not sent again, see module_utils/journal.py
+    _key = operation_key(_method, _url, _payload)
+    _done = confirmed_operation(_key)
+    if _done is not None:
+        return {'response': _done['response'], 'status_code': _done['status_code']}
+
+    record_pending(_key)
+    _response = send_request(_method, _url, _payload, _timeout)
+    if process_response(_response):
+        record_done(_key, _response['status_code'], _response['response'])
+    return _response
+
+
+def shared_read(_url, _timeout, _record_type=None):
+    # Only the first item to read a URL sends the request, the others wait for its response
+    with _shared_reads_lock:
+        _entry = _shared_reads.get(_url)
+        _owner = _entry is None
+        if _owner:
+            _entry = _shared_reads[_url] = {'event': threading.Event(), 'response': None}
+
+    if _owner:
+        try:
+            _entry['response'] = send_request("get", _url, None, _timeout, _record_type)
+        finally:
+            _entry['event'].set()
+    else:
+        _entry['event'].wait()
+
+    # The first request raised, so every item retries on its own
+    if _entry['response'] is None:
+        return send_request("get", _url, None, _timeout, _record_type)
+    return _entry['response']
+
+
+def parse_query_return(_json_object, _key, _value):
+    # True when any object of the list has _value for _key
+    return any(_dict.get(_key) == _value for _dict in _json_object)
 
 
 def process_response(_response):
@@ -53,3 +163,375 @@ def process_response(_response):
         return True
     else:
         return False
+
+
+def collection_lock_key(_params, _path, _key):
+    # Key of the lock on _key in the collection at _path of the instance, e.g. 127.0.0.1:80/interfaces/dummies/name=dummy1
+    return f"{endpoint_netloc(_params['host'], _params['port'])}/{_path}/{_key}"
+
+
+def collection_locks(_params, _path, _keys):
+    # Locks on keys in the collection at _path of the instance, shared by every task on this machine, see module_utils/locking.py
+    return object_locks([collection_lock_key(_params, _path, _key) for _key in _keys])
+
+
+def create_exclusive(_params, _path, _field, _value, _payload, _exists_msg, _prepare=None, _lock_keys=None):
+    #
+    # Create an object in the collection at _path unless it holds one whose _field is _value already.
+    #
+    # The check and the POST run under a lock on the object's key, see
+    # collection_locks.  The collection is read fresh rather than from the
+    # shared reads of a batch.  _prepare may complete the payload from the
+    # collection it fetched, returning an error message or None.  _lock_keys
+    # replace the object's key, e.g. to lock a whole collection.
+    #
+    # Returns a dict with 'query' (the response of the check), 'response' (of the
+    # POST, None when it was not sent) and 'msg' when the object was not created.
+    #
+    _url = api_url(_params, _path)
+
+    with collection_locks(_params, _path, _lock_keys or [f"{_field}={_value}"]):
+        _query = send_request("get", _url, None, _params['timeout'])
+        if not process_response(_query) or not isinstance(_query['response'], list):
+            return dict(query=_query, response=None, msg=f"unable to fetch {_path}")
+        if parse_query_return(_query['response'], _field, _value):
+            return dict(query=_query, response=None, msg=_exists_msg)
+
+        _error = _prepare(_query['response'], _payload) if _prepare is not None else None
+        if _error is not None:
+            return dict(query=_query, response=None, msg=_error)
+
+        _response = make_request("post", _url, _payload, _params['timeout'])
+
+    if process_response(_response) and isinstance(_response['response'], dict):
+        _kept = reconcile_created(_params, _path, _field, {_value: _response['response'].get('id')})
+        if _value in _kept:
+            return dict(query=_query, response=_response,
+                        msg=f"{_exists_msg}, created concurrently as id {_kept[_value]['id']}; "
+                            f"removed the duplicate id {_response['response'].get('id')}")
+    return dict(query=_query, response=_response, msg=None)
+
+
+def reconcile_created(_params, _path, _field, _created):
+    #
+    # Resolve duplicates of objects just created in the collection at _path.
+    #
+    # Tasks on other machines do not share the locks and may have created the
+    # same object concurrently.  The object with the lowest id is kept: every
+    # creator whose own object is not the oldest removes it again.
+    #
+    # _created maps the _field value of each object created to its id.  Returns
+    # the object kept for each value whose own object was removed as a duplicate.
+    #
+    _created = dict((_value, _id) for _value, _id in _created.items() if _id is not None)
+    if not _created:
+        return {}
+
+    _check = send_request("get", api_url(_params, _path), None, _params['timeout'])
+    if not process_response(_check) or not isinstance(_check['response'], list):
+        return {}
+
+    _oldest = {}
+    for _object in _check['response']:
+        _value = _object.get(_field)
+        if _value in _created and _object.get('id') is not None:
+            if _value not in _oldest or _object['id'] < _oldest[_value]['id']:
+                _oldest[_value] = _object
+
+    _kept = {}
+    for _value, _id in _created.items():
+        if _value in _oldest and _oldest[_value]['id'] < _id:
+            make_request("delete", api_url(_params, f"{_path}/{_id}"), None, _params['timeout'])
+            _kept[_value] = _oldest[_value]
+    return _kept
+
+
+def query_subinterfaces(_params, _parents_path, _parent_ids, _parent_field, _fresh=False, _skip_missing=False):
+    #
+    # Fetch the subinterfaces of several parents, e.g. _parents_path "interfaces/physicals".
+    # _parent_ids None means every parent, which are listed first.
+    # _fresh sends every GET even within a batch, for callers polling for changes.
+    # _skip_missing counts parents which do not exist (404) as having no subinterfaces
+    # rather than as failures, for callers waiting for subinterfaces to be gone.
+    #
+    # The parents are fetched concurrently through max_workers.  Returns a
+    # response dict like make_request, with every subinterface in one flat list
+    # annotated with its parent under _parent_field, and 'msg' when a parent
+    # could not be fetched.  Subinterfaces are SubinterfaceRecords when records
+    # are enabled, see module_utils/records.py, which run_on_hosts converts to
+    # dicts on exit.
+    #
+    _get = send_request if _fresh else make_request
+    if _parent_ids is None:
+        _listing = _get("get", api_url(_params, _parents_path), None, _params['timeout'], _record_type=record_type(_parents_path))
+        if not process_response(_listing) or not isinstance(_listing['response'], list):
+            return dict(_listing, msg=f"unable to fetch {_parents_path}")
+        _parent_ids = [_parent['id'] for _parent in _listing['response'] if _parent.get('id') is not None]
+
+    def fetch(_parent_id):
+        return _get("get", api_url(_params, f"{_parents_path}/{_parent_id}/subinterfaces"), None, _params['timeout'],
+                    _record_type=SubinterfaceRecord)
+
+    _responses = run_concurrently(fetch, _parent_ids, _params['max_workers'])
+
+    _subinterfaces, _failed, _status_code = [], [], 200
+    for _parent_id, _response in zip(_parent_ids, _responses):
+        if _skip_missing and _response['status_code'] == 404:
+            continue
+        if not process_response(_response) or not isinstance(_response['response'], list):
+            # The status_code of the first failure is reported
+            if not _failed:
+                _status_code = _response['status_code']
+            _failed.append(str(_parent_id))
+            continue
+        # Copied, the responses may be shared with other entries of a batch
+        _subinterfaces += [with_fields(_subinterface, **{_parent_field: _parent_id}) for _subinterface in _response['response']]
+
+    _result = dict(response=_subinterfaces, status_code=_status_code)
+    if _failed:
+        _result['msg'] = f"unable to fetch the subinterfaces of {_parents_path} {', '.join(_failed)}"
+    return _result
+
+
+def run_concurrently(_function, _items, _max_workers):
+    # Apply _function to every item through a bounded pool of threads.
+    # Results are returned in the same order as _items.
+    _items = list(_items)
+    if len(_items) <= 1 or _max_workers <= 1:
+        return [_function(_item) for _item in _items]
+
+    # Only imported when needed, most module runs make a single request
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=min(_max_workers, len(_items))) as _executor:
+        return list(_executor.map(_function, _items))
+
+
+def split_host(_host, _port):
+    # Entries in 'hosts' may carry their own port as host:port.
+    # Bare IPv6 addresses must be bracketed to use this form.
+    if _host.startswith('['):
+        _address, _separator, _suffix = _host[1:].partition(']')
+        if _suffix.startswith(':') and _suffix[1:].isdigit():
+            return _address, _suffix[1:]
+        return _address, _port
+
+    if _host.count(':') == 1:
+        _address, _suffix = _host.split(':')
+        if _suffix.isdigit():
+            return _address, _suffix
+
+    return _host, _port
+
+
+def expand_hosts(_params):
+    # Build one copy of the module parameters per TrafficJam instance
+    _host_params = []
+    for _host in _params['hosts']:
+        _copy = dict(_params)
+        _copy['host'], _copy['port'] = split_host(_host, _params['port'])
+        _copy['hosts'] = None
+        _host_params.append(_copy)
+
+    return _host_params
+
+
+def execute_on_hosts(_params, _execute):
+    #
+    # Run _execute against the single 'host', or against every entry of 'hosts'
+    # concurrently, and return the result.
+    #
+    # _execute receives a parameter dictionary and returns a result dictionary.
+    # A result carrying 'msg' is treated as a failure.
+    #
+    if _params['port'] is None:
+        _params = dict(_params, port=DEFAULT_PORTS[_params['scheme']])
+
+    if not _params['hosts']:
+        return _execute_safely(_execute, _params)
+
+    _host_params = expand_hosts(_params)
+    _host_results = run_concurrently(
+        lambda _host: _execute_safely(_execute, _host),
+        _host_params,
+        _params['max_workers']
+    )
+
+    _results = []
+    for _host, _host_result in zip(_host_params, _host_results):
+        _host_result['host'] = _host['host']
+        _host_result['port'] = _host['port']
+        _results.append(_host_result)
+
+    _failed = [f"{_item['host']}:{_item['port']}" for _item in _results if _item.get('failed')]
+
+    result = dict(
+        changed=any(_item.get('changed') for _item in _results),
+        failed=bool(_failed),
+        response='',
+        status_code='',
+        results=_results
+    )
+
+    if _failed:
+        result['msg'] = f"request failed on {len(_failed)} of {len(_results)} hosts: {', '.join(_failed)}"
+    return result
+
+
+def run_on_hosts(module, _execute, _validate=None):
+    #
+    # Run the module request and exit the module.
+    #
+    # When 'batch' is set, every entry is a complete set of module parameters.
+    # _validate receives the parameters of each entry and returns a list of errors.
+    #
+    try:
+        open_journal(module.params['journal'])
+    except OSError as _error:
+        module.fail_json(msg=f"unable to open journal {module.params['journal']}: {_error}")
+    if module.params['batch']:
+        run_batch(module, _execute, _validate)
+
+    # Records are only converted to dicts now, see module_utils/records.py
+    result = plain(execute_on_hosts(module.params, _execute))
+    result['trafficjam_requests'] = request_metrics()
+    add_journal(result, result.get('msg') is None)
+    add_profile(result)
+    if result.get('msg') is not None:
+        module.fail_json(**result)
+    module.exit_json(**result)
+
+
+def run_batch(module, _execute, _validate):
+    #
+    # Run every entry of 'batch' concurrently and exit the module with one result per entry.
+    # Entries are validated against the module's own argument spec first.
+    #
+    global _shared_reads
+
+    def run_entry(_entry):
+        # Entries which succeeded in an earlier run return their recorded result, see module_utils/journal.py
+        _key = entry_key(_entry) if journal_active() else None
+        if _key is not None:
+            _recorded = confirmed_entry(_key)
+            if _recorded is not None:
+                return dict(_recorded, changed=False, journaled=True)
+
+        _validation = module.validator.validate(dict(_entry))
+        if _validation.errors.errors:
+            return dict(changed=False, failed=True, response='', status_code='', msg=_validation.errors.msg)
+
+        _params = _validation.validated_parameters
+        _params['batch'] = None
+
+        _errors = _validate(_params) if _validate is not None else []
+        if _errors:
+            return dict(changed=False, failed=True, response='', status_code='', msg='; '.join(_errors), errors=_errors)
+
+        # Converted before it is journaled, the journal stores plain JSON
+        _result = plain(execute_on_hosts(_params, _execute))
+        if _key is not None and not _result.get('failed'):
+            record_entry(_key, _result)
+        return _result
+
+    _shared_reads = {}
+    try:
+        _results = run_concurrently(run_entry, module.params['batch'], module.params['max_workers'])
+    finally:
+        _shared_reads = None
+
+    result = dict(changed=any(_item.get('changed') for _item in _results), batch_results=_results,
+                  trafficjam_requests=request_metrics())
+    add_journal(result, not any(_item.get('failed') for _item in _results))
+    add_profile(result)
+    module.exit_json(**result)
+
+
+def add_journal(_result, _succeeded):
+    # Close the journal of the run, if any, and report what it skipped
+    _journal = close_journal(_succeeded)
+    if _journal is not None:
+        _result['trafficjam_journal'] = _journal
+
+
+def add_profile(_result):
+    # Attach the profile summary when the run is profiled, see module_utils/profiling.py
+    _profile = finish_profile()
+    if _profile is not None:
+        _result['trafficjam_profile'] = _profile
+
+
+def _execute_safely(_execute, _params):
+    # Instances known to be down fail fast, see module_utils/health.py
+    _down = check_health(_params)
+    if _down is not None:
+        return dict(changed=False, failed=True, response='', status_code='', msg=_down)
+
+    instance_client(_params)
+
+    # Connection errors against one instance must not abort the others
+    try:
+        return _execute(_params)
+    except Exception as _error:
+        if _params['health_ttl'] and is_connection_error(_error):
+            mark_down(_params['host'], _params['port'], _error)
+        return dict(changed=False, failed=True, response='', status_code='',
+                    msg=f"unable to reach TrafficJam at {describe_endpoint(_params)}: {_error}")
+
+
+def deletion_waves(_nodes):
+    #
+    # Order deletions so that nothing is removed while something still depends on it.
+    #
+    # _nodes maps a key to a dictionary with a 'depends_on' list of other keys.
+    # Returns a list of waves (lists of keys).  Every key in a wave can be deleted
+    # concurrently once all of the previous waves have completed.
+    #
+    _dependents = {_key: 0 for _key in _nodes}
+    for _node in _nodes.values():
+        for _parent in _node['depends_on']:
+            if _parent in _dependents:
+                _dependents[_parent] += 1
+
+    _waves = []
+    _ready = sorted(_key for _key, _count in _dependents.items() if _count == 0)
+    while _ready:
+        _waves.append(_ready)
+        _next = []
+        for _key in _ready:
+            for _parent in _nodes[_key]['depends_on']:
+                if _parent in _dependents:
+                    _dependents[_parent] -= 1
+                    if _dependents[_parent] == 0:
+                        _next.append(_parent)
+        _ready = sorted(_next)
+
+    return _waves
+
+
+def allocate_ids(_used, _count, _start, _end):
+    #
+    # Allocate _count free IDs within [_start, _end], lowest first.
+    # The IDs already in use are folded into an integer bitmap so every free ID is
+    # found by bit arithmetic rather than by scanning the used list once per ID.
+    # Returns fewer than _count IDs when the range is exhausted.
+    #
+    _bitmap = 0
+    for _id in _used:
+        if _start <= _id <= _end:
+            _bitmap |= 1 << (_id - _start)
+
+    _free = ~_bitmap & ((1 << (_end - _start + 1)) - 1)
+    _allocated = []
+    while _free and len(_allocated) < _count:
+        _lowest = _free & -_free
+        _allocated.append(_start + _lowest.bit_length() - 1)
+        _free ^= _lowest
+
+    return _allocated
+
+
+def allocate_tables(_vrfs, _count, _table_range):
+    # Allocate free Routing Tables, skipping those used by existing VRFs and the reserved tables
+    _used = [_vrf['table'] for _vrf in _vrfs if _vrf.get('table') is not None] + RESERVED_TABLES
+    return allocate_ids(_used, _count, _table_range[0], _table_range[1])
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Transports sending requests to TrafficJam.
+#
+# A transport is a function taking (method, url, payload, timeout) and
+# returning (status_code, body bytes).  The payload is sent as query
+# parameters, leaving out those which are None.
+#
+# The default transport uses http.client from the standard library, so a
+# module run does not pay for importing requests.  Set TRAFFICJAM_TRANSPORT
+# to requests in the environment of a task to send requests through the
+# requests library instead, which is only imported then.
+#
+# Connections are kept open and reused by every request of a module run.
+# HTTPS connections offer the TLS session of the previous connection to the
+# same endpoint, so only the first one pays for a full handshake.  While that
+# first connection is still waiting for its response, connections opened
+# concurrently wait for its session instead of making full handshakes too.
+#
+# Settings of an endpoint, such as validate_certs, are registered with
+# configure_endpoint before requests are sent to it.  An endpoint with a
+# unix_socket is reached through that local socket instead of TCP, using plain
+# HTTP; the URL still names the host and port, which are sent as Host header.
+#
+# Idle connections the server closed meanwhile are dropped before reuse.  A
+# GET, PUT or DELETE whose reused connection is reset anyway is sent again on
+# another one.  A POST is not, as the server may have created the object before
+# the reset.  last_retries tells how often the latest request of the calling
+# thread was sent again, which client.send_request records with its timing.
+#
+
+import errno
+import http.client
+import os
+import select
+import socket
+import ssl
+import threading
+from urllib.parse import urlencode, urlsplit
+
+TRANSPORT_ENV = 'TRAFFICJAM_TRANSPORT'
+
+USER_AGENT = 'wwt.trafficjam'
+
+# Idle connections kept per endpoint
+MAX_IDLE_CONNECTIONS = 16
+
+# Methods sent again when the server reset a reused connection, see the header
+IDEMPOTENT_METHODS = ('get', 'put', 'delete')
+
+# Maps an endpoint's host:port to its settings
+_endpoints = {}
+
+# Idle connections and the latest TLS session, per (scheme, host:port, validate_certs, unix_socket)
+_idle = {}
+_tls_sessions = {}
+_first_handshakes = {}
+_ssl_contexts = {}
+_pool_lock = threading.Lock()
+
+# Shared by every request when TRAFFICJAM_TRANSPORT is requests
+_requests_session = None
+
+# Retries of the latest request of each thread, see last_retries
+_retries = threading.local()
+
+
+class TransportError(Exception):
+    pass
+
+
+class ConnectError(OSError):
+    # A connection to the instance could not be opened, see connect_failed
+    pass
+
+
+def connect_failed(_error):
+    # True for errors of opening a connection which show the instance cannot be reached: refused, unresolvable, unreachable or timed out
+    return isinstance(_error, (ConnectionRefusedError, FileNotFoundError, TimeoutError, socket.gaierror)) or \
+        getattr(_error, 'errno', None) in (errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EHOSTDOWN)
+
+
+def last_retries():
+    # How often the latest request sent by this thread was sent again, 0 for transports which do not retry
+    return getattr(_retries, 'count', 0)
+
+
+def query_string(_payload):
+    # Encoded like requests encodes params: None values are left out and lists repeat their key
+    return urlencode([(_key, _value) for _key, _value in (_payload or {}).items() if _value is not None], doseq=True)
+
+
+def configure_endpoint(_netloc, **_settings):
+    # _netloc is host:port as it appears in the request URLs
+    _endpoints[_netloc] = _settings
+
+
+def ssl_context(_validate_certs):
+    with _pool_lock:
+        if _validate_certs not in _ssl_contexts:
+            _context = ssl.create_default_context()
+            if not _validate_certs:
+                _context.check_hostname = False
+                _context.verify_mode = ssl.CERT_NONE
+            _ssl_contexts[_validate_certs] = _context
+        return _ssl_contexts[_validate_certs]
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    # HTTP over a unix domain socket, for a TrafficJam instance running on the same machine
+
+    def __init__(self, _path, *args, **kwargs):
+        super(UnixHTTPConnection, self).__init__(*args, **kwargs)
+        self.unix_socket = _path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.settimeout(self.timeout)
+            self.sock.connect(self.unix_socket)
+        except OSError:
+            self.sock.close()
+            self.sock = None
+            raise
+
+
+class ResumingHTTPSConnection(http.client.HTTPSConnection):
+    # Offers the TLS session of an earlier connection to the same endpoint, skipping the full handshake
+
+    def __init__(self, _pool_key, *args, **kwargs):
+        super(ResumingHTTPSConnection, self).__init__(*args, **kwargs)
+        self.pool_key = _pool_key
+        self.first_handshake = None
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        with _pool_lock:
+            _session = _tls_sessions.get(self.pool_key)
+            _pending = _first_handshakes.get(self.pool_key)
+            if _session is None and _pending is None:
+                self.first_handshake = _first_handshakes[self.pool_key] = threading.Event()
+
+        # TLS 1.3 servers send the session after the handshake, so it is only known once a response was read
+        if _session is None and _pending is not None:
+            _pending.wait(self.timeout)
+            with _pool_lock:
+                _session = _tls_sessions.get(self.pool_key)
+
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=self._tunnel_host or self.host, session=_session)
+
+
+def release_handshake(_connection):
+    # Let connections waiting for the session of _connection go ahead
+    _event = getattr(_connection, 'first_handshake', None)
+    if _event is not None:
+        _connection.first_handshake = None
+        with _pool_lock:
+            if _first_handshakes.get(_connection.pool_key) is _event:
+                del _first_handshakes[_connection.pool_key]
+        _event.set()
+
+
+def connection_dropped(_connection):
+    # True when the server closed an idle connection: it has something to read although no request is outstanding
+    if _connection.sock is None:
+        return True
+    try:
+        _poll = select.poll()
+        _poll.register(_connection.sock, select.POLLIN)
+        return bool(_poll.poll(0))
+    except (OSError, ValueError):
+        return True
+
+
+def checkout(_key, _url, _timeout):
+    # Reuse an idle connection to the endpoint, or open a new one.  Returns the connection and whether it was reused.
+    while True:
+        with _pool_lock:
+            _connections = _idle.get(_key)
+            _connection = _connections.pop() if _connections else None
+        if _connection is None or not connection_dropped(_connection):
+            break
+        _connection.close()
+
+    if _connection is not None:
+        _connection.timeout = _timeout
+        if _connection.sock is not None:
+            _connection.sock.settimeout(_timeout)
+        return _connection, True
+
+    if _key[3] is not None:
+        return UnixHTTPConnection(_key[3], _url.hostname, _url.port, timeout=_timeout), False
+    if _url.scheme == 'https':
+        return ResumingHTTPSConnection(_key, _url.hostname, _url.port, timeout=_timeout, context=ssl_context(_key[2])), False
+    return http.client.HTTPConnection(_url.hostname, _url.port, timeout=_timeout), False
+
+
+def checkin(_key, _connection, _response):
+    # Keep the connection for the next request unless the server is closing it
+    if isinstance(_connection.sock, ssl.SSLSocket) and _connection.sock.session is not None:
+        with _pool_lock:
+            _tls_sessions[_key] = _connection.sock.session
+    release_handshake(_connection)
+
+    if _response.will_close:
+        _connection.close()
+        return
+
+    with _pool_lock:
+        _connections = _idle.setdefault(_key, [])
+        if len(_connections) < MAX_IDLE_CONNECTIONS:
+            _connections.append(_connection)
+            return
+    _connection.close()
+
+
+def http_transport(_method, _url, _payload, _timeout):
+    _url = urlsplit(_url)
+    _path = _url.path or '/'
+    _query = '&'.join(_part for _part in [_url.query, query_string(_payload)] if _part)
+    if _query:
+        _path = f"{_path}?{_query}"
+
+    _settings = _endpoints.get(_url.netloc, {})
+    _key = (_url.scheme, _url.netloc, _settings.get('validate_certs', True), _settings.get('unix_socket'))
+
+    _retries.count = 0
+    while True:
+        _connection, _reused = checkout(_key, _url, _timeout)
+        if not _reused:
+            # Connected here rather than by request, so errors of the connection itself can be told apart
+            try:
+                _connection.connect()
+            except OSError as _error:
+                release_handshake(_connection)
+                _connection.close()
+                if not isinstance(_error, ssl.SSLError) and connect_failed(_error):
+                    raise ConnectError(str(_error)) from _error
+                raise
+        try:
+            _connection.request(_method.upper(), _path, headers={'Accept': 'application/json', 'User-Agent': USER_AGENT})
+            _response = _connection.getresponse()
+            _body = _response.read()
+        except (ConnectionResetError, BrokenPipeError):
+            # The server closed a reused connection, maybe before it got the request, see the header
+            release_handshake(_connection)
+            _connection.close()
+            if _reused and _method.lower() in IDEMPOTENT_METHODS:
+                _retries.count += 1
+                continue
+            raise
+        except BaseException:
+            release_handshake(_connection)
+            _connection.close()
+            raise
+
+        checkin(_key, _connection, _response)
+        return _response.status, _body
+
+
+def requests_transport(_method, _url, _payload, _timeout):
+    global _requests_session
+
+    _retries.count = 0
+    try:
+        import requests
+    except ImportError:
+        raise TransportError(f"{TRANSPORT_ENV} is set to requests, but the requests library is not installed")
+
+    # A single session pools the connections of every request
+    with _pool_lock:
+        if _requests_session is None:
+            _requests_session = requests.Session()
+
+    _settings = _endpoints.get(urlsplit(_url).netloc, {})
+    if _settings.get('unix_socket'):
+        raise TransportError(f"unix_socket is not supported when {TRANSPORT_ENV} is set to requests")
+    _verify = _settings.get('validate_certs', True)
+
+    # Construct the Request based on the defined method
+    try:
+        if _method == "get":
+            _response = _requests_session.get(_url, timeout=_timeout, verify=_verify)
+        elif _method == "post":
+            _response = _requests_session.post(_url, params=_payload, timeout=_timeout, verify=_verify)
+        elif _method == "put":
+            _response = _requests_session.put(_url, params=_payload, timeout=_timeout, verify=_verify)
+        elif _method == "delete":
+            _response = _requests_session.delete(_url, params=_payload, timeout=_timeout, verify=_verify)
+    except requests.exceptions.ConnectTimeout as _error:
+        raise ConnectError(str(_error)) from _error
+    except requests.exceptions.ConnectionError as _error:
+        # requests raises ConnectionError for resets of an open connection too, only failures to connect are told apart
+        from urllib3.exceptions import NewConnectionError
+        if isinstance(getattr(_error.args[0] if _error.args else None, 'reason', None), NewConnectionError):
+            raise ConnectError(str(_error)) from _error
+        raise
+
+    return _response.status_code, _response.content
+
+
+TRANSPORTS = {
+    'http': http_transport,
+    'requests': requests_transport
+}
+
+
+def select_transport():
+    _name = os.environ.get(TRANSPORT_ENV, 'http').strip().lower() or 'http'
+    if _name not in TRANSPORTS:
+        raise TransportError(f"{TRANSPORT_ENV} must be one of {', '.join(TRANSPORTS)}, got '{_name}'")
+    return TRANSPORTS[_name]
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Declarative validation of the nested 'config' parameters.
+#
+# The builtin methods for scrubbing parameters do not handle nested dictionaries.
+# Modules describe their rules as a constraint table instead, which is compiled
+# once at import time:
+#
+#   dict(mutually_exclusive=['name', 'bridge_id'])
+#   dict(required_one_of=[['name'], ['bridge_id']], when=dict(state='present', subinterface=False))
+#   dict(required_one_of=[['bridge_id', 'vlan_id'], ['bridge_id', 'subinterface_id']],
+#        when=dict(state='present', subinterface=True), required_by='subinterface')
+#
+# 'when' is matched against the top level module parameters, everything else
+# against the keys of a config.  required_one_of is satisfied when every key of
+# at least one of the groups is set.
+#
+
+
+def _format_required(_groups, _required_by):
+    if all(len(_group) == 1 for _group in _groups):
+        _missing = '|'.join(_group[0] for _group in _groups)
+    else:
+        _missing = ' or '.join('|'.join(_group) for _group in _groups)
+
+    if _required_by:
+        return f"missing parameter(s) required by '{_required_by}': {_missing}"
+    return f"missing parameter(s) required: {_missing}"
+
+
+def compile_constraints(_table):
+    #
+    # Turn a constraint table into a list of (when, check, message) rules.
+    # check receives the set of keys which are set in a config and returns True when it is valid.
+    #
+    _rules = []
+    for _constraint in _table:
+        _when = tuple(sorted(_constraint.get('when', {}).items()))
+
+        if 'mutually_exclusive' in _constraint:
+            _keys = _constraint['mutually_exclusive']
+            for _index, _first in enumerate(_keys):
+                for _second in _keys[_index + 1:]:
+                    _pair = frozenset((_first, _second))
+                    _rules.append((_when, lambda _set, _pair=_pair: not _pair <= _set,
+                                   f"parameter {_first} is mutually exclusive with {_second}"))
+
+        if 'required_one_of' in _constraint:
+            _groups = [frozenset(_group) for _group in _constraint['required_one_of']]
+            _rules.append((_when, lambda _set, _groups=_groups: any(_group <= _set for _group in _groups),
+                           _format_required(_constraint['required_one_of'], _constraint.get('required_by'))))
+
+    return _rules
+
+
+def validate_configs(_rules, _params, _configs):
+    #
+    # Validate a list of configs against compiled rules in a single pass.
+    # Every error is reported, as a list of (index, message) tuples.
+    #
+    _active = [(_check, _message) for _when, _check, _message in _rules
+               if all(_params.get(_key) == _value for _key, _value in _when)]
+
+    _errors = []
+    for _index, _config in enumerate(_configs):
+        _set = {_key for _key, _value in (_config or {}).items() if _value is not None}
+        for _check, _message in _active:
+            if not _check(_set):
+                _errors.append((_index, _message))
+
+    return _errors
+
+
+def validate_params(_rules, _params):
+    # Validate the single 'config' of a module invocation, returning a list of messages
+    return [_message for _index, _message in validate_configs(_rules, _params, [_params.get('config')])]
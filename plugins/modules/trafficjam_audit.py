@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: trafficjam_audit
+
+short_description: This module is used to detect drift between desired objects and the WWT ATC Tool TrafficJam
+
+version_added: "2.9"
+
+description:
+    - "This module is used to compare desired VRFs, dummy interfaces or subinterfaces with the objects held by the WWT ATC Tool TrafficJam"
+    - "The live objects are fetched with one request per collection.  Desired and live objects are joined on their name or
+      parent and vlan_id, and compared through a tuple of the fields the modules send in their payloads, so only objects
+      whose tuples differ are compared field by field."
+    - "Reports the objects which differ, are missing, or exist without being desired.  Nothing is changed."
+    - "Desired objects are given as a list, or as a CSV or JSON-lines file in the format of trafficjam_import."
+
+options:
+    host:
+        description:
+            - Address for TrafficJam instance.  Either host or hosts is required.
+        required: false
+    port:
+        description:
+            - HTTP Port for TrafficJam instance.  Defaults to 80, or 443 when scheme is https.
+        required: false
+    scheme:
+        description:
+            - Scheme used to reach the TrafficJam instance.
+        required: false
+        choices: ['http', 'https']
+        default: http
+    validate_certs:
+        description:
+            - Verify the TLS certificate of the TrafficJam instance when scheme is https.
+            - Only set to false against instances with a self-signed certificate.
+        required: false
+        type: bool
+        default: true
+    unix_socket:
+        description:
+            - Path of a unix domain socket to reach a TrafficJam instance on the same machine through, instead of TCP.
+            - Requests are sent as plain HTTP over the socket.  host and port still identify the instance and are sent as Host header.
+            - Mutually exclusive with hosts.
+        required: false
+        type: path
+    timeout:
+        description:
+            - HTTP Timeout
+        required: false
+        default: 10
+    hosts:
+        description:
+            - List of TrafficJam instances to audit against the same desired objects concurrently.
+            - Entries may include a port as host:port, otherwise port is used.
+            - Mutually exclusive with host.
+        required: false
+    max_workers:
+        description:
+            - Maximum number of concurrent requests when fetching subinterfaces, and of TrafficJam instances contacted concurrently when using hosts
+        required: false
+        default: 8
+    health_ttl:
+        description:
+            - Seconds a TrafficJam instance which could not be reached is marked down.
+              Tasks against it fail immediately while it is marked down, instead of waiting for timeout.
+            - The mark is shared by every task running on the same machine.  Once it expires, the next task probes the instance with a TCP connection.
+            - Set to 0 to disable.
+        required: false
+        default: 30
+    journal:
+        description:
+            - Path of a checkpoint journal making a large run resumable, see module_utils/journal.py.
+            - The audit makes no write requests, so only batch entries are recorded.
+        required: false
+        type: path
+    batch:
+        description:
+            - List of complete parameter sets, one per loop item.
+            - Entries run concurrently up to max_workers and return one result each under batch_results.
+            - GET requests are shared between entries, so every entry sees the state from before the batch started.
+        required: false
+    kind:
+        description:
+            - Type of the desired objects, see the kind option of trafficjam_import for their fields.
+        required: true
+        choices: ['vrfs', 'dummies', 'physical_subinterfaces', 'bridge_subinterfaces']
+    desired:
+        description:
+            - List of desired objects.  Mutually exclusive with src.
+            - Only the fields set on an object are compared, fields left out are not audited.
+        required: false
+        type: list
+        elements: dict
+    src:
+        description:
+            - Path of a CSV or JSON-lines file of desired objects, read one row at a time.  Mutually exclusive with desired.
+            - Relative paths are looked up in the files directory of the role or playbook, like the copy module does.
+            - With remote_src, the path of the file on the managed host.
+        required: false
+        type: path
+    remote_src:
+        description:
+            - Read src on the managed host instead of copying it from the controller.
+        required: false
+        type: bool
+        default: false
+    format:
+        description:
+            - Format of src.  Defaults to csv for files ending in .csv and to jsonl otherwise.
+        required: false
+        choices: ['csv', 'jsonl']
+    report_unexpected:
+        description:
+            - Report live objects which are not desired.  Disable when auditing only part of a collection.
+        required: false
+        type: bool
+        default: true
+    max_report:
+        description:
+            - Maximum number of objects listed under differing, missing, unexpected and invalid each.  The counts always cover every object.
+            - Set to 0 to list all of them.
+        required: false
+        default: 1000
+    fail_on_drift:
+        description:
+            - Fail the task when any object differs, is missing or is unexpected, or when a desired object is invalid.
+        required: false
+        type: bool
+        default: false
+
+notes:
+    - Supports check mode.  The module never changes anything.
+
+author:
+    - Nick Thompson (nick.thompson@wwt.com)
+'''
+
+EXAMPLES = '''
+# Audit the subinterfaces against the IPAM export
+- name: Audit Physical Subinterfaces
+  trafficjam_audit:
+    host: trafficjam
+    src: subinterfaces.csv
+    kind: physical_subinterfaces
+    fail_on_drift: true
+
+# Audit a few VRFs, ignoring every other VRF
+- name: Audit VRFs
+  trafficjam_audit:
+    host: trafficjam
+    kind: vrfs
+    desired:
+      - name: customer-a
+        table: 1100
+      - name: customer-b
+    report_unexpected: false
+  register: audit
+
+- name: Show Drift
+  debug:
+    msg: "{{ audit.counts }}"
+'''
+
+RETURN = '''
+counts:
+    description: Number of desired and live objects, and of objects in_sync, differing, missing, unexpected and invalid
+    type: dict
+    returned: always
+
+drift:
+    description: True when any object differs, is missing or is unexpected
+    type: bool
+    returned: always
+
+differing:
+    description:
+        - Objects whose fields differ, with their path, key, id and line among the desired objects.
+        - fields maps each differing field to its desired and live value.
+    type: list
+    returned: always
+
+missing:
+    description: Desired objects which do not exist, with their path, key and line among the desired objects
+    type: list
+    returned: always
+
+unexpected:
+    description: Live objects which are not desired, with their path, key and id.  Empty when report_unexpected is false.
+    type: list
+    returned: always
+
+invalid:
+    description: Desired objects which could not be validated, with their line and msg
+    type: list
+    returned: always
+
+results:
+    description: Per-instance results when hosts is used.  Each entry carries host, port, failed and the keys above.
+    type: list
+    returned: when hosts is used
+
+batch_results:
+    description: One result per entry of batch, in the same order.  Entries confirmed by the journal of an earlier run carry journaled.
+    type: list
+    returned: when batch is used
+
+trafficjam_requests:
+    description:
+        - Timing of every request made to TrafficJam, for the wwt.trafficjam.trafficjam callback plugin.
+        - Each entry is a list of method, url template, host, status_code, elapsed seconds, response bytes and retries.
+    type: list
+    returned: when TrafficJam was contacted
+
+trafficjam_journal:
+    description:
+        - Summary of the checkpoint journal when journal is set.
+        - Carries its path, whether it was kept for a rerun, the number of records written and the number of
+          write requests and batch entries skipped because an earlier run confirmed them.
+    type: dict
+    returned: when journal is set
+
+trafficjam_profile:
+    description:
+        - Profile summary when the TRAFFICJAM_PROFILE environment variable is set, see module_utils/profiling.py.
+        - Carries elapsed, memory_current, memory_peak, the top functions by cumulative time, the top allocation sites
+          and the paths of the pstats and allocations files written on the managed host.
+    type: dict
+    returned: when profiling is enabled
+'''
+
+import csv
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wwt.trafficjam.plugins.module_utils.objects import (
+    compare_objects,
+    fetch_objects,
+    list_rows,
+    read_rows,
+    validate_rows
+)
+from ansible_collections.wwt.trafficjam.plugins.module_utils.profiling import run_profiled
+from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import (
+    trafficjam_base_argspec,
+    run_on_hosts
+)
+
+
+def desired_rows(_params, _result):
+    # Yield the valid desired objects as (line, row), counting and listing the invalid ones in _result
+    if _params['desired'] is not None:
+        _rows = list_rows(_params['desired'])
+    else:
+        _rows = read_rows(_params['src'], _params['format'], _params['kind'])
+
+    for _line, _row, _error in validate_rows(_params['kind'], _rows):
+        if _error is not None:
+            report(_params, _result, 'invalid', dict(line=_line, msg=_error))
+            continue
+        _result['counts']['desired'] += 1
+        yield _line, _row
+
+
+def report(_params, _result, _status, _entry):
+    _result['counts'][_status] += 1
+    if not _params['max_report'] or len(_result[_status]) < _params['max_report']:
+        _result[_status].append(_entry)
+
+
+def execute(_params):
+    result = dict(
+        changed=False,
+        drift=False,
+        counts=dict(desired=0, live=0, in_sync=0, differing=0, missing=0, unexpected=0, invalid=0),
+        differing=[],
+        missing=[],
+        unexpected=[],
+        invalid=[]
+    )
+
+    live, error = fetch_objects(_params, _params['kind'])
+    if live is None:
+        result['failed'] = True
+        result['msg'] = error
+        return result
+    result['counts']['live'] = len(live)
+
+    try:
+        for status, entry in compare_objects(_params['kind'], desired_rows(_params, result), live):
+            if status == 'in_sync':
+                result['counts']['in_sync'] += 1
+            elif status != 'unexpected' or _params['report_unexpected']:
+                report(_params, result, status, entry)
+    except (OSError, UnicodeDecodeError, ValueError, csv.Error) as _error:
+        result['failed'] = True
+        result['msg'] = f"unable to read {_params['src']}: {_error}"
+        return result
+
+    counts = result['counts']
+    result['drift'] = bool(counts['differing'] or counts['missing'] or counts['unexpected'])
+    result['failed'] = False
+    if _params['fail_on_drift'] and (result['drift'] or counts['invalid']):
+        result['failed'] = True
+        result['msg'] = f"{counts['differing']} differing, {counts['missing']} missing, {counts['unexpected']} unexpected " \
+                        f"and {counts['invalid']} invalid object(s)"
+    return result
+
+
+def run_module():
+    # define available arguments/parameters a user can pass to the module
+    module_args = trafficjam_base_argspec()
+    module_args.update(
+        kind=dict(type='str', required=True, choices=['vrfs', 'dummies', 'physical_subinterfaces', 'bridge_subinterfaces']),
+        desired=dict(type='list', elements='dict', required=False),
+        src=dict(type='path', required=False),
+        remote_src=dict(type='bool', required=False, default=False),
+        format=dict(type='str', required=False, choices=['csv', 'jsonl']),
+        report_unexpected=dict(type='bool', required=False, default=True),
+        max_report=dict(type='int', required=False, default=1000),
+        fail_on_drift=dict(type='bool', required=False, default=False)
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=True,
+        mutually_exclusive=[
+            ['host', 'hosts'],
+            ['hosts', 'unix_socket'],
+            ['desired', 'src']
+        ],
+        required_one_of=[
+            ['host', 'hosts'],
+            ['desired', 'src']
+        ]
+    )
+
+    # Run the audit against every TrafficJam instance and exit the module
+    run_on_hosts(module, execute)
+
+
+def main():
+    run_profiled(run_module)
+
+
+if __name__ == '__main__':
+    main()
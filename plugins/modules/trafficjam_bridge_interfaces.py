@@ -23,18 +23,70 @@ description:
 options:
     host:
         description:
-            - Address for TrafficJam instance
-        required: true
+            - Address for TrafficJam instance.  Either host or hosts is required.
+        required: false
     port:
         description:
-            - HTTP Port for TrafficJam instance
+            - HTTP Port for TrafficJam instance.  Defaults to 80, or 443 when scheme is https.
+        required: false
+    scheme:
+        description:
+            - Scheme used to reach the TrafficJam instance.
+        required: false
+        choices: ['http', 'https']
+        default: http
+    validate_certs:
+        description:
+            - Verify the TLS certificate of the TrafficJam instance when scheme is https.
+            - Only set to false against instances with a self-signed certificate.
+        required: false
+        type: bool
+        default: true
+    unix_socket:
+        description:
+            - Path of a unix domain socket to reach a TrafficJam instance on the same machine through, instead of TCP.
+            - Requests are sent as plain HTTP over the socket.  host and port still identify the instance and are sent as Host header.
+            - Mutually exclusive with hosts.
         required: false
-        default: 80
+        type: path
     timeout:
         description:
             - HTTP Timeout
         required: false
         default: 10
+    hosts:
+        description:
+            - List of TrafficJam instances to apply the same request to concurrently.
+            - Entries may include a port as host:port, otherwise port is used.
+            - Mutually exclusive with host.
+        required: false
+    max_workers:
+        description:
+            - Maximum number of TrafficJam instances contacted concurrently when using hosts
+        required: false
+        default: 8
+    health_ttl:
+        description:
+            - Seconds a TrafficJam instance which could not be reached is marked down.
+              Tasks against it fail immediately while it is marked down, instead of waiting for timeout.
+            - The mark is shared by every task running on the same machine.  Once it expires, the next task probes the instance with a TCP connection.
+            - Set to 0 to disable.
+        required: false
+        default: 30
+    journal:
+        description:
+            - Path of a checkpoint journal making a large run resumable, see module_utils/journal.py.
+            - Write requests and batch entries are recorded once TrafficJam confirmed them.  When the run fails the journal is kept,
+              and rerunning the task skips everything it confirms instead of checking and sending it again.
+            - The journal is removed once a run succeeds.  Use one journal per TrafficJam instance.
+        required: false
+        type: path
+    batch:
+        description:
+            - List of complete parameter sets, one per loop item.  Set by the collection's action plugin when it coalesces a looped task, which the variable trafficjam_coalesce_loops enables.
+            - Entries run concurrently up to max_workers and return one result each under batch_results.
+            - GET requests are shared between entries, so every entry sees the state from before the batch started.
+        required: false
     subinterface:
         description:
             - Enable Subinterface mode
@@ -89,11 +141,22 @@ options:
         description:
             - ID (integer) of the existing bridge interface
         required: false
+    bridge_ids:
+        description:
+            - List of IDs (integers) of existing bridge interfaces, to query the subinterfaces of all of them in one task
+            - With subinterface and state query, leaving out both bridge_id and bridge_ids queries the subinterfaces of every bridge interface
+            - The bridge interfaces are fetched concurrently up to max_workers, and every subinterface returned carries its bridge_id
+        required: false
     vlan_id:
         description:
             - ID (integer) of the existing VLAN
         required: false
 
+notes:
+    - Creates check that the object does not exist and POST it while holding a lock shared by every task on the same machine,
+      so concurrent tasks can create objects at full parallelism without making duplicates.  Duplicates made concurrently from
+      other machines are detected after the POST and resolved by keeping the object with the lowest id.
+
 author:
     - Nick Thompson (nick.thompson@wwt.com)
 '''
@@ -122,6 +185,23 @@ EXAMPLES = '''
     config:
         bridge_id: 10
 
+# Get Information for the Subinterfaces of every Bridge Interface, each carrying its bridge_id
+- name: Get All Bridge Subinterface Information
+  trafficjam_bridge_interfaces:
+    host: trafficjam
+    subinterface: true
+    state: query
+    max_workers: 32
+
+# Get Information for the Subinterfaces of several Bridge Interfaces
+- name: Get Bridge Subinterface Information for several Bridge Interfaces
+  trafficjam_bridge_interfaces:
+    host: trafficjam
+    subinterface: true
+    state: query
+    config:
+        bridge_ids: [10, 11]
+
 # Get Information for a specific Bridge Subinterface
 - name: Get Specific Bridge Subinterface Information
   trafficjam_bridge_interfaces:
@@ -194,82 +274,92 @@ status_code:
     description: The HTTP Status Code returned by TrafficJam
     type: int
     returned: always
+
+results:
+    description: Per-instance results when hosts is used.  Each entry carries host, port, changed, failed, response and status_code.
+    type: list
+    returned: when hosts is used
+
+errors:
+    description: Every validation error found in config
+    type: list
+    returned: on validation failure
+
+batch_results:
+    description: One result per entry of batch, in the same order.  Entries confirmed by the journal of an earlier run carry journaled and report no change.
+    type: list
+    returned: when batch is used
+
+trafficjam_requests:
+    description:
+        - Timing of every request made to TrafficJam, for the wwt.trafficjam.trafficjam callback plugin.
+        - Each entry is a list of method, url template, host, status_code, elapsed seconds, response bytes and retries.
+    type: list
+    returned: when TrafficJam was contacted
+
+trafficjam_journal:
+    description:
+        - Summary of the checkpoint journal when journal is set.
+        - Carries its path, whether it was kept for a rerun, the number of records written and the number of
+          write requests and batch entries skipped because an earlier run confirmed them.
+    type: dict
+    returned: when journal is set
+
+trafficjam_profile:
+    description:
+        - Profile summary when the TRAFFICJAM_PROFILE environment variable is set, see module_utils/profiling.py.
+        - Carries elapsed, memory_current, memory_peak, the top functions by cumulative time, the top allocation sites
+          and the paths of the pstats and allocations files written on the managed host.
+    type: dict
+    returned: when profiling is enabled
 '''
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wwt.trafficjam.plugins.module_utils.profiling import run_profiled
 from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import (
+    api_url,
+    create_exclusive,
     trafficjam_base_argspec,
     make_request,
-    parse_query_return,
-    process_response
+    process_response,
+    query_subinterfaces,
+    run_on_hosts
+)
+from ansible_collections.wwt.trafficjam.plugins.module_utils.validation import (
+    compile_constraints,
+    validate_params
 )
 
 
-def scrub_params(_params):
-    #
-    # The builtin methods for scrubbing parameters do not handle nested dictionaries,
-    # so we have to do it here
-    #
-
+# Constraints on the nested config parameters, validated by module_utils.validation
+CONSTRAINTS = compile_constraints([
     # Some parameters are mutually exclusive
-    if _params['config'] is not None and _params['config']['name'] is not None and _params['config']['bridge_id'] is not None:
-        _errormsg = "parameter name is mutually exclusive with bridge_id"
-        return _errormsg
+    dict(mutually_exclusive=['bridge_id', 'bridge_ids']),
+    dict(mutually_exclusive=['name', 'bridge_id']),
+    dict(mutually_exclusive=['name', 'vlan_id']),
+    dict(mutually_exclusive=['interface_id', 'vlan_id']),
+    dict(mutually_exclusive=['interface_id', 'subinterface_id']),
+    dict(mutually_exclusive=['vlan_id', 'subinterface_id']),
 
-    if _params['config'] is not None and _params['config']['name'] is not None and _params['config']['vlan_id'] is not None:
-        _errormsg = "parameter name is mutually exclusive with vlan_id"
-        return _errormsg
-
-    if _params['config'] is not None and _params['config']['interface_id'] is not None and _params['config']['vlan_id'] is not None:
-        _errormsg = "parameter interface_id is mutually exclusive with vlan_id"
-        return _errormsg
-
-    if _params['config'] is not None and _params['config']['interface_id'] is not None and _params['config']['subinterface_id'] is not None:
-        _errormsg = "parameter interface_id is mutually exclusive with subinterface_id"
-        return _errormsg
+    # Some parameters have dependencies
+    dict(required_one_of=[['name'], ['bridge_id']], when=dict(state='present', subinterface=False)),
+    dict(required_one_of=[['bridge_id']], when=dict(state='absent', subinterface=False)),
+    dict(required_one_of=[['bridge_id', 'vlan_id'], ['bridge_id', 'subinterface_id']],
+         when=dict(state='present', subinterface=True), required_by='subinterface'),
+    dict(required_one_of=[['bridge_id', 'subinterface_id']], when=dict(state='absent', subinterface=True), required_by='subinterface')
+])
 
-    if _params['config'] is not None and _params['config']['vlan_id'] is not None and _params['config']['subinterface_id'] is not None:
-        _errormsg = "parameter vlan_id is mutually exclusive with subinterface_id"
-        return _errormsg
 
-    # Some parameters have dependencies
-    if not _params['subinterface']:
-        if _params['state'] == "present":
-            if (_params['config'] is not None and _params['config']['name'] is None and _params['config']['bridge_id'] is None):
-                _errormsg = "missing parameter(s) required: name|bridge_id"
-                return _errormsg
-            elif (_params['config'] is not None and _params['config']['name'] is not None):
-                _errormsg = None
-                return _errormsg
-            elif (_params['config'] is not None and _params['config']['bridge_id'] is not None):
-                _errormsg = None
-                return _errormsg
-
-    if _params['subinterface']:
-        if _params['state'] == "query":
-            if (_params['subinterface'] and _params['config'] is None) or (_params['subinterface'] and _params['config']['bridge_id'] is None):
-                _errormsg = "missing parameter(s) required by 'subinterface': bridge_id"
-                return _errormsg
-
-        if _params['state'] == "present":
-            if (_params['subinterface'] and _params['config'] is None):
-                _errormsg = "missing parameter(s) required by 'subinterface': bridge_id|vlan_id or bridge_id|subinterface_id"
-                return _errormsg
-            elif (_params['subinterface'] and _params['config']['bridge_id'] and _params['config']['vlan_id'] and _params['config']['subinterface_id'] is None):
-                _errormsg = None
-                return _errormsg
-            elif (_params['subinterface'] and _params['config']['bridge_id'] and _params['config']['subinterface_id'] and _params['config']['vlan_id'] is None):
-                _errormsg = None
-                return _errormsg
-            else:
-                _errormsg = "missing parameter(s) required by 'subinterface': bridge_id|vlan_id or bridge_id|subinterface_id"
-                return _errormsg
+def validate(_params):
+    # Returns every error found in the nested config parameters
+    _errors = validate_params(CONSTRAINTS, _params)
+    if (_params['config'] or {}).get('bridge_ids') is not None and not (_params['state'] == 'query' and _params['subinterface']):
+        _errors.append("parameter bridge_ids is only supported when querying subinterfaces")
+    return _errors
 
 
 def generate_url(_params):
     # Gather Parameters
-    _host = _params['host']
-    _port = _params['port']
 
     # Default _payload to None.  If required, this will be set below.
     _payload = None
@@ -278,7 +368,7 @@ def generate_url(_params):
     if _params['state'] == "query":
         # Generate URLs for non-subinterface requests
         if (not _params['subinterface'] and _params['config'] is None) or (not _params['subinterface'] and _params['config']['bridge_id'] is None):
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/bridges"
+            _url = api_url(_params, "interfaces/bridges")
             _http_method = "get"
 
             # Construct a dictionary to return results with
@@ -286,7 +376,7 @@ def generate_url(_params):
             return _response_dict
 
         elif not _params['subinterface'] and _params['config']['bridge_id']:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/bridges/{_params['config']['bridge_id']}"
+            _url = api_url(_params, f"interfaces/bridges/{_params['config']['bridge_id']}")
             _http_method = "get"
 
             # Construct a dictionary to return results with
@@ -295,7 +385,7 @@ def generate_url(_params):
 
         # Generate URLs for subinterface requests
         if _params['subinterface'] and _params['config']['bridge_id']:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/bridges/{_params['config']['bridge_id']}/subinterfaces"
+            _url = api_url(_params, f"interfaces/bridges/{_params['config']['bridge_id']}/subinterfaces")
             _http_method = "get"
 
             # Construct a dictionary to return results with
@@ -303,7 +393,7 @@ def generate_url(_params):
             return _response_dict
 
         if _params['subinterface'] and _params['config']['bridge_id'] and _params['config']['subinterface_id']:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/bridges/{_params['config']['bridge_id']}/subinterfaces/{_params['config']['subinterface_id']}"
+            _url = api_url(_params, f"interfaces/bridges/{_params['config']['bridge_id']}/subinterfaces/{_params['config']['subinterface_id']}")
             _http_method = "get"
 
             # Construct a dictionary to return results with
@@ -314,7 +404,7 @@ def generate_url(_params):
     if _params['state'] == "present":
         # Generate URLs for non-subinterface requests
         if not _params['subinterface'] and _params['config']['name'] is not None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/bridges"
+            _url = api_url(_params, "interfaces/bridges")
             _http_method = "post"
             _payload = {
                 "name": _params['config']['name'],
@@ -331,7 +421,7 @@ def generate_url(_params):
 
         # Generate URL for updating an existing Bridge Interface via PUT Method
         if not _params['subinterface'] and _params['config']['bridge_id'] is not None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/bridges/{_params['config']['bridge_id']}"
+            _url = api_url(_params, f"interfaces/bridges/{_params['config']['bridge_id']}")
             _http_method = "put"
             _payload = {
                 "description": _params['config']['description'],
@@ -347,7 +437,7 @@ def generate_url(_params):
 
         # Generate URLs for subinterface requests
         if _params['subinterface'] and _params['config']['bridge_id'] is not None and _params['config']['vlan_id'] is not None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/bridges/{_params['config']['bridge_id']}/subinterfaces"
+            _url = api_url(_params, f"interfaces/bridges/{_params['config']['bridge_id']}/subinterfaces")
             _http_method = "post"
             _payload = {
                 "description": _params['config']['description'],
@@ -362,7 +452,7 @@ def generate_url(_params):
             return _response_dict
 
         if _params['subinterface'] and _params['config']['bridge_id'] is not None and _params['config']['subinterface_id'] is not None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/bridges/{_params['config']['bridge_id']}/subinterfaces/{_params['config']['subinterface_id']}"
+            _url = api_url(_params, f"interfaces/bridges/{_params['config']['bridge_id']}/subinterfaces/{_params['config']['subinterface_id']}")
             _http_method = "put"
             _payload = {
                 "description": _params['config']['description'],
@@ -378,7 +468,7 @@ def generate_url(_params):
     # Generate URL for Absent Requests
     if _params['state'] == "absent":
         if not _params['subinterface'] and _params['config']['bridge_id'] is not None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/bridges/{_params['config']['bridge_id']}"
+            _url = api_url(_params, f"interfaces/bridges/{_params['config']['bridge_id']}")
             _http_method = "delete"
 
             # Construct a dictionary to return results with
@@ -386,7 +476,7 @@ def generate_url(_params):
             return _response_dict
 
         if _params['subinterface'] and _params['config']['bridge_id'] is not None and _params['config']['subinterface_id'] is not None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/bridges/{_params['config']['bridge_id']}/subinterfaces/{_params['config']['subinterface_id']}"
+            _url = api_url(_params, f"interfaces/bridges/{_params['config']['bridge_id']}/subinterfaces/{_params['config']['subinterface_id']}")
             _http_method = "delete"
 
             # Construct a dictionary to return results with
@@ -394,27 +484,29 @@ def generate_url(_params):
             return _response_dict
 
 
-def run_module():
-    # define available arguments/parameters a user can pass to the module
-    module_args = trafficjam_base_argspec()
+def execute_query_subinterfaces(_params):
+    #
+    # Query the subinterfaces of every bridge interface in bridge_ids, or of all of them when neither bridge_id nor bridge_ids is set.
+    # The bridge interfaces are fetched concurrently, and each subinterface is annotated with its bridge_id.
+    #
+    _config = _params['config'] or {}
+    _response = query_subinterfaces(_params, "interfaces/bridges", _config.get('bridge_ids'), 'bridge_id')
 
-    config_spec = dict(
-        name=dict(type='str', required=False),
-        description=dict(type='str', required=False),
-        v4_address=dict(type='str', required=False),
-        v6_address=dict(type='str', required=False),
-        vrf_id=dict(type='int', required=False),
-        interface_id=dict(type='int', required=False),
-        subinterface_id=dict(type='int', required=False),
-        bridge_id=dict(type='int', required=False),
-        vlan_id=dict(type='int', required=False)
-    )
+    # A subinterface_id picks that subinterface out of all of them
+    if _config.get('subinterface_id') is not None and 'msg' not in _response:
+        _response['response'] = [_item for _item in _response['response'] if _item.get('id') == _config['subinterface_id']]
 
-    module_args.update(
-        subinterface=dict(type='bool', required=False, default=False),
-        state=dict(type='str', choices=['query', 'present', 'absent'], default='query'),
-        config=dict(type='dict', options=config_spec)
-    )
+    result = dict(changed=False, failed='msg' in _response, response=_response['response'], status_code=_response['status_code'])
+    if 'msg' in _response:
+        result['msg'] = _response['msg']
+    return result
+
+
+def execute(_params):
+    # Subinterfaces of several or all bridge interfaces are queried at once
+    _config = _params['config'] or {}
+    if _params['state'] == "query" and _params['subinterface'] and (_config.get('bridge_id') is None or _config.get('bridge_ids')):
+        return execute_query_subinterfaces(_params)
 
     # seed the result dict in the object
     # we primarily care about changed and the response data
@@ -427,75 +519,45 @@ def run_module():
         status_code=''
     )
 
-    module = AnsibleModule(
-        argument_spec=module_args,
-        supports_check_mode=False,
-        required_if=[
-            ['state', 'present', ['config']],
-            ['state', 'absent', ['config']]
-        ]
-    )
-
     # Collect Module Parameters
-    host = module.params['host']
-    port = module.params['port']
-    timeout = module.params['timeout']
-    subinterface = module.params['subinterface']
+    subinterface = _params['subinterface']
 
-    if module.params['config'] is not None and module.params['config']['bridge_id'] is not None:
-        bridge_id = module.params['config']['bridge_id']
+    if _params['config'] is not None and _params['config']['bridge_id'] is not None:
+        bridge_id = _params['config']['bridge_id']
     else:
         bridge_id = None
 
-    # Run through some error checking and scrub the received parameters
-    errormsg = scrub_params(module.params)
-
-    if errormsg is not None:
-        result['changed'] = True
-        result['failed'] = False
-        module.fail_json(msg=errormsg, **result)
-
     # Generate the URL and HTTP Method based on Module Parameters
-    url_response = generate_url(module.params)
+    url_response = generate_url(_params)
 
     url = url_response['url']
     http_method = url_response['http_method']
     payload = url_response['data']
 
-    # We need to validate if the interface exists already before adding it
+    # We need to validate if the interface exists already before adding it, under a lock shared with concurrent tasks
     if http_method == "post":
-        # Generate URL for Non-Subinterface Requests
         if not subinterface:
-            query_url = f"http://{host}:{port}/trafficjam/api/interfaces/bridges"
-            query_method = "get"
-        # Generate URL for Subinterface Requests
-        elif subinterface and bridge_id is not None:
-            query_url = f"http://{host}:{port}/trafficjam/api/interfaces/bridges/{bridge_id}/subinterfaces"
-            query_method = "get"
-
-        # Make the request
-        query_response = make_request(query_method, query_url, payload, timeout)
-
-        if query_response['response']:
-            if not subinterface:
-                if parse_query_return(query_response['response'], 'name', module.params['config']['name']):
-                    result['response'] = query_response['response']
-                    result['status_code'] = query_response['status_code']
-                    module.fail_json(msg='bridge interface already exists', **result)
-            elif subinterface and bridge_id is not None:
-                if parse_query_return(query_response['response'], 'vlan_id', module.params['config']['vlan_id']):
-                    result['response'] = query_response['response']
-                    result['status_code'] = query_response['status_code']
-                    module.fail_json(msg='bridge subinterface already exists', **result)
-
-    # Generate the Request to the TrafficJam API
-    response = make_request(http_method, url, payload, module.params['timeout'])
+            created = create_exclusive(_params, "interfaces/bridges", 'name', _params['config']['name'], payload,
+                                       'bridge interface already exists')
+        else:
+            created = create_exclusive(_params, f"interfaces/bridges/{bridge_id}/subinterfaces", 'vlan_id',
+                                       _params['config']['vlan_id'], payload, 'bridge subinterface already exists')
+        if created['msg'] is not None:
+            result['response'] = created['query']['response']
+            result['status_code'] = created['query']['status_code']
+            result['failed'] = True
+            result['msg'] = created['msg']
+            return result
+        response = created['response']
+    else:
+        # Generate the Request to the TrafficJam API
+        response = make_request(http_method, url, payload, _params['timeout'])
 
     # Exit the module passing results back to Ansible
     succeeded = process_response(response)
 
     # Manage States Returned to Ansible - If Query, Nothing will ever be changed.
-    if succeeded and module.params['state'] == "query":
+    if succeeded and _params['state'] == "query":
         result['changed'] = False
         result['failed'] = False
     elif succeeded:
@@ -507,11 +569,60 @@ def run_module():
     result['status_code'] = response['status_code']
     result['response'] = response['response']
 
-    module.exit_json(**result)
+    return result
+
+
+def run_module():
+    # define available arguments/parameters a user can pass to the module
+    module_args = trafficjam_base_argspec()
+
+    config_spec = dict(
+        name=dict(type='str', required=False),
+        description=dict(type='str', required=False),
+        v4_address=dict(type='str', required=False),
+        v6_address=dict(type='str', required=False),
+        vrf_id=dict(type='int', required=False),
+        interface_id=dict(type='int', required=False),
+        subinterface_id=dict(type='int', required=False),
+        bridge_id=dict(type='int', required=False),
+        bridge_ids=dict(type='list', elements='int', required=False),
+        vlan_id=dict(type='int', required=False)
+    )
+
+    module_args.update(
+        subinterface=dict(type='bool', required=False, default=False),
+        state=dict(type='str', choices=['query', 'present', 'absent'], default='query'),
+        config=dict(type='dict', options=config_spec)
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=False,
+        mutually_exclusive=[
+            ['host', 'hosts'],
+            ['hosts', 'unix_socket']
+        ],
+        required_one_of=[
+            ['host', 'hosts']
+        ],
+        required_if=[
+            ['state', 'present', ['config']],
+            ['state', 'absent', ['config']]
+        ]
+    )
+
+    # Validate the nested config parameters, reporting every error at once
+    errors = validate(module.params)
+
+    if errors:
+        module.fail_json(msg='; '.join(errors), errors=errors, changed=False, response='', status_code='')
+
+    # Run the request against every TrafficJam instance and exit the module
+    run_on_hosts(module, execute, validate)
 
 
 def main():
-    run_module()
+    run_profiled(run_module)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,702 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: trafficjam_churn
+
+short_description: This module is used to simulate an unstable WAN by changing the WWT ATC Tool TrafficJam at a target rate
+
+version_added: "2.9"
+
+description:
+    - "This module is used to make a stream of changes to the WWT ATC Tool TrafficJam at a precise rate, such as subinterfaces
+      appearing and disappearing, addresses changing and subinterfaces moving between VRFs"
+    - "Events come from an explicit schedule, or from a profile giving a rate, a duration and a mix of actions.
+      An event loop starts every event at its time and hands the request to a pool of max_workers threads.
+      When all of them are busy, the next event waits for one and its lag is recorded."
+    - "Reports the target and achieved event rate, the lag of events behind their schedule and the latency of their requests."
+    - "The actions change subinterfaces created by the run only, existing objects are left alone unless an event of the
+      schedule names them with method and path.  Created subinterfaces are removed at the end unless cleanup is false."
+
+options:
+    host:
+        description:
+            - Address for TrafficJam instance.  Either host or hosts is required.
+        required: false
+    port:
+        description:
+            - HTTP Port for TrafficJam instance.  Defaults to 80, or 443 when scheme is https.
+        required: false
+    scheme:
+        description:
+            - Scheme used to reach the TrafficJam instance.
+        required: false
+        choices: ['http', 'https']
+        default: http
+    validate_certs:
+        description:
+            - Verify the TLS certificate of the TrafficJam instance when scheme is https.
+            - Only set to false against instances with a self-signed certificate.
+        required: false
+        type: bool
+        default: true
+    unix_socket:
+        description:
+            - Path of a unix domain socket to reach a TrafficJam instance on the same machine through, instead of TCP.
+            - Requests are sent as plain HTTP over the socket.  host and port still identify the instance and are sent as Host header.
+            - Mutually exclusive with hosts.
+        required: false
+        type: path
+    timeout:
+        description:
+            - HTTP Timeout
+        required: false
+        default: 10
+    hosts:
+        description:
+            - List of TrafficJam instances to run the same churn against concurrently.
+            - Entries may include a port as host:port, otherwise port is used.
+            - Mutually exclusive with host.
+        required: false
+    max_workers:
+        description:
+            - Maximum number of requests in flight, and of TrafficJam instances contacted concurrently when using hosts
+        required: false
+        default: 8
+    health_ttl:
+        description:
+            - Seconds a TrafficJam instance which could not be reached is marked down.
+              Tasks against it fail immediately while it is marked down, instead of waiting for timeout.
+            - The mark is shared by every task running on the same machine.  Once it expires, the next task probes the instance with a TCP connection.
+            - Set to 0 to disable.
+        required: false
+        default: 30
+    journal:
+        description:
+            - Not used by the churn requests, which are meant to repeat.  Accepted like every other module.
+        required: false
+        type: path
+    batch:
+        description:
+            - List of complete parameter sets, one per loop item.
+            - Entries run concurrently up to max_workers and return one result each under batch_results.
+        required: false
+    profile:
+        description:
+            - Statistical description of the events.  Mutually exclusive with schedule.
+        required: false
+        type: dict
+        suboptions:
+            rate:
+                description:
+                    - Target number of events per second
+                required: true
+                type: float
+            duration:
+                description:
+                    - Seconds to generate events for
+                required: true
+                type: float
+            arrival:
+                description:
+                    - uniform spaces events evenly.  poisson draws exponential gaps, like independent events arriving at rate.
+                required: false
+                choices: ['uniform', 'poisson']
+                default: poisson
+            mix:
+                description:
+                    - Relative weight of each action, e.g. {create_subinterface: 2, delete_subinterface: 2, change_address: 1}.
+                    - Defaults to the same weight for every action.
+                required: false
+                type: dict
+    schedule:
+        description:
+            - List of events, each with 'at', its time in seconds from the start.  Mutually exclusive with profile.
+            - An event either names an action, optionally with the physical_id and vlan_id it applies to,
+              or makes a request given by method, path below /trafficjam/api/ and payload.
+        required: false
+        type: list
+        elements: dict
+    seed:
+        description:
+            - Seed of the random choices, to repeat the same events.  A random seed is used and returned when omitted.
+        required: false
+        type: int
+    physical_ids:
+        description:
+            - IDs (integer) of the physical interfaces to create subinterfaces on.  Defaults to every physical interface.
+        required: false
+        type: list
+        elements: int
+    vlan_range:
+        description:
+            - First and last VLAN ID (integer) of the subinterfaces created.  VLANs in use are skipped.
+        required: false
+        type: list
+        elements: int
+        default: [2000, 2999]
+    vrf_ids:
+        description:
+            - IDs (integer) of the VRFs rebind_vrf moves subinterfaces between.  Defaults to every VRF.
+        required: false
+        type: list
+        elements: int
+    address_pool:
+        description:
+            - Network change_address picks addresses from.  Addresses are assigned as /32.
+        required: false
+        default: 198.18.0.0/15
+    cleanup:
+        description:
+            - Remove the subinterfaces created by the run once the last event completed.
+        required: false
+        type: bool
+        default: true
+
+notes:
+    - The actions are create_subinterface, delete_subinterface, change_address and rebind_vrf.
+      An action with nothing to act on, such as delete_subinterface before anything was created, is counted as skipped.
+    - Requests are sent as they are scheduled.  They are not recorded in a journal or shared between entries of a batch.
+    - The requests of the events and of the cleanup are left out of trafficjam_requests, which would otherwise grow
+      with every event.  Their timing is summarized by latency instead.
+    - The run stops early when TrafficJam cannot be reached.
+    - Supports check mode, which returns the first events of the schedule without sending anything.
+
+author:
+    - Nick Thompson (nick.thompson@wwt.com)
+'''
+
+EXAMPLES = '''
+# Ten events per second for ten minutes, repeatable through the seed
+- name: Churn Subinterfaces
+  trafficjam_churn:
+    host: trafficjam
+    physical_ids: [3, 4]
+    seed: 42
+    profile:
+      rate: 10
+      duration: 600
+      mix:
+        create_subinterface: 2
+        delete_subinterface: 2
+        change_address: 3
+        rebind_vrf: 1
+  register: churn
+
+- name: Show Achieved Rate
+  debug:
+    msg: "{{ churn.achieved_rate }} of {{ churn.target_rate }} events/s, p99 latency {{ churn.latency.p99 }}s"
+
+# A scripted flap of one subinterface and a link description change
+- name: Flap Subinterface
+  trafficjam_churn:
+    host: trafficjam
+    cleanup: false
+    schedule:
+      - at: 0
+        action: create_subinterface
+        physical_id: 3
+        vlan_id: 2100
+      - at: 1.5
+        action: delete_subinterface
+      - at: 2
+        method: put
+        path: interfaces/physicals/3
+        payload:
+          description: flapped
+'''
+
+RETURN = '''
+seed:
+    description: Seed of the random choices, pass it back to repeat the run
+    type: int
+    returned: always
+
+events:
+    description: Number of events scheduled, sent, succeeded, failed and skipped
+    type: dict
+    returned: always
+
+actions:
+    description: Number of events sent, succeeded and failed per action, or per method for requests of the schedule
+    type: dict
+    returned: always
+
+target_rate:
+    description: Events per second asked for
+    type: float
+    returned: always
+
+achieved_rate:
+    description: Events per second sent, between the first and the last event
+    type: float
+    returned: always
+
+elapsed:
+    description: Seconds from the first event to the completion of the last one
+    type: float
+    returned: always
+
+lag:
+    description: Seconds events started behind their schedule, as count, p50, p90, p99, p99.9 and max
+    type: dict
+    returned: always
+
+latency:
+    description: Seconds the requests of the events took, as count, p50, p90, p99, p99.9 and max
+    type: dict
+    returned: always
+
+cleaned_up:
+    description: Number of subinterfaces created by the run and removed at its end
+    type: int
+    returned: always
+
+errors:
+    description: The first 20 failed events, each with its time, action, status_code and msg
+    type: list
+    returned: always
+
+planned:
+    description: The first 100 events, each with its time and action
+    type: list
+    returned: in check mode
+
+results:
+    description: Per-instance results when hosts is used.  Each entry carries host, port, changed, failed and the keys above.
+    type: list
+    returned: when hosts is used
+
+batch_results:
+    description: One result per entry of batch, in the same order.
+    type: list
+    returned: when batch is used
+
+trafficjam_requests:
+    description:
+        - Timing of the requests made to TrafficJam to discover the physical interfaces and VRFs,
+          for the wwt.trafficjam.trafficjam callback plugin.  The requests of the events are summarized by latency.
+        - Each entry is a list of method, url template, host, status_code, elapsed seconds, response bytes and retries.
+    type: list
+    returned: when TrafficJam was contacted
+
+trafficjam_profile:
+    description:
+        - Profile summary when the TRAFFICJAM_PROFILE environment variable is set, see module_utils/profiling.py.
+        - Carries elapsed, memory_current, memory_peak, the top functions by cumulative time, the top allocation sites
+          and the paths of the pstats and allocations files written on the managed host.
+    type: dict
+    returned: when profiling is enabled
+'''
+
+import asyncio
+import ipaddress
+import random
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wwt.trafficjam.plugins.module_utils.health import is_connection_error
+from ansible_collections.wwt.trafficjam.plugins.module_utils.latency import latency_summary
+from ansible_collections.wwt.trafficjam.plugins.module_utils.profiling import run_profiled
+from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import (
+    api_url,
+    trafficjam_base_argspec,
+    process_response,
+    query_subinterfaces,
+    run_concurrently,
+    run_on_hosts,
+    send_request
+)
+
+ACTIONS = ['create_subinterface', 'delete_subinterface', 'change_address', 'rebind_vrf']
+
+# Description of the subinterfaces created by the run
+CHURN_DESCRIPTION = 'trafficjam churn'
+
+# Number of failed events reported under errors, and of events returned in check mode
+MAX_ERRORS = 20
+MAX_PLANNED = 100
+
+
+def validate(_params):
+    # Returns every error found in profile and schedule
+    _errors = []
+    _profile = _params['profile']
+    if _profile is not None:
+        if _profile['rate'] <= 0 or _profile['duration'] <= 0:
+            _errors.append("profile rate and duration must be positive")
+        _unknown = [str(_action) for _action in (_profile['mix'] or {}) if _action not in ACTIONS]
+        if _unknown:
+            _errors.append(f"profile mix has unknown action(s) {', '.join(_unknown)}, expected {', '.join(ACTIONS)}")
+        elif _profile['mix'] is not None and not any(_weight > 0 for _weight in _profile['mix'].values()):
+            _errors.append("profile mix needs an action with a positive weight")
+
+    for _index, _event in enumerate(_params['schedule'] or []):
+        if not isinstance(_event.get('at'), (int, float)) or _event['at'] < 0:
+            _errors.append(f"schedule event {_index} needs 'at', a number of seconds from the start")
+        if _event.get('action') is None and not (_event.get('method') and _event.get('path')):
+            _errors.append(f"schedule event {_index} needs an action, or a method and a path")
+        elif _event.get('action') is not None and _event['action'] not in ACTIONS:
+            _errors.append(f"schedule event {_index} has unknown action {_event['action']}, expected {', '.join(ACTIONS)}")
+        elif _event.get('method') is not None and str(_event['method']).lower() not in ('get', 'post', 'put', 'delete'):
+            _errors.append(f"schedule event {_index} has unknown method {_event['method']}")
+
+    if len(_params['vlan_range']) != 2 or not 1 <= _params['vlan_range'][0] <= _params['vlan_range'][1] <= 4094:
+        _errors.append("vlan_range must be [first, last] within 1-4094")
+    try:
+        ipaddress.ip_network(_params['address_pool'])
+    except ValueError as _error:
+        _errors.append(f"address_pool is not a network: {_error}")
+    return _errors
+
+
+def profile_events(_profile, _random):
+    # Yield (at, event) for the events of a profile, without building the whole list
+    _mix = _profile['mix'] or dict((_action, 1) for _action in ACTIONS)
+    _actions = [_action for _action, _weight in _mix.items() if _weight > 0]
+    _weights = [_mix[_action] for _action in _actions]
+
+    _at, _count = 0.0, 0
+    while True:
+        if _profile['arrival'] == 'poisson':
+            _at += _random.expovariate(_profile['rate'])
+        else:
+            _at = _count / _profile['rate']
+        if _at >= _profile['duration']:
+            return
+        _count += 1
+        yield _at, dict(action=_random.choices(_actions, _weights)[0])
+
+
+def schedule_events(_schedule):
+    return ((float(_event['at']), _event) for _event in sorted(_schedule, key=lambda _event: _event['at']))
+
+
+def events(_params, _seed):
+    if _params['profile'] is not None:
+        return profile_events(_params['profile'], random.Random(_seed))
+    return schedule_events(_params['schedule'])
+
+
+def discover(_params):
+    #
+    # Collect what the actions work with: the free VLANs of each physical interface and the VRFs.
+    # Returns the state shared by the events, or an error message.
+    #
+    _first, _last = _params['vlan_range']
+    _parents = _params['physical_ids']
+    if _parents is None:
+        _listing = send_request("get", api_url(_params, "interfaces/physicals"), None, _params['timeout'])
+        if not process_response(_listing) or not isinstance(_listing['response'], list):
+            return None, "unable to fetch interfaces/physicals"
+        _parents = [_physical['id'] for _physical in _listing['response'] if _physical.get('id') is not None]
+
+    _response = query_subinterfaces(_params, "interfaces/physicals", _parents, 'physical_id')
+    if 'msg' in _response:
+        return None, _response['msg']
+
+    _used = {}
+    for _subinterface in _response['response']:
+        _used.setdefault(_subinterface['physical_id'], set()).add(_subinterface.get('vlan_id'))
+
+    _vrf_ids = _params['vrf_ids']
+    if _vrf_ids is None:
+        _listing = send_request("get", api_url(_params, "vrfs"), None, _params['timeout'])
+        if not process_response(_listing) or not isinstance(_listing['response'], list):
+            return None, "unable to fetch vrfs"
+        _vrf_ids = [_vrf['id'] for _vrf in _listing['response'] if _vrf.get('id') is not None]
+
+    _free = dict((_parent, [_vlan for _vlan in range(_first, _last + 1) if _vlan not in _used.get(_parent, ())]) for _parent in _parents)
+    return dict(parents=_parents, free=_free, vrf_ids=_vrf_ids, created=[], pool=ipaddress.ip_network(_params['address_pool'])), None
+
+
+def take(_random, _items):
+    # Remove and return a random item in constant time, or None when there is none
+    if not _items:
+        return None
+    _index = _random.randrange(len(_items))
+    _items[_index], _items[-1] = _items[-1], _items[_index]
+    return _items.pop()
+
+
+def prepare(_state, _random, _event):
+    #
+    # Turn an event into a request, reserving what it acts on so concurrent events pick something else.
+    # Returns a dict with method, path, payload and the subinterface it acts on, or None when there is nothing to act on.
+    #
+    _action = _event.get('action')
+    if _action is None:
+        return dict(method=str(_event['method']).lower(), path=_event['path'], payload=_event.get('payload'), subinterface=None)
+
+    if _action == 'create_subinterface':
+        _parent = _event.get('physical_id')
+        if _parent is None:
+            _candidates = [_candidate for _candidate in _state['parents'] if _state['free'].get(_candidate)]
+            _parent = _random.choice(_candidates) if _candidates else None
+        _free = _state['free'].setdefault(_parent, [])
+        if _event.get('vlan_id') is not None:
+            _vlan_id = _event['vlan_id']
+            if _vlan_id in _free:
+                _free.remove(_vlan_id)
+        else:
+            _vlan_id = take(_random, _free)
+        if _parent is None or _vlan_id is None:
+            return None
+        return dict(method="post", path=f"interfaces/physicals/{_parent}/subinterfaces",
+                    payload=dict(vlan_id=_vlan_id, description=CHURN_DESCRIPTION),
+                    subinterface=dict(physical_id=_parent, vlan_id=_vlan_id))
+
+    _subinterface = take(_random, _state['created'])
+    if _subinterface is None:
+        return None
+    _path = f"interfaces/physicals/{_subinterface['physical_id']}/subinterfaces/{_subinterface['id']}"
+
+    if _action == 'delete_subinterface':
+        return dict(method="delete", path=_path, payload=None, subinterface=_subinterface)
+
+    if _action == 'change_address':
+        _pool = _state['pool']
+        _address = _pool.network_address + _random.randrange(_pool.num_addresses)
+        return dict(method="put", path=_path, payload=dict(v4_address=f"{_address}/{_address.max_prefixlen}"), subinterface=_subinterface)
+
+    if not _state['vrf_ids']:
+        _state['created'].append(_subinterface)
+        return None
+    return dict(method="put", path=_path, payload=dict(vrf_id=_random.choice(_state['vrf_ids'])), subinterface=_subinterface)
+
+
+def complete(_state, _request, _succeeded, _response):
+    # Return what the request reserved, or record what it created
+    _subinterface = _request['subinterface']
+    if _subinterface is None:
+        return
+
+    if _request['method'] == "post":
+        if _succeeded and isinstance(_response, dict) and _response.get('id') is not None:
+            _state['created'].append(dict(_subinterface, id=_response['id']))
+        elif not _succeeded:
+            _state['free'][_subinterface['physical_id']].append(_subinterface['vlan_id'])
+    elif _request['method'] == "delete" and _succeeded:
+        _state['free'].setdefault(_subinterface['physical_id'], []).append(_subinterface['vlan_id'])
+    else:
+        _state['created'].append(_subinterface)
+
+
+async def run_events(_params, _events, _state, _random, _result):
+    #
+    # Start every event at its time and send its request through a pool of max_workers threads.
+    #
+    # The event loop only sleeps until the next event is due, so events are
+    # started on time however long the requests take, until all max_workers
+    # requests are in flight.  Then the next event waits for a free worker and
+    # starts late; its lag is recorded either way.
+    #
+    _loop = asyncio.get_running_loop()
+    _executor = ThreadPoolExecutor(max_workers=_params['max_workers'])
+    _workers = asyncio.Semaphore(_params['max_workers'])
+    _lags, _latencies = array('d'), array('d')
+    _in_flight = set()
+    _dispatched = []
+    _aborted = []
+
+    async def send(_at, _label, _request):
+        _started = time.monotonic()
+        try:
+            _response = await _loop.run_in_executor(_executor, partial(send_request, _request['method'], api_url(_params, _request['path']),
+                                                                       _request['payload'], _params['timeout'], _record=False))
+        except Exception as _error:
+            _response = None
+            if is_connection_error(_error):
+                _aborted.append(_error)
+            record(_result, _at, _label, False, '', str(_error))
+        else:
+            _succeeded = process_response(_response)
+            _latencies.append(time.monotonic() - _started)
+            record(_result, _at, _label, _succeeded, _response['status_code'], None if _succeeded else _response['response'])
+        finally:
+            _workers.release()
+
+        complete(_state, _request, _response is not None and process_response(_response), _response and _response['response'])
+
+    _started = _loop.time()
+    for _at, _event in _events:
+        if _aborted:
+            break
+        _result['events']['scheduled'] += 1
+
+        _delay = _started + _at - _loop.time()
+        if _delay > 0:
+            await asyncio.sleep(_delay)
+        await _workers.acquire()
+
+        _now = _loop.time()
+        _lags.append(max(0.0, _now - _started - _at))
+        _request = prepare(_state, _random, _event)
+        if _request is None:
+            _workers.release()
+            _result['events']['skipped'] += 1
+            continue
+
+        _dispatched.append(_now)
+        _label = _event.get('action') or _request['method']
+        _task = _loop.create_task(send(_at, _label, _request))
+        _in_flight.add(_task)
+        _task.add_done_callback(_in_flight.discard)
+
+    if _in_flight:
+        await asyncio.gather(*_in_flight)
+    _executor.shutdown()
+
+    _result['elapsed'] = round(_loop.time() - _started, 6)
+    if len(_dispatched) > 1 and _dispatched[-1] > _dispatched[0]:
+        _result['achieved_rate'] = round((len(_dispatched) - 1) / (_dispatched[-1] - _dispatched[0]), 3)
+    _result['lag'] = latency_summary(_lags)
+    _result['latency'] = latency_summary(_latencies)
+
+    # Raised once the requests in flight completed, so the instance is reported down
+    if _aborted:
+        raise _aborted[0]
+
+
+def record(_result, _at, _label, _succeeded, _status_code, _error):
+    _counts = _result['actions'].setdefault(_label, dict(sent=0, succeeded=0, failed=0))
+    _counts['sent'] += 1
+    _result['events']['sent'] += 1
+    if _succeeded:
+        _counts['succeeded'] += 1
+        _result['events']['succeeded'] += 1
+        return
+
+    _counts['failed'] += 1
+    _result['events']['failed'] += 1
+    if len(_result['errors']) < MAX_ERRORS:
+        _result['errors'].append(dict(at=round(_at, 6), action=_label, status_code=_status_code, msg=_error))
+
+
+def target_rate(_params):
+    if _params['profile'] is not None:
+        return float(_params['profile']['rate'])
+    _times = sorted(float(_event['at']) for _event in _params['schedule'])
+    if len(_times) > 1 and _times[-1] > _times[0]:
+        return round((len(_times) - 1) / (_times[-1] - _times[0]), 3)
+    return 0.0
+
+
+def cleanup(_params, _state):
+    # Remove the subinterfaces the run created, concurrently.  Also runs after the run was stopped early, so errors only leave them behind.
+    def delete(_subinterface):
+        _path = f"interfaces/physicals/{_subinterface['physical_id']}/subinterfaces/{_subinterface['id']}"
+        try:
+            return process_response(send_request("delete", api_url(_params, _path), None, _params['timeout'], _record=False))
+        except Exception:
+            return False
+
+    return sum(run_concurrently(delete, _state['created'], _params['max_workers']))
+
+
+def execute(_params, _check_mode):
+    seed = _params['seed'] if _params['seed'] is not None else random.SystemRandom().randrange(2 ** 32)
+    result = dict(
+        changed=False,
+        seed=seed,
+        events=dict(scheduled=0, sent=0, succeeded=0, failed=0, skipped=0),
+        actions={},
+        target_rate=target_rate(_params),
+        achieved_rate=0.0,
+        elapsed=0.0,
+        lag=latency_summary([]),
+        latency=latency_summary([]),
+        cleaned_up=0,
+        errors=[]
+    )
+
+    if _check_mode:
+        result['planned'] = [dict(at=round(_at, 6), action=_event.get('action') or _event['method'])
+                             for _at, _event in islice(events(_params, seed), MAX_PLANNED)]
+        result['events']['scheduled'] = sum(1 for _event in events(_params, seed))
+        result['failed'] = False
+        return result
+
+    state, error = discover(_params)
+    if state is None:
+        result['failed'] = True
+        result['msg'] = error
+        return result
+
+    # The events draw from their own generator, so the same seed makes the same choices whatever the schedule
+    try:
+        asyncio.run(run_events(_params, events(_params, seed), state, random.Random(seed + 1), result))
+    finally:
+        result['changed'] = result['events']['succeeded'] > 0
+        if _params['cleanup']:
+            result['cleaned_up'] = cleanup(_params, state)
+
+    result['failed'] = False
+    return result
+
+
+def run_module():
+    # define available arguments/parameters a user can pass to the module
+    module_args = trafficjam_base_argspec()
+
+    profile_spec = dict(
+        rate=dict(type='float', required=True),
+        duration=dict(type='float', required=True),
+        arrival=dict(type='str', required=False, choices=['uniform', 'poisson'], default='poisson'),
+        mix=dict(type='dict', required=False)
+    )
+
+    module_args.update(
+        profile=dict(type='dict', options=profile_spec),
+        schedule=dict(type='list', elements='dict', required=False),
+        seed=dict(type='int', required=False),
+        physical_ids=dict(type='list', elements='int', required=False),
+        vlan_range=dict(type='list', elements='int', required=False, default=[2000, 2999]),
+        vrf_ids=dict(type='list', elements='int', required=False),
+        address_pool=dict(type='str', required=False, default='198.18.0.0/15'),
+        cleanup=dict(type='bool', required=False, default=True)
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=True,
+        mutually_exclusive=[
+            ['host', 'hosts'],
+            ['hosts', 'unix_socket'],
+            ['profile', 'schedule']
+        ],
+        required_one_of=[
+            ['host', 'hosts'],
+            ['profile', 'schedule']
+        ]
+    )
+
+    # Validate profile and schedule, reporting every error at once
+    errors = validate(module.params)
+
+    if errors:
+        module.fail_json(msg='; '.join(errors), errors=errors, changed=False)
+
+    # Run the churn against every TrafficJam instance and exit the module
+    run_on_hosts(module, lambda _params: execute(_params, module.check_mode), validate)
+
+
+def main():
+    run_profiled(run_module)
+
+
+if __name__ == '__main__':
+    main()
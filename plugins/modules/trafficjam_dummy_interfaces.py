@@ -23,18 +23,70 @@ description:
 options:
     host:
         description:
-            - Address for TrafficJam instance
-        required: true
+            - Address for TrafficJam instance.  Either host or hosts is required.
+        required: false
     port:
         description:
-            - HTTP Port for TrafficJam instance
+            - HTTP Port for TrafficJam instance.  Defaults to 80, or 443 when scheme is https.
+        required: false
+    scheme:
+        description:
+            - Scheme used to reach the TrafficJam instance.
+        required: false
+        choices: ['http', 'https']
+        default: http
+    validate_certs:
+        description:
+            - Verify the TLS certificate of the TrafficJam instance when scheme is https.
+            - Only set to false against instances with a self-signed certificate.
+        required: false
+        type: bool
+        default: true
+    unix_socket:
+        description:
+            - Path of a unix domain socket to reach a TrafficJam instance on the same machine through, instead of TCP.
+            - Requests are sent as plain HTTP over the socket.  host and port still identify the instance and are sent as Host header.
+            - Mutually exclusive with hosts.
         required: false
-        default: 80
+        type: path
     timeout:
         description:
             - HTTP Timeout
         required: false
         default: 10
+    hosts:
+        description:
+            - List of TrafficJam instances to apply the same request to concurrently.
+            - Entries may include a port as host:port, otherwise port is used.
+            - Mutually exclusive with host.
+        required: false
+    max_workers:
+        description:
+            - Maximum number of TrafficJam instances contacted concurrently when using hosts
+        required: false
+        default: 8
+    health_ttl:
+        description:
+            - Seconds a TrafficJam instance which could not be reached is marked down.
+              Tasks against it fail immediately while it is marked down, instead of waiting for timeout.
+            - The mark is shared by every task running on the same machine.  Once it expires, the next task probes the instance with a TCP connection.
+            - Set to 0 to disable.
+        required: false
+        default: 30
+    journal:
+        description:
+            - Path of a checkpoint journal making a large run resumable, see module_utils/journal.py.
+            - Write requests and batch entries are recorded once TrafficJam confirmed them.  When the run fails the journal is kept,
+              and rerunning the task skips everything it confirms instead of checking and sending it again.
+            - The journal is removed once a run succeeds.  Use one journal per TrafficJam instance.
+        required: false
+        type: path
+    batch:
+        description:
+            - List of complete parameter sets, one per loop item.  Set by the collection's action plugin when it coalesces a looped task, which the variable trafficjam_coalesce_loops enables.
+            - Entries run concurrently up to max_workers and return one result each under batch_results.
+            - GET requests are shared between entries, so every entry sees the state from before the batch started.
+        required: false
     state:
         description:
             - Parameter to determine module behavior.
@@ -74,6 +126,11 @@ options:
             - ID (integer) of the existing dummy interface
         required: false
 
+notes:
+    - Creates check that the object does not exist and POST it while holding a lock shared by every task on the same machine,
+      so concurrent tasks can create objects at full parallelism without making duplicates.  Duplicates made concurrently from
+      other machines are detected after the POST and resolved by keeping the object with the lowest id.
+
 author:
     - Nick Thompson (nick.thompson@wwt.com)
 '''
@@ -133,50 +190,80 @@ status_code:
     description: The HTTP Status Code returned by TrafficJam
     type: int
     returned: always
+
+results:
+    description: Per-instance results when hosts is used.  Each entry carries host, port, changed, failed, response and status_code.
+    type: list
+    returned: when hosts is used
+
+errors:
+    description: Every validation error found in config
+    type: list
+    returned: on validation failure
+
+batch_results:
+    description: One result per entry of batch, in the same order.  Entries confirmed by the journal of an earlier run carry journaled and report no change.
+    type: list
+    returned: when batch is used
+
+trafficjam_requests:
+    description:
+        - Timing of every request made to TrafficJam, for the wwt.trafficjam.trafficjam callback plugin.
+        - Each entry is a list of method, url template, host, status_code, elapsed seconds, response bytes and retries.
+    type: list
+    returned: when TrafficJam was contacted
+
+trafficjam_journal:
+    description:
+        - Summary of the checkpoint journal when journal is set.
+        - Carries its path, whether it was kept for a rerun, the number of records written and the number of
+          write requests and batch entries skipped because an earlier run confirmed them.
+    type: dict
+    returned: when journal is set
+
+trafficjam_profile:
+    description:
+        - Profile summary when the TRAFFICJAM_PROFILE environment variable is set, see module_utils/profiling.py.
+        - Carries elapsed, memory_current, memory_peak, the top functions by cumulative time, the top allocation sites
+          and the paths of the pstats and allocations files written on the managed host.
+    type: dict
+    returned: when profiling is enabled
 '''
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wwt.trafficjam.plugins.module_utils.profiling import run_profiled
 from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import (
+    api_url,
+    create_exclusive,
     trafficjam_base_argspec,
     make_request,
-    parse_query_return,
-    process_response
+    process_response,
+    run_on_hosts
+)
+from ansible_collections.wwt.trafficjam.plugins.module_utils.validation import (
+    compile_constraints,
+    validate_params
 )
 
 
-def scrub_params(_params):
-    #
-    # The builtin methods for scrubbing parameters do not handle nested dictionaries,
-    # so we have to do it here
-    #
-
+# Constraints on the nested config parameters, validated by module_utils.validation
+CONSTRAINTS = compile_constraints([
     # Some parameters are mutually exclusive
-    if _params['config'] is not None and _params['config']['name'] is not None and _params['config']['dummy_id'] is not None:
-        _errormsg = "parameter name is mutually exclusive with dummy_id"
-        return _errormsg
+    dict(mutually_exclusive=['name', 'dummy_id']),
 
     # Some parameters have dependencies
-    if _params['state'] == "present":
-        if (_params['config'] is not None and _params['config']['name']):
-            _errormsg = None
-            return _errormsg
-        elif (_params['config'] is not None and _params['config']['dummy_id']):
-            _errormsg = None
-            return _errormsg
-        else:
-            _errormsg = "missing parameter(s) required: name|dummy_id"
-            return _errormsg
-
-    if _params['state'] == "delete":
-        if (_params['config'] is not None and _params['config']['dummy_id'] is None):
-            _errormsg = "missing parameter(s) required: dummy_id"
-            return _errormsg
+    dict(required_one_of=[['name'], ['dummy_id']], when=dict(state='present')),
+    dict(required_one_of=[['dummy_id']], when=dict(state='absent'))
+])
+
+
+def validate(_params):
+    # Returns every error found in the nested config parameters
+    return validate_params(CONSTRAINTS, _params)
 
 
 def generate_url(_params):
     # Gather Parameters
-    _host = _params['host']
-    _port = _params['port']
 
     # Default _payload to None.  If required, this will be set below.
     _payload = None
@@ -185,7 +272,7 @@ def generate_url(_params):
     if _params['state'] == "query":
         # Generate URLs for dummy interface requests
         if (_params['config'] is None) or (_params['config'] is not None and _params['config']['dummy_id'] is None):
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/dummies"
+            _url = api_url(_params, "interfaces/dummies")
             _http_method = "get"
 
             # Construct a dictionary to return results with
@@ -193,7 +280,7 @@ def generate_url(_params):
             return _response_dict
 
         if _params['config']['dummy_id'] is not None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/dummies/{_params['config']['dummy_id']}"
+            _url = api_url(_params, f"interfaces/dummies/{_params['config']['dummy_id']}")
             _http_method = "get"
 
             # Construct a dictionary to return results with
@@ -204,7 +291,7 @@ def generate_url(_params):
     if _params['state'] == "present":
         # Generate URLs for Dummy Interface requests
         if _params['config']['name'] is not None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/dummies"
+            _url = api_url(_params, "interfaces/dummies")
             _http_method = "post"
             _payload = {
                 "name": _params['config']['name'],
@@ -220,7 +307,7 @@ def generate_url(_params):
 
         # Generate URL for updating an existing Dummy Interface via PUT Method
         if _params['config']['dummy_id'] is not None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/dummies/{_params['config']['dummy_id']}"
+            _url = api_url(_params, f"interfaces/dummies/{_params['config']['dummy_id']}")
             _http_method = "put"
             _payload = {
                 "description": _params['config']['description'],
@@ -236,7 +323,7 @@ def generate_url(_params):
     # Generate URL for Absent Requests
     if _params['state'] == "absent":
         if _params['config']['dummy_id'] is not None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/dummies/{_params['config']['dummy_id']}"
+            _url = api_url(_params, f"interfaces/dummies/{_params['config']['dummy_id']}")
             _http_method = "delete"
 
             # Construct a dictionary to return results with
@@ -244,25 +331,7 @@ def generate_url(_params):
             return _response_dict
 
 
-def run_module():
-    # define available arguments/parameters a user can pass to the module
-    module_args = trafficjam_base_argspec()
-
-    config_spec = dict(
-        name=dict(type='str', required=False),
-        description=dict(type='str', required=False),
-        v4_address=dict(type='str', required=False),
-        v6_address=dict(type='str', required=False),
-        vrf_id=dict(type='int', required=False),
-        dummy_id=dict(type='int', required=False)
-    )
-
-    module_args.update(
-        subinterface=dict(type='bool', required=False, default=False),
-        state=dict(type='str', choices=['query', 'present', 'absent'], default='query'),
-        config=dict(type='dict', options=config_spec)
-    )
-
+def execute(_params):
     # seed the result dict in the object
     # we primarily care about changed and the response data
     # change is if this module effectively modified the target
@@ -274,57 +343,33 @@ def run_module():
         status_code=''
     )
 
-    module = AnsibleModule(
-        argument_spec=module_args,
-        supports_check_mode=False,
-        required_if=[
-            ['state', 'present', ['config']],
-            ['state', 'absent', ['config']]
-        ]
-    )
-
-    # Collect Module Parameters
-    host = module.params['host']
-    port = module.params['port']
-    timeout = module.params['timeout']
-
-    # Run through some error checking and scrub the received parameters
-    errormsg = scrub_params(module.params)
-
-    if errormsg is not None:
-        result['changed'] = True
-        result['failed'] = False
-        module.fail_json(msg=errormsg, **result)
-
     # Generate the URL and HTTP Method based on Module Parameters
-    url_response = generate_url(module.params)
+    url_response = generate_url(_params)
 
     url = url_response['url']
     http_method = url_response['http_method']
     payload = url_response['data']
 
-    # We need to validate if the interface exists already before adding it
+    # We need to validate if the interface exists already before adding it, under a lock shared with concurrent tasks
     if http_method == "post":
-        query_url = f"http://{host}:{port}/trafficjam/api/interfaces/dummies"
-        query_method = "get"
-
-        # Make the request
-        query_response = make_request(query_method, query_url, payload, timeout)
-
-        if query_response['response']:
-            if parse_query_return(query_response['response'], 'name', module.params['config']['name']):
-                result['response'] = query_response['response']
-                result['status_code'] = query_response['status_code']
-                module.fail_json(msg='dummy interface already exists', **result)
-
-    # Generate the Request to the TrafficJam API
-    response = make_request(http_method, url, payload, module.params['timeout'])
+        created = create_exclusive(_params, "interfaces/dummies", 'name', _params['config']['name'], payload,
+                                   'dummy interface already exists')
+        if created['msg'] is not None:
+            result['response'] = created['query']['response']
+            result['status_code'] = created['query']['status_code']
+            result['failed'] = True
+            result['msg'] = created['msg']
+            return result
+        response = created['response']
+    else:
+        # Generate the Request to the TrafficJam API
+        response = make_request(http_method, url, payload, _params['timeout'])
 
     # Exit the module passing results back to Ansible
     succeeded = process_response(response)
 
     # Manage States Returned to Ansible - If Query, Nothing will ever be changed.
-    if succeeded and module.params['state'] == "query":
+    if succeeded and _params['state'] == "query":
         result['changed'] = False
         result['failed'] = False
     elif succeeded:
@@ -336,11 +381,56 @@ def run_module():
     result['status_code'] = response['status_code']
     result['response'] = response['response']
 
-    module.exit_json(**result)
+    return result
+
+
+def run_module():
+    # define available arguments/parameters a user can pass to the module
+    module_args = trafficjam_base_argspec()
+
+    config_spec = dict(
+        name=dict(type='str', required=False),
+        description=dict(type='str', required=False),
+        v4_address=dict(type='str', required=False),
+        v6_address=dict(type='str', required=False),
+        vrf_id=dict(type='int', required=False),
+        dummy_id=dict(type='int', required=False)
+    )
+
+    module_args.update(
+        subinterface=dict(type='bool', required=False, default=False),
+        state=dict(type='str', choices=['query', 'present', 'absent'], default='query'),
+        config=dict(type='dict', options=config_spec)
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=False,
+        mutually_exclusive=[
+            ['host', 'hosts'],
+            ['hosts', 'unix_socket']
+        ],
+        required_one_of=[
+            ['host', 'hosts']
+        ],
+        required_if=[
+            ['state', 'present', ['config']],
+            ['state', 'absent', ['config']]
+        ]
+    )
+
+    # Validate the nested config parameters, reporting every error at once
+    errors = validate(module.params)
+
+    if errors:
+        module.fail_json(msg='; '.join(errors), errors=errors, changed=False, response='', status_code='')
+
+    # Run the request against every TrafficJam instance and exit the module
+    run_on_hosts(module, execute, validate)
 
 
 def main():
-    run_module()
+    run_profiled(run_module)
 
 
 if __name__ == '__main__':
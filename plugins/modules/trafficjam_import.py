@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: trafficjam_import
+
+short_description: This module is used to bulk load objects from a file into the WWT ATC Tool TrafficJam
+
+version_added: "2.9"
+
+description:
+    - "This module is used to bulk load VRFs, dummy interfaces and subinterfaces from a CSV or JSON-lines file into the WWT ATC Tool TrafficJam"
+    - "The file is read in chunks of chunk_size rows, so memory use does not grow with the size of the file.
+      Every chunk is validated, compared against the objects TrafficJam holds at that moment, and applied concurrently
+      before the next chunk is read."
+    - "Objects which do not exist yet are created.  Existing objects whose fields differ from the row are updated, others are left untouched.
+      VRFs and subinterfaces are matched on their name and vlan_id, the tables of existing VRFs are never changed."
+    - "The file is read from the controller and copied to the managed host by the action plugin, without passing its content
+      through task variables.  Set remote_src to read a file which is already on the managed host."
+
+options:
+    host:
+        description:
+            - Address for TrafficJam instance.  Either host or hosts is required.
+        required: false
+    port:
+        description:
+            - HTTP Port for TrafficJam instance.  Defaults to 80, or 443 when scheme is https.
+        required: false
+    scheme:
+        description:
+            - Scheme used to reach the TrafficJam instance.
+        required: false
+        choices: ['http', 'https']
+        default: http
+    validate_certs:
+        description:
+            - Verify the TLS certificate of the TrafficJam instance when scheme is https.
+            - Only set to false against instances with a self-signed certificate.
+        required: false
+        type: bool
+        default: true
+    unix_socket:
+        description:
+            - Path of a unix domain socket to reach a TrafficJam instance on the same machine through, instead of TCP.
+            - Requests are sent as plain HTTP over the socket.  host and port still identify the instance and are sent as Host header.
+            - Mutually exclusive with hosts.
+        required: false
+        type: path
+    timeout:
+        description:
+            - HTTP Timeout
+        required: false
+        default: 10
+    hosts:
+        description:
+            - List of TrafficJam instances to load the same file into concurrently.
+            - Entries may include a port as host:port, otherwise port is used.
+            - Mutually exclusive with host.
+        required: false
+    max_workers:
+        description:
+            - Maximum number of concurrent requests per chunk, and of TrafficJam instances contacted concurrently when using hosts
+        required: false
+        default: 8
+    health_ttl:
+        description:
+            - Seconds a TrafficJam instance which could not be reached is marked down.
+              Tasks against it fail immediately while it is marked down, instead of waiting for timeout.
+            - The mark is shared by every task running on the same machine.  Once it expires, the next task probes the instance with a TCP connection.
+            - Set to 0 to disable.
+        required: false
+        default: 30
+    journal:
+        description:
+            - Path of a checkpoint journal making a large run resumable, see module_utils/journal.py.
+            - Write requests and batch entries are recorded once TrafficJam confirmed them.  When the run fails the journal is kept,
+              and rerunning the task skips everything it confirms instead of checking and sending it again.
+            - The journal is removed once a run succeeds.  Use one journal per TrafficJam instance.
+        required: false
+        type: path
+    batch:
+        description:
+            - List of complete parameter sets, one per loop item.  Set by the collection's action plugin when it coalesces a looped task, which the variable trafficjam_coalesce_loops enables.
+            - Entries run concurrently up to max_workers and return one result each under batch_results.
+            - GET requests are shared between entries, so every entry sees the state from before the batch started.
+        required: false
+    src:
+        description:
+            - Path of the file to import.  Relative paths are looked up in the files directory of the role or playbook, like the copy module does.
+            - With remote_src, the path of the file on the managed host.
+        required: true
+        type: path
+    remote_src:
+        description:
+            - Read src on the managed host instead of copying it from the controller.
+        required: false
+        type: bool
+        default: false
+    format:
+        description:
+            - Format of src.  Defaults to csv for files ending in .csv and to jsonl otherwise.
+            - A CSV file starts with a header row naming the fields of its columns.  Empty cells are left unset.
+            - A JSON-lines file holds one JSON object per line.  Empty lines are skipped.
+        required: false
+        choices: ['csv', 'jsonl']
+    kind:
+        description:
+            - Type of the objects in src, which determines their fields.
+            - vrfs rows have name and table.  A free table is allocated from vrf_table_range for rows without a table.
+            - dummies rows have name, description, vrf_id, v4_address and v6_address.
+            - physical_subinterfaces rows have physical_id, vlan_id, description, v4_address, v6_address, vrf_id and bridge_id.
+            - bridge_subinterfaces rows have bridge_id, vlan_id, description, vrf_id, v4_address and v6_address.
+            - name, or the parent id and vlan_id, are required.  Rows with other fields are rejected.
+        required: true
+        choices: ['vrfs', 'dummies', 'physical_subinterfaces', 'bridge_subinterfaces']
+    chunk_size:
+        description:
+            - Number of rows read, validated and applied at a time.
+        required: false
+        default: 1000
+    vrf_table_range:
+        description:
+            - First and last Routing Table ID (integer) used when allocating tables for vrfs rows.  Default is [1000, 65535].
+            - Tables 253 to 255 are reserved and never allocated.
+        required: false
+    progress_file:
+        description:
+            - Path of a file on the managed host which a JSON line is appended to after every chunk, carrying the counts so far.
+            - Follow it with tail -f to watch a long import.
+        required: false
+        type: path
+    stop_on_error:
+        description:
+            - Stop after the first chunk with invalid or failed rows, instead of importing the rest of the file and reporting every error at the end.
+        required: false
+        type: bool
+        default: false
+
+notes:
+    - Supports check mode, which validates the whole file and reports what would be created and updated without changing anything.
+    - The rows of each chunk are locked like the creates of the other modules, so concurrent tasks on the same machine do not make duplicates.
+      Duplicates made concurrently from other machines are resolved by keeping the object with the lowest id.
+    - Only the objects of the chunk being applied are held in memory, along with the listing of the collections it touches.
+
+author:
+    - Nick Thompson (nick.thompson@wwt.com)
+'''
+
+EXAMPLES = '''
+# Load the subinterfaces exported from IPAM
+- name: Import Physical Subinterfaces
+  trafficjam_import:
+    host: trafficjam
+    src: subinterfaces.csv
+    kind: physical_subinterfaces
+
+# A matching CSV file
+#   physical_id,vlan_id,description,v4_address
+#   3,100,Customer A,10.1.0.1/24
+#   3,101,Customer B,10.1.1.1/24
+
+# Load VRFs from a JSON-lines file, allocating tables for lines without one
+#   {"name": "customer-a", "table": 1100}
+#   {"name": "customer-b"}
+- name: Import VRFs
+  trafficjam_import:
+    host: trafficjam
+    src: vrfs.jsonl
+    kind: vrfs
+    vrf_table_range: [1100, 1999]
+
+# Check a large file against TrafficJam first, watching /tmp/import.progress
+- name: Plan Dummy Interface Import
+  trafficjam_import:
+    host: trafficjam
+    src: /data/exports/dummies.jsonl
+    remote_src: true
+    kind: dummies
+    progress_file: /tmp/import.progress
+  check_mode: true
+'''
+
+RETURN = '''
+rows:
+    description: Number of rows read from src
+    type: int
+    returned: always
+
+created:
+    description: Number of objects created, or which would be created in check mode
+    type: int
+    returned: always
+
+updated:
+    description: Number of existing objects updated, or which would be updated in check mode
+    type: int
+    returned: always
+
+unchanged:
+    description: Number of rows matching an existing object already, including objects created concurrently by another task
+    type: int
+    returned: always
+
+invalid:
+    description: Number of rows rejected by validation
+    type: int
+    returned: always
+
+failed_rows:
+    description: Number of valid rows TrafficJam did not accept
+    type: int
+    returned: always
+
+errors:
+    description:
+        - The first 100 rows which were invalid or failed, each with its line in src and msg.
+        - Failed rows also carry the status_code and response of TrafficJam.
+    type: list
+    returned: always
+
+chunks:
+    description: One summary per chunk with its first and last line and the counts of its rows, like the lines of progress_file
+    type: list
+    returned: always
+
+results:
+    description: Per-instance results when hosts is used.  Each entry carries host, port, changed, failed and the counts above.
+    type: list
+    returned: when hosts is used
+
+batch_results:
+    description: One result per entry of batch, in the same order.  Entries confirmed by the journal of an earlier run carry journaled and report no change.
+    type: list
+    returned: when batch is used
+
+trafficjam_requests:
+    description:
+        - Timing of every request made to TrafficJam, for the wwt.trafficjam.trafficjam callback plugin.
+        - Each entry is a list of method, url template, host, status_code, elapsed seconds, response bytes and retries.
+    type: list
+    returned: when TrafficJam was contacted
+
+trafficjam_journal:
+    description:
+        - Summary of the checkpoint journal when journal is set.
+        - Carries its path, whether it was kept for a rerun, the number of records written and the number of
+          write requests and batch entries skipped because an earlier run confirmed them.
+    type: dict
+    returned: when journal is set
+
+trafficjam_profile:
+    description:
+        - Profile summary when the TRAFFICJAM_PROFILE environment variable is set, see module_utils/profiling.py.
+        - Carries elapsed, memory_current, memory_peak, the top functions by cumulative time, the top allocation sites
+          and the paths of the pstats and allocations files written on the managed host.
+    type: dict
+    returned: when profiling is enabled
+'''
+
+import csv
+import json
+import time
+from itertools import islice
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wwt.trafficjam.plugins.module_utils.locking import object_locks
+from ansible_collections.wwt.trafficjam.plugins.module_utils.objects import (
+    KINDS,
+    normalize,
+    read_rows,
+    validate_rows
+)
+from ansible_collections.wwt.trafficjam.plugins.module_utils.profiling import run_profiled
+from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import (
+    allocate_tables,
+    api_url,
+    collection_lock_key,
+    describe_endpoint,
+    trafficjam_base_argspec,
+    make_request,
+    process_response,
+    reconcile_created,
+    run_concurrently,
+    run_on_hosts,
+    send_request
+)
+
+# Number of invalid and failed rows reported under errors
+MAX_ERRORS = 100
+
+
+def validate_chunk(_params, _chunk, _summary, _errors):
+    #
+    # Parse and validate the rows of a chunk.  Returns the valid rows as (line, row) tuples.
+    # Rejected rows are counted in _summary and added to _errors.
+    #
+    _valid = []
+    for _line, _row, _error in validate_rows(_params['kind'], _chunk):
+        if _error is not None:
+            reject(_summary, _errors, 'invalid', dict(line=_line, msg=_error))
+        else:
+            _valid.append((_line, _row))
+    return _valid
+
+
+def reject(_summary, _errors, _count, _error):
+    _summary[_count] += 1
+    if len(_errors) < MAX_ERRORS:
+        _errors.append(_error)
+
+
+def plan_chunk(_params, _rows, _live, _summary, _errors):
+    #
+    # Compare the valid rows of a chunk with the live objects of their collections.
+    # _live maps each collection path to its list of objects, or None when it could not be fetched.
+    # Returns the requests to make as dicts with line, method, path, payload and key.
+    #
+    _kind = _params['kind']
+    _spec = KINDS[_kind]
+    _operations = []
+    _unallocated = []
+
+    _indexes = {}
+    for _path, _objects in _live.items():
+        if _objects is not None:
+            _indexes[_path] = dict((normalize(_spec['key'], _object.get(_spec['key'])), _object) for _object in _objects)
+
+    for _line, _row in _rows:
+        _path = _spec['path'].format(**_row)
+        if _path not in _indexes:
+            reject(_summary, _errors, 'failed', dict(line=_line, msg=f"unable to fetch {_path}"))
+            continue
+
+        _existing = _indexes[_path].get(_row[_spec['key']])
+        if _existing is None:
+            _payload = dict((_field, _row[_field]) for _field in _spec['fields'] if _field != _spec['parent'])
+            _operations.append(dict(line=_line, method="post", path=_path, payload=_payload, key=_row[_spec['key']]))
+            if _kind == 'vrfs' and _payload['table'] is None:
+                _unallocated.append(_payload)
+            continue
+
+        if _kind == 'vrfs' and _row['table'] is not None and normalize('table', _existing.get('table')) != _row['table']:
+            reject(_summary, _errors, 'failed', dict(line=_line, msg=f"vrf {_row['name']} exists with table {_existing.get('table')}, "
+                                                                     f"the table of a VRF cannot be changed"))
+            continue
+
+        _changed = [_field for _field in _spec['updates']
+                    if _row[_field] is not None and normalize(_field, _existing.get(_field)) != _row[_field]]
+        if not _changed:
+            _summary['unchanged'] += 1
+            continue
+
+        _payload = dict((_field, _row[_field]) for _field in _spec['updates'])
+        _operations.append(dict(line=_line, method="put", path=f"{_path}/{_existing['id']}", payload=_payload, key=None))
+
+    # Tables are allocated for the whole chunk at once, around the tables in use and those the chunk asks for
+    if _unallocated:
+        _used = list(_live['vrfs']) + [dict(table=_operation['payload']['table']) for _operation in _operations]
+        _tables = allocate_tables(_used, len(_unallocated), _params['vrf_table_range'])
+        for _payload, _table in zip(_unallocated, _tables):
+            _payload['table'] = _table
+
+        _short = [_operation for _operation in _operations if _operation['method'] == "post" and _operation['payload']['table'] is None]
+        for _operation in _short:
+            reject(_summary, _errors, 'failed', dict(line=_operation['line'], msg="no free routing table left in vrf_table_range"))
+        _operations = [_operation for _operation in _operations if _operation not in _short]
+
+    return _operations
+
+
+def fetch_live(_params, _paths):
+    # Fetch the collections a chunk touches concurrently.  The listings are read fresh, not from the shared reads of a batch.
+    def fetch(_path):
+        _response = send_request("get", api_url(_params, _path), None, _params['timeout'])
+        if not process_response(_response) or not isinstance(_response['response'], list):
+            return None
+        return _response['response']
+
+    return dict(zip(_paths, run_concurrently(fetch, _paths, _params['max_workers'])))
+
+
+def apply_chunk(_params, _rows, _summary, _errors, _check_mode):
+    # Diff the valid rows of a chunk against TrafficJam and make the requests concurrently
+    _kind = _params['kind']
+    _spec = KINDS[_kind]
+    _paths = sorted(set(_spec['path'].format(**_row) for _line, _row in _rows))
+
+    # Locked like create_exclusive locks them, so the other modules' creates of the same objects wait for the chunk
+    if _kind == 'vrfs':
+        _keys = [collection_lock_key(_params, "vrfs", 'tables')]
+    else:
+        _keys = [collection_lock_key(_params, _spec['path'].format(**_row), f"{_spec['key']}={_row[_spec['key']]}") for _line, _row in _rows]
+
+    with object_locks([] if _check_mode else _keys):
+        _operations = plan_chunk(_params, _rows, fetch_live(_params, _paths), _summary, _errors)
+
+        def apply(_operation):
+            return make_request(_operation['method'], api_url(_params, _operation['path']), _operation['payload'], _params['timeout'])
+
+        _responses = [None] * len(_operations) if _check_mode else run_concurrently(apply, _operations, _params['max_workers'])
+
+    _created = {}
+    for _operation, _response in zip(_operations, _responses):
+        if _response is not None and not process_response(_response):
+            reject(_summary, _errors, 'failed', dict(line=_operation['line'], msg=f"{_operation['method'].upper()} {_operation['path']} failed",
+                                                     status_code=_response['status_code'], response=_response['response']))
+        elif _operation['method'] == "post":
+            _summary['created'] += 1
+            if _response is not None and isinstance(_response['response'], dict):
+                _created.setdefault(_operation['path'], {})[_operation['key']] = _response['response'].get('id')
+        else:
+            _summary['updated'] += 1
+
+    # Objects created concurrently from other machines are resolved like create_exclusive resolves them
+    for _path, _ids in _created.items():
+        _kept = reconcile_created(_params, _path, _spec['key'], _ids)
+        _summary['created'] -= len(_kept)
+        _summary['unchanged'] += len(_kept)
+
+
+def report_progress(_params, _progress):
+    # One JSON line per chunk, flushed so the file can be followed while the import runs
+    if _params['progress_file'] is None:
+        return
+    with open(_params['progress_file'], 'a') as _file:
+        _file.write(json.dumps(_progress) + '\n')
+
+
+def execute(_params, _check_mode):
+    result = dict(
+        changed=False,
+        rows=0,
+        created=0,
+        updated=0,
+        unchanged=0,
+        invalid=0,
+        failed_rows=0,
+        errors=[],
+        chunks=[]
+    )
+
+    _started = time.monotonic()
+    _total = dict(rows=0, created=0, updated=0, unchanged=0, invalid=0, failed=0)
+
+    _reader = read_rows(_params['src'], _params['format'], _params['kind'])
+    while True:
+        # Only chunk_size rows are read ahead of the requests
+        try:
+            _chunk = list(islice(_reader, _params['chunk_size']))
+        except (OSError, UnicodeDecodeError, ValueError, csv.Error) as _error:
+            result['msg'] = f"unable to read {_params['src']}: {_error}"
+            break
+        if not _chunk:
+            break
+
+        _summary = dict(rows=len(_chunk), created=0, updated=0, unchanged=0, invalid=0, failed=0)
+        _rows = validate_chunk(_params, _chunk, _summary, result['errors'])
+        if _rows:
+            apply_chunk(_params, _rows, _summary, result['errors'], _check_mode)
+
+        for _count in _total:
+            _total[_count] += _summary[_count]
+        _progress = dict(_summary, chunk=len(result['chunks']) + 1, first_line=_chunk[0][0], last_line=_chunk[-1][0],
+                         host=describe_endpoint(_params), total=dict(_total), elapsed=round(time.monotonic() - _started, 3))
+        result['chunks'].append(_progress)
+        report_progress(_params, _progress)
+
+        if _params['stop_on_error'] and (_summary['invalid'] or _summary['failed']):
+            break
+
+    result.update(rows=_total['rows'], created=_total['created'], updated=_total['updated'], unchanged=_total['unchanged'],
+                  invalid=_total['invalid'], failed_rows=_total['failed'])
+    result['changed'] = bool(_total['created'] or _total['updated'])
+
+    if 'msg' not in result and (_total['invalid'] or _total['failed']):
+        result['msg'] = f"{_total['invalid']} invalid and {_total['failed']} failed row(s) of {_total['rows']} in {_params['src']}"
+    result['failed'] = 'msg' in result
+    return result
+
+
+def validate(_params):
+    # Returns every error found in the parameters which the argument spec cannot express
+    _errors = []
+    if _params['chunk_size'] < 1:
+        _errors.append("chunk_size must be at least 1")
+    if len(_params['vrf_table_range']) != 2 or _params['vrf_table_range'][0] > _params['vrf_table_range'][1]:
+        _errors.append("vrf_table_range must be [first, last]")
+    return _errors
+
+
+def run_module():
+    # define available arguments/parameters a user can pass to the module
+    module_args = trafficjam_base_argspec()
+    module_args.update(
+        src=dict(type='path', required=True),
+        remote_src=dict(type='bool', required=False, default=False),
+        format=dict(type='str', required=False, choices=['csv', 'jsonl']),
+        kind=dict(type='str', required=True, choices=list(KINDS)),
+        chunk_size=dict(type='int', required=False, default=1000),
+        vrf_table_range=dict(type='list', elements='int', required=False, default=[1000, 65535]),
+        progress_file=dict(type='path', required=False),
+        stop_on_error=dict(type='bool', required=False, default=False)
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=True,
+        mutually_exclusive=[
+            ['host', 'hosts'],
+            ['hosts', 'unix_socket']
+        ],
+        required_one_of=[
+            ['host', 'hosts']
+        ]
+    )
+
+    errors = validate(module.params)
+    if errors:
+        module.fail_json(msg='; '.join(errors), errors=errors, changed=False)
+
+    # Run the import against every TrafficJam instance and exit the module
+    run_on_hosts(module, lambda _params: execute(_params, module.check_mode), validate)
+
+
+def main():
+    run_profiled(run_module)
+
+
+if __name__ == '__main__':
+    main()
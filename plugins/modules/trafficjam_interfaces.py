@@ -23,16 +23,61 @@ description:
 options:
     host:
         description:
-            - Address for TrafficJam instance
-        required: true
+            - Address for TrafficJam instance.  Either host or hosts is required.
+        required: false
     port:
         description:
-            - HTTP Port for TrafficJam instance.  Default is 80.
+            - HTTP Port for TrafficJam instance.  Default is 80, or 443 when scheme is https.
+        required: false
+    scheme:
+        description:
+            - Scheme used to reach the TrafficJam instance, http or https.  Default is http.
+        required: false
+    validate_certs:
+        description:
+            - Verify the TLS certificate of the TrafficJam instance when scheme is https.  Default is true.
+            - Only set to false against instances with a self-signed certificate.
+        required: false
+    unix_socket:
+        description:
+            - Path of a unix domain socket to reach a TrafficJam instance on the same machine through, instead of TCP.
+            - Requests are sent as plain HTTP over the socket.  host and port still identify the instance and are sent as Host header.
+            - Mutually exclusive with hosts.
         required: false
     timeout:
         description:
             - HTTP Timeout.  Default is 10s.
         required: false
+    hosts:
+        description:
+            - List of TrafficJam instances to apply the same request to concurrently.
+            - Entries may include a port as host:port, otherwise port is used.
+            - Mutually exclusive with host.
+        required: false
+    max_workers:
+        description:
+            - Maximum number of TrafficJam instances contacted concurrently when using hosts.  Default is 8.
+        required: false
+    health_ttl:
+        description:
+            - Seconds a TrafficJam instance which could not be reached is marked down.
+              Tasks against it fail immediately while it is marked down, instead of waiting for timeout.  Default is 30.
+            - The mark is shared by every task running on the same machine.  Once it expires, the next task probes the instance with a TCP connection.
+            - Set to 0 to disable.
+        required: false
+    journal:
+        description:
+            - Path of a checkpoint journal making a large run resumable, see module_utils/journal.py.
+            - Write requests and batch entries are recorded once TrafficJam confirmed them.  When the run fails the journal is kept,
+              and rerunning the task skips everything it confirms instead of checking and sending it again.
+            - The journal is removed once a run succeeds.  Use one journal per TrafficJam instance.
+        required: false
+    batch:
+        description:
+            - List of complete parameter sets, one per loop item.  Set by the collection's action plugin when it coalesces a looped task, which the variable trafficjam_coalesce_loops enables.
+            - Entries run concurrently up to max_workers and return one result each under batch_results.
+            - GET requests are shared between entries, so every entry sees the state from before the batch started.
+        required: false
     state:
         description:
             - Parameter to determine module behavior.  (query) - Default: query
@@ -48,6 +93,13 @@ EXAMPLES = '''
   trafficjam_interfaces:
     host: trafficjam
     state: query
+
+# Get Information from the Interfaces of several TrafficJam instances
+- name: Get Interface Information from all instances
+  trafficjam_interfaces:
+    hosts: "{{ groups['trafficjam'] }}"
+    max_workers: 16
+    state: query
 '''
 
 RETURN = '''
@@ -60,24 +112,62 @@ status_code:
     description: The HTTP Status Code returned by TrafficJam
     type: int
     returned: always
+
+results:
+    description: Per-instance results when hosts is used.  Each entry carries host, port, changed, failed, response and status_code.
+    type: list
+    returned: when hosts is used
+
+batch_results:
+    description: One result per entry of batch, in the same order.  Entries confirmed by the journal of an earlier run carry journaled and report no change.
+    type: list
+    returned: when batch is used
+
+trafficjam_requests:
+    description:
+        - Timing of every request made to TrafficJam, for the wwt.trafficjam.trafficjam callback plugin.
+        - Each entry is a list of method, url template, host, status_code, elapsed seconds, response bytes and retries.
+    type: list
+    returned: when TrafficJam was contacted
+
+trafficjam_journal:
+    description:
+        - Summary of the checkpoint journal when journal is set.
+        - Carries its path, whether it was kept for a rerun, the number of records written and the number of
+          write requests and batch entries skipped because an earlier run confirmed them.
+    type: dict
+    returned: when journal is set
+
+trafficjam_profile:
+    description:
+        - Profile summary when the TRAFFICJAM_PROFILE environment variable is set, see module_utils/profiling.py.
+        - Carries elapsed, memory_current, memory_peak, the top functions by cumulative time, the top allocation sites
+          and the paths of the pstats and allocations files written on the managed host.
+    type: dict
+    returned: when profiling is enabled
 '''
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import trafficjam_base_argspec, make_request, process_response
+from ansible_collections.wwt.trafficjam.plugins.module_utils.profiling import run_profiled
+from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import (
+    api_url,
+    trafficjam_base_argspec,
+    make_request,
+    process_response,
+    run_on_hosts
+)
 
 
 def generate_url(_params):
     # Gather Parameters
     _state = _params['state']
-    _host = _params['host']
-    _port = _params['port']
 
     # Default _payload to None.  If required, this will be set below.
     _payload = None
 
     # Generate URL for Query Requests
     if _state == "query":
-        _url = f"http://{_host}:{_port}/trafficjam/api/interfaces"
+        _url = api_url(_params, "interfaces")
         _http_method = "get"
 
         # Construct a dictionary to return results with
@@ -85,14 +175,7 @@ def generate_url(_params):
         return _response_dict
 
 
-def run_module():
-    # define available arguments/parameters a user can pass to the module
-    module_args = trafficjam_base_argspec()
-
-    module_args.update(
-        state=dict(type='str', choices=['query'], default='query')
-    )
-
+def execute(_params):
     # seed the result dict in the object
     # we primarily care about changed and the response data
     # change is if this module effectively modified the target
@@ -104,20 +187,15 @@ def run_module():
         status_code=''
     )
 
-    module = AnsibleModule(
-        argument_spec=module_args,
-        supports_check_mode=False
-    )
-
     # Generate the URL, HTTP Method, and Optional Payload based on Module Parameters
-    url_response = generate_url(module.params)
+    url_response = generate_url(_params)
 
     url = url_response['url']
     http_method = url_response['http_method']
     payload = url_response['data']
 
     # Generate the Request to the TrafficJam API
-    response = make_request(http_method, url, payload, module.params['timeout'])
+    response = make_request(http_method, url, payload, _params['timeout'])
 
     # Exit the module passing results back to Ansible
     succeeded = process_response(response)
@@ -132,11 +210,35 @@ def run_module():
     result['status_code'] = response['status_code']
     result['response'] = response['response']
 
-    module.exit_json(**result)
+    return result
+
+
+def run_module():
+    # define available arguments/parameters a user can pass to the module
+    module_args = trafficjam_base_argspec()
+
+    module_args.update(
+        state=dict(type='str', choices=['query'], default='query')
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=False,
+        mutually_exclusive=[
+            ['host', 'hosts'],
+            ['hosts', 'unix_socket']
+        ],
+        required_one_of=[
+            ['host', 'hosts']
+        ]
+    )
+
+    # Run the request against every TrafficJam instance and exit the module
+    run_on_hosts(module, execute)
 
 
 def main():
-    run_module()
+    run_profiled(run_module)
 
 
 if __name__ == '__main__':
@@ -23,18 +23,70 @@ description:
 options:
     host:
         description:
-            - Address for TrafficJam instance
-        required: true
+            - Address for TrafficJam instance.  Either host or hosts is required.
+        required: false
     port:
         description:
-            - HTTP Port for TrafficJam instance
+            - HTTP Port for TrafficJam instance.  Defaults to 80, or 443 when scheme is https.
+        required: false
+    scheme:
+        description:
+            - Scheme used to reach the TrafficJam instance.
         required: false
-        default: 80
+        choices: ['http', 'https']
+        default: http
+    validate_certs:
+        description:
+            - Verify the TLS certificate of the TrafficJam instance when scheme is https.
+            - Only set to false against instances with a self-signed certificate.
+        required: false
+        type: bool
+        default: true
+    unix_socket:
+        description:
+            - Path of a unix domain socket to reach a TrafficJam instance on the same machine through, instead of TCP.
+            - Requests are sent as plain HTTP over the socket.  host and port still identify the instance and are sent as Host header.
+            - Mutually exclusive with hosts.
+        required: false
+        type: path
     timeout:
         description:
             - HTTP Timeout
         required: false
         default: 10
+    hosts:
+        description:
+            - List of TrafficJam instances to apply the same request to concurrently.
+            - Entries may include a port as host:port, otherwise port is used.
+            - Mutually exclusive with host.
+        required: false
+    max_workers:
+        description:
+            - Maximum number of TrafficJam instances contacted concurrently when using hosts
+        required: false
+        default: 8
+    health_ttl:
+        description:
+            - Seconds a TrafficJam instance which could not be reached is marked down.
+              Tasks against it fail immediately while it is marked down, instead of waiting for timeout.
+            - The mark is shared by every task running on the same machine.  Once it expires, the next task probes the instance with a TCP connection.
+            - Set to 0 to disable.
+        required: false
+        default: 30
+    journal:
+        description:
+            - Path of a checkpoint journal making a large run resumable, see module_utils/journal.py.
+            - Write requests and batch entries are recorded once TrafficJam confirmed them.  When the run fails the journal is kept,
+              and rerunning the task skips everything it confirms instead of checking and sending it again.
+            - The journal is removed once a run succeeds.  Use one journal per TrafficJam instance.
+        required: false
+        type: path
+    batch:
+        description:
+            - List of complete parameter sets, one per loop item.  Set by the collection's action plugin when it coalesces a looped task, which the variable trafficjam_coalesce_loops enables.
+            - Entries run concurrently up to max_workers and return one result each under batch_results.
+            - GET requests are shared between entries, so every entry sees the state from before the batch started.
+        required: false
     state:
         description:
             - Parameter to determine module behavior.
@@ -106,16 +158,54 @@ status_code:
     description: The HTTP Status Code returned by TrafficJam
     type: int
     returned: always
+
+results:
+    description: Per-instance results when hosts is used.  Each entry carries host, port, changed, failed, response and status_code.
+    type: list
+    returned: when hosts is used
+
+batch_results:
+    description: One result per entry of batch, in the same order.  Entries confirmed by the journal of an earlier run carry journaled and report no change.
+    type: list
+    returned: when batch is used
+
+trafficjam_requests:
+    description:
+        - Timing of every request made to TrafficJam, for the wwt.trafficjam.trafficjam callback plugin.
+        - Each entry is a list of method, url template, host, status_code, elapsed seconds, response bytes and retries.
+    type: list
+    returned: when TrafficJam was contacted
+
+trafficjam_journal:
+    description:
+        - Summary of the checkpoint journal when journal is set.
+        - Carries its path, whether it was kept for a rerun, the number of records written and the number of
+          write requests and batch entries skipped because an earlier run confirmed them.
+    type: dict
+    returned: when journal is set
+
+trafficjam_profile:
+    description:
+        - Profile summary when the TRAFFICJAM_PROFILE environment variable is set, see module_utils/profiling.py.
+        - Carries elapsed, memory_current, memory_peak, the top functions by cumulative time, the top allocation sites
+          and the paths of the pstats and allocations files written on the managed host.
+    type: dict
+    returned: when profiling is enabled
 '''
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import trafficjam_base_argspec, make_request, process_response
+from ansible_collections.wwt.trafficjam.plugins.module_utils.profiling import run_profiled
+from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import (
+    api_url,
+    trafficjam_base_argspec,
+    make_request,
+    process_response,
+    run_on_hosts
+)
 
 
 def generate_url(_params):
     # Gather Parameters
-    _host = _params['host']
-    _port = _params['port']
 
     # Default _payload to None.  If required, this will be set below.
     _payload = None
@@ -124,7 +214,7 @@ def generate_url(_params):
     if _params['state'] == "query":
         # Generate URLs for Loopback Interface requests
         if (_params['config'] is None) or (_params['config'] is not None):
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/loopback"
+            _url = api_url(_params, "interfaces/loopback")
             _http_method = "get"
 
             # Construct a dictionary to return results with
@@ -135,7 +225,7 @@ def generate_url(_params):
     if _params['state'] == "present":
         # Generate URLs for Loopback Interface requests
         if (_params['config'] is not None) and ((_params['config']['description'] is not None or _params['config']['vrf_id'] is not None or _params['config']['v4_address'] is not None or _params['config']['v6_address'] is not None)):
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/loopback"
+            _url = api_url(_params, "interfaces/loopback")
             _http_method = "put"
             _payload = {
                 "description": _params['config']['description'],
@@ -151,7 +241,7 @@ def generate_url(_params):
     # Generate URL for Absent Requests
     if _params['state'] == "absent":
         if (_params['config'] is not None) and ((_params['config']['description'] is not None or _params['config']['vrf_id'] is not None or _params['config']['v4_address'] is not None or _params['config']['v6_address'] is not None)):
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/loopback"
+            _url = api_url(_params, "interfaces/loopback")
             _http_method = "delete"
             _payload = {
                 "description": _params['config']['description'],
@@ -165,23 +255,7 @@ def generate_url(_params):
             return _response_dict
 
 
-def run_module():
-    # define available arguments/parameters a user can pass to the module
-    module_args = trafficjam_base_argspec()
-
-    config_spec = dict(
-        description=dict(type='str', required=False),
-        v4_address=dict(type='str', required=False),
-        v6_address=dict(type='str', required=False),
-        vrf_id=dict(type='int', required=False)
-    )
-
-    module_args.update(
-        subinterface=dict(type='bool', required=False, default=False),
-        state=dict(type='str', choices=['query', 'present', 'absent'], default='query'),
-        config=dict(type='dict', options=config_spec)
-    )
-
+def execute(_params):
     # seed the result dict in the object
     # we primarily care about changed and the response data
     # change is if this module effectively modified the target
@@ -193,30 +267,21 @@ def run_module():
         status_code=''
     )
 
-    module = AnsibleModule(
-        argument_spec=module_args,
-        supports_check_mode=False,
-        required_if=[
-            ['state', 'present', ['config']],
-            ['state', 'absent', ['config']]
-        ]
-    )
-
     # Generate the URL and HTTP Method based on Module Parameters
-    url_response = generate_url(module.params)
+    url_response = generate_url(_params)
 
     url = url_response['url']
     http_method = url_response['http_method']
     payload = url_response['data']
 
     # Generate the Request to the TrafficJam API
-    response = make_request(http_method, url, payload, module.params['timeout'])
+    response = make_request(http_method, url, payload, _params['timeout'])
 
     # Exit the module passing results back to Ansible
     succeeded = process_response(response)
 
     # Manage States Returned to Ansible - If Query, Nothing will ever be changed.
-    if succeeded and module.params['state'] == "query":
+    if succeeded and _params['state'] == "query":
         result['changed'] = False
         result['failed'] = False
     elif succeeded:
@@ -228,11 +293,48 @@ def run_module():
     result['status_code'] = response['status_code']
     result['response'] = response['response']
 
-    module.exit_json(**result)
+    return result
+
+
+def run_module():
+    # define available arguments/parameters a user can pass to the module
+    module_args = trafficjam_base_argspec()
+
+    config_spec = dict(
+        description=dict(type='str', required=False),
+        v4_address=dict(type='str', required=False),
+        v6_address=dict(type='str', required=False),
+        vrf_id=dict(type='int', required=False)
+    )
+
+    module_args.update(
+        subinterface=dict(type='bool', required=False, default=False),
+        state=dict(type='str', choices=['query', 'present', 'absent'], default='query'),
+        config=dict(type='dict', options=config_spec)
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=False,
+        mutually_exclusive=[
+            ['host', 'hosts'],
+            ['hosts', 'unix_socket']
+        ],
+        required_one_of=[
+            ['host', 'hosts']
+        ],
+        required_if=[
+            ['state', 'present', ['config']],
+            ['state', 'absent', ['config']]
+        ]
+    )
+
+    # Run the request against every TrafficJam instance and exit the module
+    run_on_hosts(module, execute)
 
 
 def main():
-    run_module()
+    run_profiled(run_module)
 
 
 if __name__ == '__main__':
@@ -23,18 +23,70 @@ description:
 options:
     host:
         description:
-            - Address for TrafficJam instance
-        required: true
+            - Address for TrafficJam instance.  Either host or hosts is required.
+        required: false
     port:
         description:
-            - HTTP Port for TrafficJam instance
+            - HTTP Port for TrafficJam instance.  Defaults to 80, or 443 when scheme is https.
+        required: false
+    scheme:
+        description:
+            - Scheme used to reach the TrafficJam instance.
+        required: false
+        choices: ['http', 'https']
+        default: http
+    validate_certs:
+        description:
+            - Verify the TLS certificate of the TrafficJam instance when scheme is https.
+            - Only set to false against instances with a self-signed certificate.
+        required: false
+        type: bool
+        default: true
+    unix_socket:
+        description:
+            - Path of a unix domain socket to reach a TrafficJam instance on the same machine through, instead of TCP.
+            - Requests are sent as plain HTTP over the socket.  host and port still identify the instance and are sent as Host header.
+            - Mutually exclusive with hosts.
         required: false
-        default: 80
+        type: path
     timeout:
         description:
             - HTTP Timeout
         required: false
         default: 10
+    hosts:
+        description:
+            - List of TrafficJam instances to apply the same request to concurrently.
+            - Entries may include a port as host:port, otherwise port is used.
+            - Mutually exclusive with host.
+        required: false
+    max_workers:
+        description:
+            - Maximum number of TrafficJam instances contacted concurrently when using hosts
+        required: false
+        default: 8
+    health_ttl:
+        description:
+            - Seconds a TrafficJam instance which could not be reached is marked down.
+              Tasks against it fail immediately while it is marked down, instead of waiting for timeout.
+            - The mark is shared by every task running on the same machine.  Once it expires, the next task probes the instance with a TCP connection.
+            - Set to 0 to disable.
+        required: false
+        default: 30
+    journal:
+        description:
+            - Path of a checkpoint journal making a large run resumable, see module_utils/journal.py.
+            - Write requests and batch entries are recorded once TrafficJam confirmed them.  When the run fails the journal is kept,
+              and rerunning the task skips everything it confirms instead of checking and sending it again.
+            - The journal is removed once a run succeeds.  Use one journal per TrafficJam instance.
+        required: false
+        type: path
+    batch:
+        description:
+            - List of complete parameter sets, one per loop item.  Set by the collection's action plugin when it coalesces a looped task, which the variable trafficjam_coalesce_loops enables.
+            - Entries run concurrently up to max_workers and return one result each under batch_results.
+            - GET requests are shared between entries, so every entry sees the state from before the batch started.
+        required: false
     subinterface:
         description:
             - Enable Subinterface mode
@@ -81,6 +133,12 @@ options:
         description:
             - ID (integer) of an existing physical interface
         required: false
+    physical_ids:
+        description:
+            - List of IDs (integers) of existing physical interfaces, to query the subinterfaces of all of them in one task
+            - With subinterface and state query, leaving out both physical_id and physical_ids queries the subinterfaces of every physical interface
+            - The physical interfaces are fetched concurrently up to max_workers, and every subinterface returned carries its physical_id
+        required: false
     subinterface_id:
         description:
             - ID (integer) of the subinterface
@@ -97,6 +155,11 @@ options:
             - Maximum Transmission Unit (integer) setting of the physical interface
         required: false
 
+notes:
+    - Creates check that the object does not exist and POST it while holding a lock shared by every task on the same machine,
+      so concurrent tasks can create objects at full parallelism without making duplicates.  Duplicates made concurrently from
+      other machines are detected after the POST and resolved by keeping the object with the lowest id.
+
 author:
     - Nick Thompson (nick.thompson@wwt.com)
 '''
@@ -125,6 +188,23 @@ EXAMPLES = '''
     config:
         physical_id: 3
 
+# Get Information for the Subinterfaces of every Physical Interface, each carrying its physical_id
+- name: Get All Physical Subinterface Information
+  trafficjam_physical_interfaces:
+    host: trafficjam
+    subinterface: true
+    state: query
+    max_workers: 32
+
+# Get Information for the Subinterfaces of several Physical Interfaces
+- name: Get Physical Subinterface Information for several Physical Interfaces
+  trafficjam_physical_interfaces:
+    host: trafficjam
+    subinterface: true
+    state: query
+    config:
+        physical_ids: [1, 2, 3]
+
 # Get Information for a specific Physical Subinterface
 - name: Get Specific Physical Subinterface Information
   trafficjam_physical_interfaces:
@@ -200,60 +280,88 @@ status_code:
     description: The HTTP Status Code returned by TrafficJam
     type: int
     returned: always
+
+results:
+    description: Per-instance results when hosts is used.  Each entry carries host, port, changed, failed, response and status_code.
+    type: list
+    returned: when hosts is used
+
+errors:
+    description: Every validation error found in config
+    type: list
+    returned: on validation failure
+
+batch_results:
+    description: One result per entry of batch, in the same order.  Entries confirmed by the journal of an earlier run carry journaled and report no change.
+    type: list
+    returned: when batch is used
+
+trafficjam_requests:
+    description:
+        - Timing of every request made to TrafficJam, for the wwt.trafficjam.trafficjam callback plugin.
+        - Each entry is a list of method, url template, host, status_code, elapsed seconds, response bytes and retries.
+    type: list
+    returned: when TrafficJam was contacted
+
+trafficjam_journal:
+    description:
+        - Summary of the checkpoint journal when journal is set.
+        - Carries its path, whether it was kept for a rerun, the number of records written and the number of
+          write requests and batch entries skipped because an earlier run confirmed them.
+    type: dict
+    returned: when journal is set
+
+trafficjam_profile:
+    description:
+        - Profile summary when the TRAFFICJAM_PROFILE environment variable is set, see module_utils/profiling.py.
+        - Carries elapsed, memory_current, memory_peak, the top functions by cumulative time, the top allocation sites
+          and the paths of the pstats and allocations files written on the managed host.
+    type: dict
+    returned: when profiling is enabled
 '''
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wwt.trafficjam.plugins.module_utils.profiling import run_profiled
 from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import (
+    api_url,
+    create_exclusive,
     trafficjam_base_argspec,
     make_request,
-    parse_query_return,
-    process_response
+    process_response,
+    query_subinterfaces,
+    run_on_hosts
+)
+from ansible_collections.wwt.trafficjam.plugins.module_utils.validation import (
+    compile_constraints,
+    validate_params
 )
 
 
-def scrub_params(_params):
-    #
-    # The builtin methods for scrubbing parameters do not handle nested dictionaries,
-    # so we have to do it here
-    #
-
+# Constraints on the nested config parameters, validated by module_utils.validation
+CONSTRAINTS = compile_constraints([
     # Some parameters are mutually exclusive
-    if _params['config'] is not None and _params['config']['subinterface_id'] is not None and _params['config']['vlan_id'] is not None:
-        _errormsg = "parameter subinterface_id is mutually exclusive with vlan_id"
-        return _errormsg
+    dict(mutually_exclusive=['physical_id', 'physical_ids']),
+    dict(mutually_exclusive=['subinterface_id', 'vlan_id']),
 
     # Some parameters have dependencies
-    if not _params['subinterface']:
-        if _params['state'] == "present":
-            if (_params['config'] is not None and _params['config']['physical_id'] is None):
-                _errormsg = "missing parameter(s) required: physical_id"
-                return _errormsg
-
-    if _params['subinterface']:
-        if _params['state'] == "query":
-            if (_params['subinterface'] and _params['config'] is None) or (_params['subinterface'] and _params['config']['physical_id'] is None):
-                _errormsg = "missing parameter(s) required by 'subinterface': physical_id"
-                return _errormsg
-
-        if _params['state'] == "present":
-            if (_params['subinterface'] and _params['config'] is None):
-                _errormsg = "missing parameter(s) required by 'subinterface': physical_id|vlan_id or physical_id|subinterface_id"
-                return _errormsg
-            elif (_params['subinterface'] and _params['config']['physical_id'] and _params['config']['vlan_id'] and _params['config']['subinterface_id'] is None):
-                _errormsg = None
-                return _errormsg
-            elif (_params['subinterface'] and _params['config']['physical_id'] and _params['config']['subinterface_id'] and _params['config']['vlan_id'] is None):
-                _errormsg = None
-                return _errormsg
-            else:
-                _errormsg = "missing parameter(s) required by 'subinterface': physical_id|vlan_id or physical_id|subinterface_id"
-                return _errormsg
+    dict(required_one_of=[['physical_id']], when=dict(state='present', subinterface=False)),
+    dict(required_one_of=[['physical_id']], when=dict(state='absent', subinterface=False)),
+    dict(required_one_of=[['physical_id', 'vlan_id'], ['physical_id', 'subinterface_id']],
+         when=dict(state='present', subinterface=True), required_by='subinterface'),
+    dict(required_one_of=[['physical_id', 'subinterface_id']], when=dict(state='absent', subinterface=True), required_by='subinterface')
+])
+
+
+def validate(_params):
+    # Returns every error found in the nested config parameters
+    _errors = validate_params(CONSTRAINTS, _params)
+    if (_params['config'] or {}).get('physical_ids') is not None and not (_params['state'] == 'query' and _params['subinterface']):
+        _errors.append("parameter physical_ids is only supported when querying subinterfaces")
+    return _errors
 
 
 def generate_url(_params):
     # Gather Parameters
-    _host = _params['host']
-    _port = _params['port']
 
     # Default _payload to None.  If required, this will be set below.
     _payload = None
@@ -262,7 +370,7 @@ def generate_url(_params):
     if _params['state'] == "query":
         # Generate URLs for non-subinterface requests
         if (not _params['subinterface'] and _params['config'] is None) or (not _params['subinterface'] and _params['config']['physical_id'] is None):
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/physicals"
+            _url = api_url(_params, "interfaces/physicals")
             _http_method = "get"
 
             # Construct a dictionary to return results with
@@ -270,7 +378,7 @@ def generate_url(_params):
             return _response_dict
 
         elif not _params['subinterface'] and _params['config']['physical_id']:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/physicals/{_params['config']['physical_id']}"
+            _url = api_url(_params, f"interfaces/physicals/{_params['config']['physical_id']}")
             _http_method = "get"
 
             # Construct a dictionary to return results with
@@ -279,7 +387,7 @@ def generate_url(_params):
 
         # Generate URLs for subinterface requests
         if _params['subinterface'] and _params['config']['physical_id'] and _params['config']['subinterface_id'] is None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/physicals/{_params['config']['physical_id']}/subinterfaces"
+            _url = api_url(_params, f"interfaces/physicals/{_params['config']['physical_id']}/subinterfaces")
             _http_method = "get"
 
             # Construct a dictionary to return results with
@@ -287,7 +395,7 @@ def generate_url(_params):
             return _response_dict
 
         if _params['subinterface'] and _params['config']['physical_id'] and _params['config']['subinterface_id']:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/physicals/{_params['config']['physical_id']}/subinterfaces/{_params['config']['subinterface_id']}"
+            _url = api_url(_params, f"interfaces/physicals/{_params['config']['physical_id']}/subinterfaces/{_params['config']['subinterface_id']}")
             _http_method = "get"
 
             # Construct a dictionary to return results with
@@ -299,7 +407,7 @@ def generate_url(_params):
         # Generate URLs for non-subinterface requests.
         # All of these use the PUT method as we update an existing physical interface.
         if not _params['subinterface'] and _params['config']['physical_id'] is not None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/physicals/{_params['config']['physical_id']}"
+            _url = api_url(_params, f"interfaces/physicals/{_params['config']['physical_id']}")
             _http_method = "put"
             _payload = {
                 "description": _params['config']['description'],
@@ -316,7 +424,7 @@ def generate_url(_params):
 
         # Generate URLs for subinterface requests
         if _params['subinterface'] and _params['config']['physical_id'] is not None and _params['config']['vlan_id'] is not None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/physicals/{_params['config']['physical_id']}/subinterfaces"
+            _url = api_url(_params, f"interfaces/physicals/{_params['config']['physical_id']}/subinterfaces")
             _http_method = "post"
             _payload = {
                 "description": _params['config']['description'],
@@ -332,7 +440,7 @@ def generate_url(_params):
             return _response_dict
 
         if _params['subinterface'] and _params['config']['physical_id'] is not None and _params['config']['subinterface_id'] is not None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/physicals/{_params['config']['physical_id']}/subinterfaces/{_params['config']['subinterface_id']}"
+            _url = api_url(_params, f"interfaces/physicals/{_params['config']['physical_id']}/subinterfaces/{_params['config']['subinterface_id']}")
             _http_method = "put"
             _payload = {
                 "description": _params['config']['description'],
@@ -349,7 +457,7 @@ def generate_url(_params):
     # Generate URL for Absent Requests
     if _params['state'] == "absent":
         if not _params['subinterface'] and _params['config']['physical_id'] is not None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/physicals/{_params['config']['physical_id']}"
+            _url = api_url(_params, f"interfaces/physicals/{_params['config']['physical_id']}")
             _http_method = "delete"
             _payload = {
                 "description": _params['config']['description'],
@@ -365,7 +473,7 @@ def generate_url(_params):
             return _response_dict
 
         if _params['subinterface'] and _params['config']['physical_id'] is not None and _params['config']['subinterface_id'] is not None:
-            _url = f"http://{_host}:{_port}/trafficjam/api/interfaces/physicals/{_params['config']['physical_id']}/subinterfaces/{_params['config']['subinterface_id']}"
+            _url = api_url(_params, f"interfaces/physicals/{_params['config']['physical_id']}/subinterfaces/{_params['config']['subinterface_id']}")
             _http_method = "delete"
 
             # Construct a dictionary to return results with
@@ -373,27 +481,29 @@ def generate_url(_params):
             return _response_dict
 
 
-def run_module():
-    # define available arguments/parameters a user can pass to the module
-    module_args = trafficjam_base_argspec()
+def execute_query_subinterfaces(_params):
+    #
+    # Query the subinterfaces of every physical interface in physical_ids, or of all of them when neither physical_id nor physical_ids is set.
+    # The physical interfaces are fetched concurrently, and each subinterface is annotated with its physical_id.
+    #
+    _config = _params['config'] or {}
+    _response = query_subinterfaces(_params, "interfaces/physicals", _config.get('physical_ids'), 'physical_id')
 
-    config_spec = dict(
-        description=dict(type='str', required=False),
-        v4_address=dict(type='str', required=False),
-        v6_address=dict(type='str', required=False),
-        vrf_id=dict(type='int', required=False),
-        physical_id=dict(type='int', required=False),
-        subinterface_id=dict(type='int', required=False),
-        bridge_id=dict(type='int', required=False),
-        vlan_id=dict(type='int', required=False),
-        mtu=dict(type='int', required=False)
-    )
+    # A subinterface_id picks that subinterface out of all of them
+    if _config.get('subinterface_id') is not None and 'msg' not in _response:
+        _response['response'] = [_item for _item in _response['response'] if _item.get('id') == _config['subinterface_id']]
+
+    result = dict(changed=False, failed='msg' in _response, response=_response['response'], status_code=_response['status_code'])
+    if 'msg' in _response:
+        result['msg'] = _response['msg']
+    return result
 
-    module_args.update(
-        subinterface=dict(type='bool', required=False, default=False),
-        state=dict(type='str', choices=['query', 'present', 'absent'], default='query'),
-        config=dict(type='dict', options=config_spec)
-    )
+
+def execute(_params):
+    # Subinterfaces of several or all physical interfaces are queried at once
+    _config = _params['config'] or {}
+    if _params['state'] == "query" and _params['subinterface'] and (_config.get('physical_id') is None or _config.get('physical_ids')):
+        return execute_query_subinterfaces(_params)
 
     # seed the result dict in the object
     # we primarily care about changed and the response data
@@ -406,66 +516,39 @@ def run_module():
         status_code=''
     )
 
-    module = AnsibleModule(
-        argument_spec=module_args,
-        supports_check_mode=False,
-        required_if=[
-            ['state', 'present', ['config']],
-            ['state', 'absent', ['config']]
-        ]
-    )
-
     # Collect Module Parameters
-    host = module.params['host']
-    port = module.params['port']
-    timeout = module.params['timeout']
-    subinterface = module.params['subinterface']
-
-    if module.params['config'] is not None and module.params['config']['physical_id'] is not None:
-        physical_id = module.params['config']['physical_id']
+    if _params['config'] is not None and _params['config']['physical_id'] is not None:
+        physical_id = _params['config']['physical_id']
     else:
         physical_id = None
 
-    # Run through some error checking and scrub the received parameters
-    errormsg = scrub_params(module.params)
-
-    if errormsg is not None:
-        result['changed'] = True
-        result['failed'] = False
-        module.fail_json(msg=errormsg, **result)
-
     # Generate the URL and HTTP Method based on Module Parameters
-    url_response = generate_url(module.params)
+    url_response = generate_url(_params)
 
     url = url_response['url']
     http_method = url_response['http_method']
     payload = url_response['data']
 
-    # We need to validate if the interface exists already before adding it
+    # We need to validate if the interface exists already before adding it, under a lock shared with concurrent tasks
     if http_method == "post":
-        # Generate URL for Non-Subinterface Requests
-        if subinterface and physical_id is not None:
-            query_url = f"http://{host}:{port}/trafficjam/api/interfaces/physicals/{physical_id}/subinterfaces"
-            query_method = "get"
-
-        # Make the request
-        query_response = make_request(query_method, query_url, payload, timeout)
-
-        if query_response['response']:
-            if subinterface and physical_id is not None:
-                if parse_query_return(query_response['response'], 'vlan_id', module.params['config']['vlan_id']):
-                    result['response'] = query_response['response']
-                    result['status_code'] = query_response['status_code']
-                    module.fail_json(msg='physical subinterface already exists', **result)
-
-    # Generate the Request to the TrafficJam API
-    response = make_request(http_method, url, payload, module.params['timeout'])
+        created = create_exclusive(_params, f"interfaces/physicals/{physical_id}/subinterfaces", 'vlan_id',
+                                   _params['config']['vlan_id'], payload, 'physical subinterface already exists')
+        if created['msg'] is not None:
+            result['response'] = created['query']['response']
+            result['status_code'] = created['query']['status_code']
+            result['failed'] = True
+            result['msg'] = created['msg']
+            return result
+        response = created['response']
+    else:
+        # Generate the Request to the TrafficJam API
+        response = make_request(http_method, url, payload, _params['timeout'])
 
     # Exit the module passing results back to Ansible
     succeeded = process_response(response)
 
     # Manage States Returned to Ansible - If Query, Nothing will ever be changed.
-    if succeeded and module.params['state'] == "query":
+    if succeeded and _params['state'] == "query":
         result['changed'] = False
         result['failed'] = False
     elif succeeded:
@@ -477,11 +560,60 @@ def run_module():
     result['status_code'] = response['status_code']
     result['response'] = response['response']
 
-    module.exit_json(**result)
+    return result
+
+
+def run_module():
+    # define available arguments/parameters a user can pass to the module
+    module_args = trafficjam_base_argspec()
+
+    config_spec = dict(
+        description=dict(type='str', required=False),
+        v4_address=dict(type='str', required=False),
+        v6_address=dict(type='str', required=False),
+        vrf_id=dict(type='int', required=False),
+        physical_id=dict(type='int', required=False),
+        physical_ids=dict(type='list', elements='int', required=False),
+        subinterface_id=dict(type='int', required=False),
+        bridge_id=dict(type='int', required=False),
+        vlan_id=dict(type='int', required=False),
+        mtu=dict(type='int', required=False)
+    )
+
+    module_args.update(
+        subinterface=dict(type='bool', required=False, default=False),
+        state=dict(type='str', choices=['query', 'present', 'absent'], default='query'),
+        config=dict(type='dict', options=config_spec)
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=False,
+        mutually_exclusive=[
+            ['host', 'hosts'],
+            ['hosts', 'unix_socket']
+        ],
+        required_one_of=[
+            ['host', 'hosts']
+        ],
+        required_if=[
+            ['state', 'present', ['config']],
+            ['state', 'absent', ['config']]
+        ]
+    )
+
+    # Validate the nested config parameters, reporting every error at once
+    errors = validate(module.params)
+
+    if errors:
+        module.fail_json(msg='; '.join(errors), errors=errors, changed=False, response='', status_code='')
+
+    # Run the request against every TrafficJam instance and exit the module
+    run_on_hosts(module, execute, validate)
 
 
 def main():
-    run_module()
+    run_profiled(run_module)
 
 
 if __name__ == '__main__':
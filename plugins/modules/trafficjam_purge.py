@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: trafficjam_purge
+
+short_description: This module is used to tear down labs in the WWT ATC Tool TrafficJam
+
+version_added: "2.9"
+
+description:
+    - "This module is used to tear down labs in the WWT ATC Tool TrafficJam"
+    - "Affected objects are discovered from the API and deleted in dependency order.
+      Subinterfaces and interface bindings are removed before their bridges, physical interfaces and VRFs.
+      Every object within a wave is deleted concurrently."
+    - "Physical interfaces cannot be deleted, their configuration is removed instead."
+
+options:
+    host:
+        description:
+            - Address for TrafficJam instance.  Either host or hosts is required.
+        required: false
+    port:
+        description:
+            - HTTP Port for TrafficJam instance.  Defaults to 80, or 443 when scheme is https.
+        required: false
+    scheme:
+        description:
+            - Scheme used to reach the TrafficJam instance.
+        required: false
+        choices: ['http', 'https']
+        default: http
+    validate_certs:
+        description:
+            - Verify the TLS certificate of the TrafficJam instance when scheme is https.
+            - Only set to false against instances with a self-signed certificate.
+        required: false
+        type: bool
+        default: true
+    unix_socket:
+        description:
+            - Path of a unix domain socket to reach a TrafficJam instance on the same machine through, instead of TCP.
+            - Requests are sent as plain HTTP over the socket.  host and port still identify the instance and are sent as Host header.
+            - Mutually exclusive with hosts.
+        required: false
+        type: path
+    timeout:
+        description:
+            - HTTP Timeout
+        required: false
+        default: 10
+    hosts:
+        description:
+            - List of TrafficJam instances to apply the same request to concurrently.
+            - Entries may include a port as host:port, otherwise port is used.
+            - Mutually exclusive with host.
+        required: false
+    max_workers:
+        description:
+            - Maximum number of concurrent requests per wave, and of TrafficJam instances contacted concurrently when using hosts
+        required: false
+        default: 8
+    health_ttl:
+        description:
+            - Seconds a TrafficJam instance which could not be reached is marked down.
+              Tasks against it fail immediately while it is marked down, instead of waiting for timeout.
+            - The mark is shared by every task running on the same machine.  Once it expires, the next task probes the instance with a TCP connection.
+            - Set to 0 to disable.
+        required: false
+        default: 30
+    journal:
+        description:
+            - Path of a checkpoint journal making a large run resumable, see module_utils/journal.py.
+            - Write requests and batch entries are recorded once TrafficJam confirmed them.  When the run fails the journal is kept,
+              and rerunning the task skips everything it confirms instead of checking and sending it again.
+            - The journal is removed once a run succeeds.  Use one journal per TrafficJam instance.
+        required: false
+        type: path
+    batch:
+        description:
+            - List of complete parameter sets, one per loop item.  Set by the collection's action plugin when it coalesces a looped task, which the variable trafficjam_coalesce_loops enables.
+            - Entries run concurrently up to max_workers and return one result each under batch_results.
+            - GET requests are shared between entries, so every entry sees the state from before the batch started.
+        required: false
+    scope:
+        description:
+            - Selects the objects to purge.
+            - all removes every subinterface, bridge interface, dummy interface and VRF and clears all physical interfaces.
+            - vrf removes everything bound to vrf_id and then the VRF itself.
+            - bridge removes the subinterfaces and members of bridge_id and then the bridge itself.
+            - physical removes the subinterfaces of physical_id and then clears its configuration.
+        required: true
+        choices:
+            - all
+            - vrf
+            - bridge
+            - physical
+    vrf_id:
+        description:
+            - ID (integer) of the VRF to purge.  Required when scope is vrf.
+        required: false
+    bridge_id:
+        description:
+            - ID (integer) of the bridge interface to purge.  Required when scope is bridge.
+        required: false
+    physical_id:
+        description:
+            - ID (integer) of the physical interface to purge.  Required when scope is physical.
+        required: false
+
+notes:
+    - Supports check mode, which returns the planned waves without deleting anything.
+
+author:
+    - Nick Thompson (nick.thompson@wwt.com)
+'''
+
+EXAMPLES = '''
+# Tear down everything on a TrafficJam instance
+- name: Purge Lab
+  trafficjam_purge:
+    host: trafficjam
+    scope: all
+
+# Remove a VRF along with every interface bound to it
+- name: Purge VRF
+  trafficjam_purge:
+    host: trafficjam
+    scope: vrf
+    vrf_id: 10
+
+# Remove a Bridge Interface along with its subinterfaces
+- name: Purge Bridge Interface
+  trafficjam_purge:
+    host: trafficjam
+    scope: bridge
+    bridge_id: 10
+
+# Show what would be removed from a Physical Interface
+- name: Plan Physical Interface Purge
+  trafficjam_purge:
+    host: trafficjam
+    scope: physical
+    physical_id: 3
+  check_mode: true
+'''
+
+RETURN = '''
+waves:
+    description: The deletion waves in execution order.  Each entry lists the method, url, payload and status_code of every request in the wave.
+    type: list
+    returned: always
+
+deleted:
+    description: Number of objects deleted or cleared
+    type: int
+    returned: always
+
+results:
+    description: Per-instance results when hosts is used.  Each entry carries host, port, changed, failed, waves and deleted.
+    type: list
+    returned: when hosts is used
+
+batch_results:
+    description: One result per entry of batch, in the same order.  Entries confirmed by the journal of an earlier run carry journaled and report no change.
+    type: list
+    returned: when batch is used
+
+trafficjam_requests:
+    description:
+        - Timing of every request made to TrafficJam, for the wwt.trafficjam.trafficjam callback plugin.
+        - Each entry is a list of method, url template, host, status_code, elapsed seconds, response bytes and retries.
+    type: list
+    returned: when TrafficJam was contacted
+
+trafficjam_journal:
+    description:
+        - Summary of the checkpoint journal when journal is set.
+        - Carries its path, whether it was kept for a rerun, the number of records written and the number of
+          write requests and batch entries skipped because an earlier run confirmed them.
+    type: dict
+    returned: when journal is set
+
+trafficjam_profile:
+    description:
+        - Profile summary when the TRAFFICJAM_PROFILE environment variable is set, see module_utils/profiling.py.
+        - Carries elapsed, memory_current, memory_peak, the top functions by cumulative time, the top allocation sites
+          and the paths of the pstats and allocations files written on the managed host.
+    type: dict
+    returned: when profiling is enabled
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wwt.trafficjam.plugins.module_utils.profiling import run_profiled
+from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import (
+    api_url,
+    trafficjam_base_argspec,
+    make_request,
+    process_response,
+    run_concurrently,
+    run_on_hosts,
+    deletion_waves
+)
+
+# Fields which make up the configuration of a physical interface
+PHYSICAL_FIELDS = ['description', 'v4_address', 'v6_address', 'vrf_id', 'bridge_id', 'mtu']
+
+
+def fetch_collection(_params, _path):
+    # Returns the list found at _path, or None if TrafficJam did not answer successfully
+    _url = api_url(_params, _path)
+    _response = make_request("get", _url, None, _params['timeout'])
+
+    if not process_response(_response):
+        return None
+    return _response['response'] or []
+
+
+def discover(_params):
+    #
+    # Fetch every collection the purge may touch.  The subinterfaces of all
+    # bridges and physical interfaces are fetched concurrently.
+    #
+    _paths = ['vrfs', 'interfaces/bridges', 'interfaces/physicals', 'interfaces/dummies']
+    _collections = run_concurrently(lambda _path: fetch_collection(_params, _path), _paths, _params['max_workers'])
+    _inventory = dict(zip(['vrfs', 'bridges', 'physicals', 'dummies'], _collections))
+
+    if None in _collections:
+        return None
+
+    _parents = [f"interfaces/bridges/{_bridge['id']}" for _bridge in _inventory['bridges']]
+    _parents += [f"interfaces/physicals/{_physical['id']}" for _physical in _inventory['physicals']]
+    _subinterfaces = run_concurrently(lambda _parent: fetch_collection(_params, f"{_parent}/subinterfaces"), _parents, _params['max_workers'])
+
+    if None in _subinterfaces:
+        return None
+
+    _inventory['subinterfaces'] = dict(zip(_parents, _subinterfaces))
+    return _inventory
+
+
+def build_nodes(_params, _inventory):
+    #
+    # Select the objects in scope and describe how each one is removed.
+    # Nodes are keyed by their API path and list the paths they depend on.
+    #
+    _scope = _params['scope']
+    _nodes = {}
+
+    def add(_path, _depends_on, _payload=None):
+        _nodes[_path] = {'method': 'delete', 'path': _path, 'payload': _payload, 'depends_on': _depends_on}
+
+    def vrf_path(_object):
+        if _object.get('vrf_id') is not None:
+            return [f"vrfs/{_object['vrf_id']}"]
+        return []
+
+    # Bridges in scope are deleted along with their subinterfaces and member interfaces
+    _purged_bridges = set()
+    for _bridge in _inventory['bridges']:
+        if _scope == "all" or (_scope == "bridge" and _bridge['id'] == _params['bridge_id']) or \
+                (_scope == "vrf" and _bridge.get('vrf_id') == _params['vrf_id']):
+            _path = f"interfaces/bridges/{_bridge['id']}"
+            _purged_bridges.add(_path)
+            add(_path, vrf_path(_bridge))
+
+    # Subinterfaces always go before their parent interface
+    for _parent, _subinterfaces in _inventory['subinterfaces'].items():
+        for _subinterface in _subinterfaces:
+            if _scope == "all" or _parent in _purged_bridges or \
+                    (_scope == "physical" and _parent == f"interfaces/physicals/{_params['physical_id']}") or \
+                    (_scope == "vrf" and _subinterface.get('vrf_id') == _params['vrf_id']):
+                add(f"{_parent}/subinterfaces/{_subinterface['id']}", [_parent] + vrf_path(_subinterface))
+
+    for _dummy in _inventory['dummies']:
+        if _scope == "all" or (_scope == "vrf" and _dummy.get('vrf_id') == _params['vrf_id']):
+            add(f"interfaces/dummies/{_dummy['id']}", vrf_path(_dummy))
+
+    # Physical interfaces are cleared rather than deleted.  Only the settings in scope are removed.
+    for _physical in _inventory['physicals']:
+        _fields = []
+        if _scope == "all" or (_scope == "physical" and _physical['id'] == _params['physical_id']):
+            _fields = [_field for _field in PHYSICAL_FIELDS if _physical.get(_field) is not None]
+        else:
+            if _scope == "vrf" and _physical.get('vrf_id') == _params['vrf_id']:
+                _fields.append('vrf_id')
+            if f"interfaces/bridges/{_physical.get('bridge_id')}" in _purged_bridges:
+                _fields.append('bridge_id')
+
+        if _fields:
+            # The interface has to leave its VRF and bridge before either of them is deleted
+            _depends_on = vrf_path(_physical) if 'vrf_id' in _fields else []
+            if 'bridge_id' in _fields:
+                _depends_on.append(f"interfaces/bridges/{_physical['bridge_id']}")
+            add(f"interfaces/physicals/{_physical['id']}", _depends_on, {_field: _physical[_field] for _field in _fields})
+
+    for _vrf in _inventory['vrfs']:
+        if _scope == "all" or (_scope == "vrf" and _vrf['id'] == _params['vrf_id']):
+            add(f"vrfs/{_vrf['id']}", [])
+
+    return _nodes
+
+
+def execute(_params, _check_mode):
+    result = dict(
+        changed=False,
+        waves=[],
+        deleted=0
+    )
+
+    inventory = discover(_params)
+    if inventory is None:
+        result['failed'] = True
+        result['msg'] = 'unable to discover TrafficJam objects'
+        return result
+
+    nodes = build_nodes(_params, inventory)
+
+    def delete(_key):
+        _node = nodes[_key]
+        _url = api_url(_params, _node['path'])
+        _request = {'method': _node['method'], 'url': _url, 'payload': _node['payload'], 'status_code': ''}
+        if not _check_mode:
+            _response = make_request(_node['method'], _url, _node['payload'], _params['timeout'])
+            _request['status_code'] = _response['status_code']
+            _request['response'] = _response['response']
+            _request['failed'] = not process_response(_response)
+        return _request
+
+    # Each wave only starts once the previous wave has completed
+    for wave in deletion_waves(nodes):
+        wave_requests = run_concurrently(delete, wave, _params['max_workers'])
+        result['waves'].append(wave_requests)
+
+        succeeded = [_request for _request in wave_requests if not _request.get('failed')]
+        result['deleted'] += len(succeeded)
+        result['changed'] = result['changed'] or bool(succeeded)
+
+        if len(succeeded) != len(wave_requests):
+            result['failed'] = True
+            result['msg'] = f"{len(wave_requests) - len(succeeded)} deletion(s) failed, remaining waves were not attempted"
+            return result
+
+    result['failed'] = False
+    return result
+
+
+def run_module():
+    # define available arguments/parameters a user can pass to the module
+    module_args = trafficjam_base_argspec()
+    module_args.update(
+        scope=dict(type='str', required=True, choices=['all', 'vrf', 'bridge', 'physical']),
+        vrf_id=dict(type='int', required=False),
+        bridge_id=dict(type='int', required=False),
+        physical_id=dict(type='int', required=False)
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=True,
+        mutually_exclusive=[
+            ['host', 'hosts'],
+            ['hosts', 'unix_socket'],
+            ['vrf_id', 'bridge_id', 'physical_id']
+        ],
+        required_one_of=[
+            ['host', 'hosts']
+        ],
+        required_if=[
+            ['scope', 'vrf', ['vrf_id']],
+            ['scope', 'bridge', ['bridge_id']],
+            ['scope', 'physical', ['physical_id']]
+        ]
+    )
+
+    # Run the purge against every TrafficJam instance and exit the module
+    run_on_hosts(module, lambda _params: execute(_params, module.check_mode))
+
+
+def main():
+    run_profiled(run_module)
+
+
+if __name__ == '__main__':
+    main()
@@ -23,16 +23,61 @@ description:
 options:
     host:
         description:
-            - Address for TrafficJam instance
-        required: true
+            - Address for TrafficJam instance.  Either host or hosts is required.
+        required: false
     port:
         description:
-            - HTTP Port for TrafficJam instance.  Default is 80.
+            - HTTP Port for TrafficJam instance.  Default is 80, or 443 when scheme is https.
+        required: false
+    scheme:
+        description:
+            - Scheme used to reach the TrafficJam instance, http or https.  Default is http.
+        required: false
+    validate_certs:
+        description:
+            - Verify the TLS certificate of the TrafficJam instance when scheme is https.  Default is true.
+            - Only set to false against instances with a self-signed certificate.
+        required: false
+    unix_socket:
+        description:
+            - Path of a unix domain socket to reach a TrafficJam instance on the same machine through, instead of TCP.
+            - Requests are sent as plain HTTP over the socket.  host and port still identify the instance and are sent as Host header.
+            - Mutually exclusive with hosts.
         required: false
     timeout:
         description:
             - HTTP Timeout.  Default is 10s.
         required: false
+    hosts:
+        description:
+            - List of TrafficJam instances to apply the same request to concurrently.
+            - Entries may include a port as host:port, otherwise port is used.
+            - Mutually exclusive with host.
+        required: false
+    max_workers:
+        description:
+            - Maximum number of TrafficJam instances contacted concurrently when using hosts.  Default is 8.
+        required: false
+    health_ttl:
+        description:
+            - Seconds a TrafficJam instance which could not be reached is marked down.
+              Tasks against it fail immediately while it is marked down, instead of waiting for timeout.  Default is 30.
+            - The mark is shared by every task running on the same machine.  Once it expires, the next task probes the instance with a TCP connection.
+            - Set to 0 to disable.
+        required: false
+    journal:
+        description:
+            - Path of a checkpoint journal making a large run resumable, see module_utils/journal.py.
+            - Write requests and batch entries are recorded once TrafficJam confirmed them.  When the run fails the journal is kept,
+              and rerunning the task skips everything it confirms instead of checking and sending it again.
+            - The journal is removed once a run succeeds.  Use one journal per TrafficJam instance.
+        required: false
+    batch:
+        description:
+            - List of complete parameter sets, one per loop item.  Set by the collection's action plugin when it coalesces a looped task, which the variable trafficjam_coalesce_loops enables.
+            - Entries run concurrently up to max_workers and return one result each under batch_results.
+            - GET requests are shared between entries, so every entry sees the state from before the batch started.
+        required: false
     vrf_name:
         description:
             - Name of the VRF to be created
@@ -44,15 +89,49 @@ options:
     vrf_table_id:
         description:
             - ID (integer) of the Routing Table bound to the new VRF.  Used when creating a VRF.
+            - A free table is allocated from vrf_table_range when omitted.
         required: false
     interface_id:
         description:
             - ID (integer) of the interface to bind to the VRF.
+    interface_ids:
+        description:
+            - List of interface IDs (integer) to bind to the VRF given by vrf_id.  Bindings are made concurrently.
+        required: false
+    vrfs:
+        description:
+            - List of VRFs to create in a single run.  VRFs which already exist are left untouched.
+            - Tables are allocated from vrf_table_range for entries without a table.
+            - All VRFs are created concurrently, then all interface bindings are made concurrently.
+        required: false
+        suboptions:
+            name:
+                description:
+                    - Name of the VRF
+                required: true
+            table:
+                description:
+                    - ID (integer) of the Routing Table bound to the VRF
+                required: false
+            interface_ids:
+                description:
+                    - List of interface IDs (integer) to bind to the VRF
+                required: false
+    vrf_table_range:
+        description:
+            - First and last Routing Table ID (integer) used when allocating tables.  Default is [1000, 65535].
+            - Tables 253 to 255 are reserved and never allocated.
+        required: false
     state:
         description:
             - Parameter to determine module behavior.  Can be query / present / absent.  Default is query.
         required: false
 
+notes:
+    - Creates check that the object does not exist and POST it while holding a lock shared by every task on the same machine,
+      so concurrent tasks can create objects at full parallelism without making duplicates.  Duplicates made concurrently from
+      other machines are detected after the POST and resolved by keeping the object with the lowest id.
+
 author:
     - Nick Thompson (nick.thompson@wwt.com)
 '''
@@ -79,6 +158,41 @@ EXAMPLES = '''
     vrf_table_id: 111
     state: present
 
+# Create VRF using the next free Routing Table
+- name: Create VRF with allocated table
+  trafficjam_vrfs:
+    host: trafficjam
+    vrf_name: testvrf
+    state: present
+
+# Create VRFs for every tenant and bind their interfaces
+- name: Create Tenant VRFs
+  trafficjam_vrfs:
+    host: trafficjam
+    vrfs:
+      - name: tenant1
+        interface_ids: [101, 102]
+      - name: tenant2
+        table: 2002
+        interface_ids: [103]
+    state: present
+
+# Rerunning after a failure skips the VRFs and bindings already made
+- name: Create Tenant VRFs Resumably
+  trafficjam_vrfs:
+    host: trafficjam
+    vrfs: "{{ tenant_vrfs }}"
+    journal: "/var/tmp/trafficjam-{{ inventory_hostname }}.journal"
+    state: present
+
+# Bind VRF to several interfaces
+- name: Bind VRF to Interfaces
+  trafficjam_vrfs:
+    host: trafficjam
+    vrf_id: 10
+    interface_ids: [100, 101, 102]
+    state: present
+
 # Bind VRF to an interface
 - name: Bind VRF to Interface
   trafficjam_vrfs:
@@ -93,6 +207,17 @@ EXAMPLES = '''
     host: trafficjam
     vrf_id: 10
     state: absent
+
+# Create the same VRF on a fleet of TrafficJam instances
+- name: Create VRF on all TrafficJam instances
+  trafficjam_vrfs:
+    hosts:
+      - trafficjam1
+      - trafficjam2
+      - trafficjam3:8080
+    vrf_name: testvrf
+    vrf_table_id: 111
+    state: present
 '''
 
 RETURN = '''
@@ -105,29 +230,109 @@ status_code:
     description: The HTTP Status Code returned by TrafficJam
     type: int
     returned: always
+
+vrfs:
+    description:
+        - One entry per requested VRF with its name, table, id, status_code and whether it was created or already existed
+        - duplicate_removed is set when another task created the VRF concurrently; its VRF is kept and the duplicate removed
+    type: list
+    returned: when vrfs is used
+
+bindings:
+    description: One entry per interface binding with its vrf_id, interface_id and status_code
+    type: list
+    returned: when vrfs or interface_ids is used
+
+results:
+    description: Per-instance results when hosts is used.  Each entry carries host, port, changed, failed, response and status_code.
+    type: list
+    returned: when hosts is used
+
+batch_results:
+    description: One result per entry of batch, in the same order.  Entries confirmed by the journal of an earlier run carry journaled and report no change.
+    type: list
+    returned: when batch is used
+
+trafficjam_requests:
+    description:
+        - Timing of every request made to TrafficJam, for the wwt.trafficjam.trafficjam callback plugin.
+        - Each entry is a list of method, url template, host, status_code, elapsed seconds, response bytes and retries.
+    type: list
+    returned: when TrafficJam was contacted
+
+trafficjam_journal:
+    description:
+        - Summary of the checkpoint journal when journal is set.
+        - Carries its path, whether it was kept for a rerun, the number of records written and the number of
+          write requests and batch entries skipped because an earlier run confirmed them.
+    type: dict
+    returned: when journal is set
+
+trafficjam_profile:
+    description:
+        - Profile summary when the TRAFFICJAM_PROFILE environment variable is set, see module_utils/profiling.py.
+        - Carries elapsed, memory_current, memory_peak, the top functions by cumulative time, the top allocation sites
+          and the paths of the pstats and allocations files written on the managed host.
+    type: dict
+    returned: when profiling is enabled
 '''
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wwt.trafficjam.plugins.module_utils.profiling import run_profiled
 from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import (
+    api_url,
+    collection_locks,
+    create_exclusive,
     trafficjam_base_argspec,
     make_request,
-    parse_query_return,
-    process_response
+    process_response,
+    reconcile_created,
+    run_concurrently,
+    run_on_hosts,
+    send_request,
+    allocate_tables
 )
+from ansible_collections.wwt.trafficjam.plugins.module_utils.validation import (
+    compile_constraints,
+    validate_configs
+)
+
+
+# Constraints on the entries of vrfs, validated by module_utils.validation
+VRF_CONSTRAINTS = compile_constraints([
+    dict(required_one_of=[['name']])
+])
+
+
+def validate(_params):
+    # Returns every error found in vrfs, vrf_table_range and the binding parameters
+    errors = []
+    if _params['vrfs']:
+        errors += [f"vrfs[{_index}]: {_message}" for _index, _message in validate_configs(VRF_CONSTRAINTS, _params, _params['vrfs'])]
+        names, duplicates = set(), set()
+        for _vrf in _params['vrfs']:
+            (duplicates if _vrf['name'] in names else names).add(_vrf['name'])
+        errors += [f"vrf {_name} is listed more than once" for _name in sorted(duplicates - {None})]
+    if (_params['vrfs'] or _params['interface_ids']) and _params['state'] != "present":
+        errors.append("vrfs and interface_ids require state present")
+    if _params['state'] == "present" and _params['vrf_id'] and not (_params['vrf_name'] or _params['interface_id'] or _params['interface_ids']):
+        errors.append("vrf_id with state present binds interfaces and requires interface_id or interface_ids")
+    if len(_params['vrf_table_range']) != 2 or _params['vrf_table_range'][0] > _params['vrf_table_range'][1]:
+        errors.append("vrf_table_range must be [first, last]")
+
+    return errors
 
 
 def generate_url(_params):
     # Gather Parameters
     _state = _params['state']
-    _host = _params['host']
-    _port = _params['port']
 
     # Default _payload to None.  If required, this will be set below.
     _payload = None
 
     # Generate URL for Query Requests
     if _state == "query" and not _params['vrf_id']:
-        _url = f"http://{_host}:{_port}/trafficjam/api/vrfs"
+        _url = api_url(_params, "vrfs")
         _http_method = "get"
 
         # Construct a dictionary to return results with
@@ -135,7 +340,7 @@ def generate_url(_params):
         return _response_dict
 
     elif _state == "query" and _params.get('vrf_id'):
-        _url = f"http://{_host}:{_port}/trafficjam/api/vrfs/{_params['vrf_id']}"
+        _url = api_url(_params, f"vrfs/{_params['vrf_id']}")
         _http_method = "get"
 
         # Construct a dictionary to return results with
@@ -145,8 +350,8 @@ def generate_url(_params):
     # Generate URL for Present Requests.
     # HTTP Method of POST is used for creating new VRFs.
     # PUT is used for binding a VRF to an interface.
-    if _state == "present" and _params['vrf_name'] and _params['vrf_table_id']:
-        _url = f"http://{_host}:{_port}/trafficjam/api/vrfs"
+    if _state == "present" and _params['vrf_name']:
+        _url = api_url(_params, "vrfs")
         _http_method = "post"
         _payload = {"name": _params['vrf_name'], "table": _params['vrf_table_id']}
 
@@ -155,7 +360,7 @@ def generate_url(_params):
         return _response_dict
 
     elif _state == "present" and _params['vrf_id'] and _params['interface_id']:
-        _url = f"http://{_host}:{_port}/trafficjam/api/vrfs/{_params['vrf_id']}"
+        _url = api_url(_params, f"vrfs/{_params['vrf_id']}")
         _http_method = "put"
         _payload = {"interface_id": _params['interface_id']}
 
@@ -165,7 +370,7 @@ def generate_url(_params):
 
     # Generate URL for Absent Requests
     if _state == "absent" and _params['vrf_id']:
-        _url = f"http://{_host}:{_port}/trafficjam/api/vrfs/{_params['vrf_id']}"
+        _url = api_url(_params, f"vrfs/{_params['vrf_id']}")
         _http_method = "delete"
 
         # Construct a dictionary to return results with
@@ -173,17 +378,119 @@ def generate_url(_params):
         return _response_dict
 
 
-def run_module():
-    # define available arguments/parameters a user can pass to the module
-    module_args = trafficjam_base_argspec()
-    module_args.update(
-        vrf_name=dict(type='str', required=False),
-        vrf_id=dict(type='int', required=False),
-        vrf_table_id=dict(type='int', required=False),
-        interface_id=dict(type='int', required=False),
-        state=dict(type='str', choices=['query', 'present', 'absent'], default='query')
+def execute_bulk(_params):
+    #
+    # Create every VRF in vrfs and make every interface binding.
+    # The existing VRFs are fetched once, then the POSTs and PUTs each run concurrently.
+    #
+    result = dict(
+        changed=False,
+        response='',
+        status_code='',
+        vrfs=[],
+        bindings=[]
     )
 
+    timeout = _params['timeout']
+    base_url = api_url(_params, "vrfs")
+
+    # The binding PUTs for each VRF ID, filled in once new VRFs have their IDs
+    bindings = [(_params['vrf_id'], _interface_id) for _interface_id in _params['interface_ids'] or []]
+
+    if _params['vrfs']:
+        # VRF creates lock the whole collection, as their Routing Tables must be unique as well.
+        # The existing VRFs are read fresh rather than from the shared reads of a batch.
+        with collection_locks(_params, "vrfs", ['tables']):
+            query_response = send_request("get", base_url, None, timeout)
+            if not process_response(query_response):
+                result['response'] = query_response['response']
+                result['status_code'] = query_response['status_code']
+                result['failed'] = True
+                result['msg'] = 'unable to fetch existing vrfs'
+                return result
+
+            existing = {_vrf['name']: _vrf for _vrf in query_response['response'] or []}
+            used_tables = {_vrf['table']: _vrf['name'] for _vrf in existing.values() if _vrf.get('table') is not None}
+
+            # Requested tables must not clash with existing VRFs, nor with each other
+            errors = []
+            creates = [_vrf for _vrf in _params['vrfs'] if _vrf['name'] not in existing]
+            for _vrf in creates:
+                if _vrf['table'] is not None and used_tables.get(_vrf['table'], _vrf['name']) != _vrf['name']:
+                    errors.append(f"table {_vrf['table']} requested by {_vrf['name']} is used by {used_tables[_vrf['table']]}")
+                elif _vrf['table'] is not None:
+                    used_tables[_vrf['table']] = _vrf['name']
+
+            unallocated = [_vrf for _vrf in creates if _vrf['table'] is None]
+            tables = allocate_tables([{'table': _table} for _table in used_tables], len(unallocated), _params['vrf_table_range'])
+            if len(tables) < len(unallocated):
+                errors.append(f"only {len(tables)} free routing tables in vrf_table_range for {len(unallocated)} vrfs")
+
+            if errors:
+                result['failed'] = True
+                result['msg'] = '; '.join(errors)
+                result['errors'] = errors
+                return result
+
+            allocated = dict(zip([_vrf['name'] for _vrf in unallocated], tables))
+
+            def create(_vrf):
+                _payload = {"name": _vrf['name'], "table": _vrf['table'] or allocated[_vrf['name']]}
+                _response = make_request("post", base_url, _payload, timeout)
+                _entry = {"name": _vrf['name'], "table": _payload['table'], "status_code": _response['status_code'],
+                          "created": process_response(_response)}
+                if _entry['created'] and isinstance(_response['response'], dict):
+                    _entry['id'] = _response['response'].get('id')
+                return _entry
+
+            created = dict((_entry['name'], _entry) for _entry in run_concurrently(create, creates, _params['max_workers']))
+
+            # Tasks on other machines may have created the same VRFs concurrently, the oldest of each is kept
+            kept = reconcile_created(_params, "vrfs", 'name', dict((_name, _entry.get('id')) for _name, _entry in created.items()))
+            for _name, _vrf in kept.items():
+                created[_name].update(id=_vrf.get('id'), table=_vrf.get('table'), created=False, duplicate_removed=True)
+
+            for _vrf in _params['vrfs']:
+                if _vrf['name'] in existing:
+                    _entry = {"name": _vrf['name'], "table": existing[_vrf['name']].get('table'),
+                              "id": existing[_vrf['name']].get('id'), "status_code": query_response['status_code'], "created": False}
+                else:
+                    _entry = created[_vrf['name']]
+                result['vrfs'].append(_entry)
+
+                # Interfaces of VRFs that could not be created are not bound
+                if _entry.get('id') is not None:
+                    bindings += [(_entry['id'], _interface_id) for _interface_id in _vrf['interface_ids'] or []]
+
+            failed = [_vrf['name'] for _vrf in creates
+                      if not created[_vrf['name']]['created'] and not created[_vrf['name']].get('duplicate_removed')]
+            result['changed'] = len(failed) < len(creates)
+            if failed:
+                result['failed'] = True
+                result['msg'] = f"unable to create vrfs: {', '.join(failed)}"
+
+    def bind(_binding):
+        _response = make_request("put", f"{base_url}/{_binding[0]}", {"interface_id": _binding[1]}, timeout)
+        return {"vrf_id": _binding[0], "interface_id": _binding[1], "status_code": _response['status_code'],
+                "bound": process_response(_response)}
+
+    result['bindings'] = run_concurrently(bind, bindings, _params['max_workers'])
+    result['changed'] = result['changed'] or any(_binding['bound'] for _binding in result['bindings'])
+
+    unbound = [str(_binding['interface_id']) for _binding in result['bindings'] if not _binding['bound']]
+    if unbound:
+        result['failed'] = True
+        result['msg'] = '; '.join(filter(None, [result.get('msg'), f"unable to bind interfaces: {', '.join(unbound)}"]))
+
+    result.setdefault('failed', False)
+    return result
+
+
+def execute(_params):
+    # Lists of VRFs or interfaces are handled in bulk
+    if _params['vrfs'] or _params['interface_ids']:
+        return execute_bulk(_params)
+
     # seed the result dict in the object
     # we primarily care about changed and the response data
     # change is if this module effectively modified the target
@@ -195,53 +502,45 @@ def run_module():
         status_code=''
     )
 
-    module = AnsibleModule(
-        argument_spec=module_args,
-        supports_check_mode=False,
-        mutually_exclusive=[
-            ['vrf_name', 'interface_id'],
-            ['vrf_table_id', 'interface_id']
-        ],
-        required_by=dict(
-            vrf_name=['vrf_table_id'],
-            vrf_table_id=['vrf_name']
-        ),
-        required_if=[
-            ['state', 'present', ['vrf_name', 'vrf_table_id', 'vrf_id', 'vrf_table_id'], True],
-            ['state', 'absent', ['vrf_id']]
-        ]
-    )
-
     # Collect Module Parameters
-    host = module.params['host']
-    port = module.params['port']
 
     # Generate the URL, HTTP Method, and Optional Payload based on Module Parameters
-    url_response = generate_url(module.params)
+    url_response = generate_url(_params)
 
     url = url_response['url']
     http_method = url_response['http_method']
     payload = url_response['data']
 
-    # We need to validate if the VRF exists already before adding it
+    # Allocate a free Routing Table from the VRFs fetched to check the VRF does not exist
+    def allocate_table(_vrfs, _payload):
+        if _payload['table'] is None:
+            _tables = allocate_tables(_vrfs, 1, _params['vrf_table_range'])
+            if not _tables:
+                return 'no free routing table in vrf_table_range'
+            _payload['table'] = _tables[0]
+        return None
+
+    # We need to validate if the VRF exists already before adding it.  Routing Tables must be unique as well,
+    # so VRF creates lock the whole collection against concurrent tasks.
     if http_method == "post":
-        query_url = f"http://{host}:{port}/trafficjam/api/vrfs"
-        query_method = "get"
-        query_response = make_request(query_method, query_url, payload, module.params['timeout'])
-
-        if parse_query_return(query_response['response'], 'name', module.params['vrf_name']):
-            result['response'] = query_response['response']
-            result['status_code'] = query_response['status_code']
-            module.fail_json(msg='vrf already exists', **result)
-
-    # Generate the Request to the TrafficJam API
-    response = make_request(http_method, url, payload, module.params['timeout'])
+        created = create_exclusive(_params, "vrfs", 'name', _params['vrf_name'], payload, 'vrf already exists',
+                                   _prepare=allocate_table, _lock_keys=['tables'])
+        if created['msg'] is not None:
+            result['response'] = created['query']['response']
+            result['status_code'] = created['query']['status_code']
+            result['failed'] = True
+            result['msg'] = created['msg']
+            return result
+        response = created['response']
+    else:
+        # Generate the Request to the TrafficJam API
+        response = make_request(http_method, url, payload, _params['timeout'])
 
     # Exit the module passing results back to Ansible
     succeeded = process_response(response)
 
     # Manage States Returned to Ansible - If Query, Nothing will ever be changed.
-    if succeeded and module.params['state'] == "query":
+    if succeeded and _params['state'] == "query":
         result['changed'] = False
         result['failed'] = False
     elif succeeded:
@@ -253,11 +552,65 @@ def run_module():
     result['status_code'] = response['status_code']
     result['response'] = response['response']
 
-    module.exit_json(**result)
+    return result
+
+
+def run_module():
+    # define available arguments/parameters a user can pass to the module
+    module_args = trafficjam_base_argspec()
+    module_args.update(
+        vrf_name=dict(type='str', required=False),
+        vrf_id=dict(type='int', required=False),
+        vrf_table_id=dict(type='int', required=False),
+        interface_id=dict(type='int', required=False),
+        interface_ids=dict(type='list', elements='int', required=False),
+        vrfs=dict(type='list', elements='dict', required=False, options=dict(
+            name=dict(type='str', required=False),
+            table=dict(type='int', required=False),
+            interface_ids=dict(type='list', elements='int', required=False)
+        )),
+        vrf_table_range=dict(type='list', elements='int', required=False, default=[1000, 65535]),
+        state=dict(type='str', choices=['query', 'present', 'absent'], default='query')
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=False,
+        mutually_exclusive=[
+            ['host', 'hosts'],
+            ['hosts', 'unix_socket'],
+            ['vrf_name', 'interface_id'],
+            ['vrf_table_id', 'interface_id'],
+            ['interface_id', 'interface_ids'],
+            ['vrfs', 'vrf_name'],
+            ['vrfs', 'vrf_id'],
+            ['vrfs', 'interface_id']
+        ],
+        required_one_of=[
+            ['host', 'hosts']
+        ],
+        required_by=dict(
+            vrf_table_id=['vrf_name'],
+            interface_ids=['vrf_id']
+        ),
+        required_if=[
+            ['state', 'present', ['vrf_name', 'vrf_id', 'vrfs'], True],
+            ['state', 'absent', ['vrf_id']]
+        ]
+    )
+
+    # Validate every entry of vrfs before any request is made
+    errors = validate(module.params)
+
+    if errors:
+        module.fail_json(msg='; '.join(errors), errors=errors, changed=False, response='', status_code='')
+
+    # Run the request against every TrafficJam instance and exit the module
+    run_on_hosts(module, execute, validate)
 
 
 def main():
-    run_module()
+    run_profiled(run_module)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: trafficjam_wait
+
+short_description: This module is used to wait until objects of the WWT ATC Tool TrafficJam reach a state
+
+version_added: "2.9"
+
+description:
+    - "This module is used to wait until VRFs, dummy interfaces or subinterfaces of the WWT ATC Tool TrafficJam exist with the
+      given fields, or no longer exist"
+    - "Every cycle fetches each collection holding objects still waited on once, rather than every object on its own,
+      so waiting for thousands of objects costs a few list requests per cycle.  Subinterfaces are only fetched from
+      the parents they are expected on."
+    - "The delay between cycles starts at interval and doubles up to max_interval while nothing changes.  It drops back
+      to interval as soon as a cycle finds more objects in the state waited for."
+    - "Returns as soon as every object is in the state waited for, and fails once wait_timeout passed."
+
+options:
+    host:
+        description:
+            - Address for TrafficJam instance.  Either host or hosts is required.
+        required: false
+    port:
+        description:
+            - HTTP Port for TrafficJam instance.  Defaults to 80, or 443 when scheme is https.
+        required: false
+    scheme:
+        description:
+            - Scheme used to reach the TrafficJam instance.
+        required: false
+        choices: ['http', 'https']
+        default: http
+    validate_certs:
+        description:
+            - Verify the TLS certificate of the TrafficJam instance when scheme is https.
+            - Only set to false against instances with a self-signed certificate.
+        required: false
+        type: bool
+        default: true
+    unix_socket:
+        description:
+            - Path of a unix domain socket to reach a TrafficJam instance on the same machine through, instead of TCP.
+            - Requests are sent as plain HTTP over the socket.  host and port still identify the instance and are sent as Host header.
+            - Mutually exclusive with hosts.
+        required: false
+        type: path
+    timeout:
+        description:
+            - HTTP Timeout
+        required: false
+        default: 10
+    hosts:
+        description:
+            - List of TrafficJam instances to wait on concurrently.
+            - Entries may include a port as host:port, otherwise port is used.
+            - Mutually exclusive with host.
+        required: false
+    max_workers:
+        description:
+            - Maximum number of concurrent requests when fetching subinterfaces, and of TrafficJam instances contacted concurrently when using hosts
+        required: false
+        default: 8
+    health_ttl:
+        description:
+            - Seconds a TrafficJam instance which could not be reached is marked down.
+              Tasks against it fail immediately while it is marked down, instead of waiting for timeout.
+            - The mark is shared by every task running on the same machine.  Once it expires, the next task probes the instance with a TCP connection.
+            - Set to 0 to disable.
+        required: false
+        default: 30
+    journal:
+        description:
+            - Path of a checkpoint journal making a large run resumable, see module_utils/journal.py.
+            - The wait makes no write requests, so only batch entries are recorded.
+        required: false
+        type: path
+    batch:
+        description:
+            - List of complete parameter sets, one per loop item.
+            - Entries run concurrently up to max_workers and return one result each under batch_results.
+            - Unlike other modules, every entry fetches the collections itself, so each cycle sees the current state.
+        required: false
+    kind:
+        description:
+            - Type of the objects, see the kind option of trafficjam_import for their fields.
+        required: true
+        choices: ['vrfs', 'dummies', 'physical_subinterfaces', 'bridge_subinterfaces']
+    objects:
+        description:
+            - List of objects to wait for, identified like the rows of trafficjam_import by name, or by parent and vlan_id.
+            - With state present, every other field set on an object must have the given value.  Fields left out are not checked.
+        required: true
+        type: list
+        elements: dict
+    state:
+        description:
+            - Wait until the objects exist with the given fields, or until they no longer exist.
+            - With absent, the subinterfaces of a parent which no longer exists count as absent.
+        required: false
+        choices: ['present', 'absent']
+        default: present
+    wait_timeout:
+        description:
+            - Seconds to wait for before failing.
+        required: false
+        type: float
+        default: 300
+    interval:
+        description:
+            - Seconds between the first cycles, and between cycles which found more objects in the state waited for.
+        required: false
+        type: float
+        default: 1
+    max_interval:
+        description:
+            - Longest number of seconds between cycles.
+        required: false
+        type: float
+        default: 10
+    max_report:
+        description:
+            - Maximum number of objects listed under pending.  The counts always cover every object.
+            - Set to 0 to list all of them.
+        required: false
+        default: 1000
+
+notes:
+    - Supports check mode.  The module never changes anything.
+    - Replaces a query task per object retried with until, which sends one request per object and retry.
+
+author:
+    - Nick Thompson (nick.thompson@wwt.com)
+'''
+
+EXAMPLES = '''
+# Wait for the subinterfaces of a bulk load to come up with their addresses
+- name: Wait For Subinterfaces
+  trafficjam_wait:
+    host: trafficjam
+    kind: physical_subinterfaces
+    objects: "{{ subinterfaces }}"
+    wait_timeout: 600
+
+# Wait for VRFs removed by another play to disappear
+- name: Wait For VRFs Removal
+  trafficjam_wait:
+    host: trafficjam
+    kind: vrfs
+    state: absent
+    objects:
+      - name: customer-a
+      - name: customer-b
+'''
+
+RETURN = '''
+converged:
+    description: True when every object reached the state waited for
+    type: bool
+    returned: always
+
+counts:
+    description: Number of objects waited for, of objects in the state waited for and of objects still pending
+    type: dict
+    returned: always
+
+pending:
+    description:
+        - Objects which did not reach the state waited for, with their path, key, line among the objects and status.
+        - status is missing, differing or present.  fields maps each field which differs to its expected and live value.
+    type: list
+    returned: always
+
+polls:
+    description: Number of cycles, each fetching the collections of the objects still pending once
+    type: int
+    returned: always
+
+elapsed:
+    description: Seconds spent waiting
+    type: float
+    returned: always
+
+results:
+    description: Per-instance results when hosts is used.  Each entry carries host, port, failed and the keys above.
+    type: list
+    returned: when hosts is used
+
+batch_results:
+    description: One result per entry of batch, in the same order.  Entries confirmed by the journal of an earlier run carry journaled.
+    type: list
+    returned: when batch is used
+
+trafficjam_requests:
+    description:
+        - Timing of every request made to TrafficJam, for the wwt.trafficjam.trafficjam callback plugin.
+        - Each entry is a list of method, url template, host, status_code, elapsed seconds, response bytes and retries.
+    type: list
+    returned: when TrafficJam was contacted
+
+trafficjam_journal:
+    description:
+        - Summary of the checkpoint journal when journal is set.
+        - Carries its path, whether it was kept for a rerun, the number of records written and the number of
+          write requests and batch entries skipped because an earlier run confirmed them.
+    type: dict
+    returned: when journal is set
+
+trafficjam_profile:
+    description:
+        - Profile summary when the TRAFFICJAM_PROFILE environment variable is set, see module_utils/profiling.py.
+        - Carries elapsed, memory_current, memory_peak, the top functions by cumulative time, the top allocation sites
+          and the paths of the pstats and allocations files written on the managed host.
+    type: dict
+    returned: when profiling is enabled
+'''
+
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wwt.trafficjam.plugins.module_utils.objects import (
+    KINDS,
+    compare_objects,
+    fetch_objects,
+    list_rows,
+    object_identity,
+    validate_rows
+)
+from ansible_collections.wwt.trafficjam.plugins.module_utils.profiling import run_profiled
+from ansible_collections.wwt.trafficjam.plugins.module_utils.trafficjam import (
+    trafficjam_base_argspec,
+    run_on_hosts
+)
+
+
+def validate(_params):
+    # Returns every error found in objects and the wait options
+    _errors = [f"objects item {_line}: {_error}" for _line, _row, _error in validate_rows(_params['kind'], list_rows(_params['objects']))
+               if _error is not None]
+    if _params['interval'] <= 0 or _params['max_interval'] < _params['interval']:
+        _errors.append("interval must be positive and max_interval at least interval")
+    return _errors
+
+
+def poll(_params, _pending, _status):
+    #
+    # Fetch the collections holding the pending objects once and drop the objects in the state waited for from _pending.
+    # _status receives the status of the objects still pending.  Returns an error message when a collection could not be fetched.
+    #
+    _kind = _params['kind']
+    _parent = KINDS[_kind]['parent']
+    _parent_ids = None
+    if _parent is not None:
+        _parent_ids = sorted(set(_row[_parent] for _line, _row in _pending.values()))
+
+    # Subinterfaces of a deleted parent are gone with it
+    _live, _error = fetch_objects(_params, _kind, _parent_ids, True, _params['state'] == 'absent')
+    if _live is None:
+        return _error
+
+    for _status_name, _entry in compare_objects(_kind, _pending.values(), _live):
+        if _status_name == 'unexpected':
+            continue
+        _identity = (_entry['path'], _entry['key'])
+        if _status_name == ('in_sync' if _params['state'] == 'present' else 'missing'):
+            del _pending[_identity]
+            _status.pop(_identity, None)
+        elif _status_name == 'differing' and _params['state'] == 'present':
+            _status[_identity] = dict(status='differing', fields=dict((_field, dict(expected=_values['desired'], live=_values['live']))
+                                                                      for _field, _values in _entry['fields'].items()))
+        else:
+            _status[_identity] = dict(status='missing' if _status_name == 'missing' else 'present')
+    return None
+
+
+def execute(_params):
+    started = time.monotonic()
+    deadline = started + _params['wait_timeout']
+    result = dict(changed=False, converged=False, counts=dict(expected=0, matched=0, pending=0), pending=[], polls=0, elapsed=0.0)
+
+    pending = {}
+    for _line, _row, _error in validate_rows(_params['kind'], list_rows(_params['objects'])):
+        pending[object_identity(_params['kind'], _row)] = (_line, _row)
+    result['counts']['expected'] = len(pending)
+
+    status = {}
+    error = None
+    interval = _params['interval']
+    while pending:
+        _before = len(pending)
+        result['polls'] += 1
+        error = poll(_params, pending, status)
+
+        _remaining = deadline - time.monotonic()
+        if not pending or _remaining <= 0:
+            break
+
+        # Poll again soon while objects keep converging, back off while nothing changes
+        if len(pending) < _before:
+            interval = _params['interval']
+        elif result['polls'] > 1:
+            interval = min(interval * 2, _params['max_interval'])
+        time.sleep(min(interval, _remaining))
+
+    result['elapsed'] = round(time.monotonic() - started, 3)
+    result['converged'] = not pending
+    result['counts']['pending'] = len(pending)
+    result['counts']['matched'] = result['counts']['expected'] - len(pending)
+    for _identity, (_line, _row) in pending.items():
+        if _params['max_report'] and len(result['pending']) >= _params['max_report']:
+            break
+        result['pending'].append(dict(path=_identity[0], key=_identity[1], line=_line, **status.get(_identity, dict(status='unknown'))))
+
+    result['failed'] = False
+    if pending:
+        result['failed'] = True
+        result['msg'] = f"{len(pending)} of {result['counts']['expected']} object(s) not {_params['state']} after {result['elapsed']} seconds"
+        if error is not None:
+            result['msg'] += f", last poll failed: {error}"
+    return result
+
+
+def run_module():
+    # define available arguments/parameters a user can pass to the module
+    module_args = trafficjam_base_argspec()
+    module_args.update(
+        kind=dict(type='str', required=True, choices=['vrfs', 'dummies', 'physical_subinterfaces', 'bridge_subinterfaces']),
+        objects=dict(type='list', elements='dict', required=True),
+        state=dict(type='str', required=False, choices=['present', 'absent'], default='present'),
+        wait_timeout=dict(type='float', required=False, default=300),
+        interval=dict(type='float', required=False, default=1),
+        max_interval=dict(type='float', required=False, default=10),
+        max_report=dict(type='int', required=False, default=1000)
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=True,
+        mutually_exclusive=[
+            ['host', 'hosts'],
+            ['hosts', 'unix_socket']
+        ],
+        required_one_of=[
+            ['host', 'hosts']
+        ]
+    )
+
+    # Validate the objects, reporting every error at once
+    errors = validate(module.params)
+
+    if errors:
+        module.fail_json(msg='; '.join(errors), errors=errors, changed=False)
+
+    # Wait on every TrafficJam instance and exit the module
+    run_on_hosts(module, execute, validate)
+
+
+def main():
+    run_profiled(run_module)
+
+
+if __name__ == '__main__':
+    main()
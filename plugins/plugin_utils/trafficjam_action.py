@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Controller side coalescing of looped trafficjam_* tasks.
+#
+# Ansible runs a module once per loop item, and every run makes its own
+# existence-check GET.  The first item of a loop instead renders the module
+# arguments of every item and runs the module once with them as 'batch'.
+# The module shares its reads between the items and makes the writes
+# concurrently.  The result of each item is kept here and handed back when
+# Ansible asks for that item.
+#
+# Items of a coalesced loop no longer run in loop order, and every item reads
+# the state from before the loop started.  Coalescing is therefore off unless
+# the variable trafficjam_coalesce_loops is set to true, which is only safe
+# for loops whose items do not depend on each other, e.g. creating many VRFs.
+# Loops such as deleting a subinterface and then its parent must not set it.
+#
+
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.parsing.mod_args import ModuleArgsParser
+from ansible.plugins.action import ActionBase
+from ansible.utils.display import Display
+
+display = Display()
+
+# Results of coalesced loops which have not been handed back yet.
+# Maps (task uuid, inventory hostname) to a dict with the loop 'items', the
+# 'results' by loop index (None for items the batch skipped) and the index of
+# the 'next' item expected.
+_pending = {}
+
+# Loops which were coalesced, kept after their results were handed back so they are never run twice
+_coalesced = set()
+
+# Loops which could not be coalesced, mapped to the number of items still to run one by one
+_declined = {}
+
+
+class TrafficJamActionModule(ActionBase):
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(TrafficJamActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        key = (self._task._uuid, task_vars.get('inventory_hostname'))
+        args = dict(self._task.args)
+
+        # Loops of earlier tasks whose last items were skipped are not handed back anymore
+        for _key in [_key for _key in _coalesced if _key != key]:
+            _coalesced.discard(_key)
+            _pending.pop(_key, None)
+
+        # Build the batch when the first item of a loop arrives
+        if key in _declined:
+            _declined[key] -= 1
+            if _declined[key] <= 0:
+                del _declined[key]
+        elif key not in _coalesced and self.coalescible(task_vars):
+            loop = self.render_batch(task_vars)
+            if loop is not None:
+                batch = [_args for _item, _args in loop if _args is not None]
+                if len(batch) > 1 and not self.run_batch(key, loop, batch, task_vars):
+                    _declined[key] = len(batch) - 1
+
+        if key in _coalesced:
+            found, item_result = self.take_result(key, task_vars)
+            if not found:
+                item_result = dict(failed=True, msg="the loop items changed after the loop was coalesced, so the result of this item "
+                                                    "is unknown; set trafficjam_coalesce_loops to false for this task")
+        else:
+            item_result = None
+        if item_result is None:
+            item_result = self._execute_module(module_args=args, task_vars=task_vars)
+
+        result.update(item_result)
+        return result
+
+    def coalescible(self, task_vars):
+        # Only plain loops over the same arguments can be run as one batch
+        if self._task.loop is None or self._task.loop_with:
+            return False
+        if self._task.until or self._task.async_val or self._task.loop_control.pause or \
+                getattr(self._task.loop_control, 'break_when', None):
+            return False
+        return boolean(task_vars.get('trafficjam_coalesce_loops', False), strict=False)
+
+    def take_result(self, key, task_vars):
+        #
+        # Hand back the result of the current loop item, by its index in the loop.
+        #
+        # Ansible runs the items of a loop in order and does not call the action
+        # for items skipped by when, so the current item is the first item from
+        # 'next' on equal to it.  Returns whether it was found, and its result,
+        # None when the batch skipped it and it still has to run.
+        #
+        _loop = _pending.get(key)
+        if _loop is None:
+            return False, None
+        _item = task_vars.get(self._task.loop_control.loop_var or 'item')
+        _index = _loop['next']
+        while _index < len(_loop['items']) and _loop['items'][_index] != _item:
+            _index += 1
+
+        if _index == len(_loop['items']):
+            del _pending[key]
+            return False, None
+
+        _result = _loop['results'][_index]
+        _loop['results'][_index] = None
+        _loop['next'] = _index + 1
+
+        # The loop is done once no result is left to hand back
+        if not any(_result is not None for _result in _loop['results'][_loop['next']:]):
+            del _pending[key]
+        return True, _result
+
+    def render_batch(self, task_vars):
+        #
+        # Render the module arguments of every loop item the way the TaskExecutor would.
+        # Returns a list of (item, module arguments) pairs, with None as arguments for
+        # items skipped by when, or None when the task cannot be rendered here.
+        #
+        try:
+            ds = self._task.get_ds()
+            action, raw_args, delegate_to = ModuleArgsParser(task_ds=ds, collection_list=self._task.collections).parse(skip_action_validation=True)
+            if isinstance(ds.get('delegate_to'), str) and self._templar.is_template(ds['delegate_to']):
+                return None
+
+            # The task copy handed to us already had its loop post-validated into a list, so use the original
+            templar = self._templar.copy_with_new_env(available_variables=task_vars)
+            items = templar.template(ds.get('loop', self._task.loop))
+            if not isinstance(items, list):
+                return None
+            loop_var = self._task.loop_control.loop_var or 'item'
+            index_var = self._task.loop_control.index_var
+
+            # Arguments added after templating, such as module_defaults, apply to every item
+            defaults = dict((_key, _value) for _key, _value in self._task.args.items() if _key not in raw_args)
+
+            loop = []
+            for _index, _item in enumerate(items):
+                item_vars = dict(task_vars)
+                item_vars[loop_var] = _item
+                if index_var:
+                    item_vars[index_var] = _index
+                templar = self._templar.copy_with_new_env(available_variables=item_vars)
+
+                if self._task.when and not self.evaluate_when(templar, item_vars):
+                    loop.append((_item, None))
+                    continue
+
+                _args = dict(defaults)
+                _args.update(templar.template(raw_args))
+                loop.append((_item, _args))
+        except Exception as e:
+            display.vvv(f"trafficjam: not coalescing loop of {self._task.action}: {e}")
+            return None
+
+        return loop
+
+    def evaluate_when(self, templar, item_vars):
+        # The conditional API differs between ansible-core releases
+        if hasattr(self._task, '_resolve_conditional'):
+            return self._task._resolve_conditional(self._task.when, item_vars)
+        return self._task.evaluate_conditional(templar, item_vars)
+
+    def run_batch(self, key, loop, batch, task_vars):
+        module_args = dict(batch[0])
+        module_args['batch'] = batch
+        batch_result = self._execute_module(module_args=module_args, task_vars=task_vars)
+
+        # Modules which could not take the batch fall back to one run per item
+        if 'batch_results' not in batch_result or len(batch_result['batch_results']) != len(batch):
+            display.vvv(f"trafficjam: loop of {self._task.action} was not coalesced: {batch_result.get('msg')}")
+            return False
+
+        display.vvv(f"trafficjam: coalesced {len(batch)} loop items of {self._task.action}")
+        _results = iter(batch_result['batch_results'])
+        _coalesced.add(key)
+        _pending[key] = dict(items=[_item for _item, _args in loop], next=0,
+                             results=[next(_results) if _args is not None else None for _item, _args in loop])
+
+        # The requests of the whole batch are reported once, with the first item
+        if 'trafficjam_requests' in batch_result:
+            _first = next(_result for _result in _pending[key]['results'] if _result is not None)
+            _first['trafficjam_requests'] = batch_result['trafficjam_requests']
+        return True
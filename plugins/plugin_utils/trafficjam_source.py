@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Controller side of the modules reading rows from a file, trafficjam_import and trafficjam_audit.
+#
+# The file named by src is looked up like the copy module looks up its src
+# and copied to the temporary directory of the task on the managed host.  The
+# module reads it from there one row at a time.  Its content never becomes a
+# task variable, so Ansible does not template or serialize it.
+#
+# With remote_src the file is already on the managed host and src is passed on as is.
+#
+
+import os
+
+from ansible.errors import AnsibleError
+from ansible.module_utils._text import to_text
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.plugins.action import ActionBase
+
+
+class TrafficJamSourceActionModule(ActionBase):
+
+    TRANSFERS_FILES = True
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(TrafficJamSourceActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        args = dict(self._task.args)
+        if boolean(args.get('remote_src', False), strict=False) or not args.get('src'):
+            result.update(self._execute_module(module_args=args, task_vars=task_vars))
+            return result
+
+        try:
+            source = self._find_needle('files', args['src'])
+        except AnsibleError as _error:
+            result.update(failed=True, msg=to_text(_error))
+            return result
+
+        try:
+            # The name is kept, the module picks the format from its extension
+            remote = self._connection._shell.join_path(self._connection._shell.tmpdir, os.path.basename(source))
+            self._transfer_file(source, remote)
+            self._fixup_perms2((self._connection._shell.tmpdir, remote))
+
+            args['src'] = remote
+            result.update(self._execute_module(module_args=args, task_vars=task_vars))
+        finally:
+            self._remove_tmp_path(self._connection._shell.tmpdir)
+
+        return result
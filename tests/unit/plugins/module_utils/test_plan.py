@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+from ansible_collections.wwt.trafficjam.plugins.module_utils.objects import list_rows, validate_rows
+from ansible_collections.wwt.trafficjam.plugins.module_utils.plan import build_plan
+
+
+def desired(**kinds):
+    return dict((_kind, [(_line, _row) for _line, _row, _error in validate_rows(_kind, list_rows(_objects))])
+                for _kind, _objects in kinds.items())
+
+
+def test_creates_in_one_collection_are_kept_apart():
+    _requests, _conflicts = build_plan(desired(dummies=[{'name': 'n1'}, {'name': 'n2'}, {'name': 'n3'}],
+                                               vrfs=[{'name': 'a', 'table': 1100}, {'name': 'b', 'table': 1101}]),
+                                       dict(dummies=[], vrfs=[]), False)
+
+    _creates = sorted((_request['path'], _request['payload']['name']) for _request in _requests.values() if _request['method'] == 'POST')
+    assert _creates == [('interfaces/dummies', 'n1'), ('interfaces/dummies', 'n2'), ('interfaces/dummies', 'n3'),
+                        ('vrfs', 'a'), ('vrfs', 'b')]
+    assert _conflicts == []
+
+
+def test_pruned_vrf_still_bound_is_a_conflict():
+    _state = dict(vrfs=[{'id': 6, 'name': 'old', 'table': 1100}],
+                  dummies=[{'id': 1, 'name': 'kept', 'vrf_id': 6}])
+    _requests, _conflicts = build_plan(desired(vrfs=[], dummies=[{'name': 'kept'}]), _state, True)
+
+    assert 'DELETE vrfs/6' not in _requests
+    assert [(_conflict['kind'], _conflict['key']) for _conflict in _conflicts] == [('vrfs', 'old')]
+
+
+def test_pruned_vrf_waits_for_objects_leaving_it():
+    _state = dict(vrfs=[{'id': 6, 'name': 'old', 'table': 1100}],
+                  dummies=[{'id': 1, 'name': 'gone', 'vrf_id': 6}])
+    _requests, _conflicts = build_plan(desired(vrfs=[], dummies=[]), _state, True)
+
+    assert _conflicts == []
+    assert _requests['DELETE vrfs/6']['depends_on'] == ['DELETE interfaces/dummies/1']
+
+
+def test_new_vrfs_get_free_tables():
+    _state = dict(vrfs=[{'id': 1, 'name': 'live', 'table': 1000}])
+    _requests, _conflicts = build_plan(desired(vrfs=[{'name': 'live'}, {'name': 'a'}, {'name': 'b', 'table': 1001}]), _state, False)
+
+    _tables = dict((_request['payload']['name'], _request['payload']['table']) for _request in _requests.values())
+    assert _tables == {'a': 1002, 'b': 1001}
+
+
+def test_vrfs_beyond_the_table_range_are_conflicts():
+    _requests, _conflicts = build_plan(desired(vrfs=[{'name': 'a'}, {'name': 'b'}]), dict(vrfs=[]), False, [1000, 1000])
+
+    assert len(_requests) == 1
+    assert [_conflict['key'] for _conflict in _conflicts] == ['b']
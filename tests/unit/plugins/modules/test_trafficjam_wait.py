@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+from ansible_collections.wwt.trafficjam.plugins.module_utils import trafficjam
+from ansible_collections.wwt.trafficjam.plugins.module_utils.objects import list_rows, object_identity, validate_rows
+from ansible_collections.wwt.trafficjam.plugins.modules.trafficjam_wait import poll
+
+PARAMS = dict(host='127.0.0.1', port=8080, scheme='http', timeout=10, max_workers=4, kind='physical_subinterfaces')
+
+
+def pending(_objects):
+    return dict((object_identity('physical_subinterfaces', _row), (_line, _row))
+                for _line, _row, _error in validate_rows('physical_subinterfaces', list_rows(_objects)))
+
+
+def serve(monkeypatch, _responses):
+    # Answers GET requests by the path below the API with (status_code, response)
+    def send_request(_method, _url, _payload, _timeout, _record_type=None, _record=True):
+        _status_code, _response = _responses[_url.partition(trafficjam.API_PATH)[2]]
+        return dict(status_code=_status_code, response=_response)
+
+    monkeypatch.setattr(trafficjam, 'send_request', send_request)
+
+
+def test_subinterfaces_of_a_deleted_parent_are_absent(monkeypatch):
+    serve(monkeypatch, {'interfaces/physicals/1/subinterfaces': (404, {'detail': 'not found'}),
+                        'interfaces/physicals/2/subinterfaces': (200, [{'id': 9, 'vlan_id': 20}])})
+    _pending = pending([{'physical_id': 1, 'vlan_id': 10}, {'physical_id': 2, 'vlan_id': 20}])
+    _status = {}
+
+    assert poll(dict(PARAMS, state='absent'), _pending, _status) is None
+    assert [_row['physical_id'] for _line, _row in _pending.values()] == [2]
+
+
+def test_a_deleted_parent_fails_the_present_check(monkeypatch):
+    serve(monkeypatch, {'interfaces/physicals/1/subinterfaces': (404, {'detail': 'not found'})})
+    _pending = pending([{'physical_id': 1, 'vlan_id': 10}])
+
+    assert 'interfaces/physicals 1' in poll(dict(PARAMS, state='present'), _pending, {})
+    assert len(_pending) == 1
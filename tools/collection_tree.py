@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# The checkout as an importable collection, shared by the tools which run the
+# modules or module_utils in their own interpreters.
+#
+# The modules import each other as ansible_collections.wwt.trafficjam, so
+# collection_path links the checkout into such a tree in a temporary directory,
+# to be put on PYTHONPATH and removed by the caller once done.
+#
+
+import os
+import tempfile
+
+COLLECTION_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def collection_path(_prefix='trafficjam-'):
+    _path = tempfile.mkdtemp(prefix=_prefix)
+    os.makedirs(os.path.join(_path, 'ansible_collections', 'wwt'))
+    os.symlink(COLLECTION_ROOT, os.path.join(_path, 'ansible_collections', 'wwt', 'trafficjam'))
+    return _path
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Load driver running the real trafficjam_* modules concurrently against a
+# TrafficJam instance, usually tools/trafficjam_emulator.py:
+#
+#   python tools/trafficjam_emulator.py --port 8080 --subinterfaces 50000 --error-rate 0.3 &
+#   python tools/load_driver.py --port 8080 --scenario subinterfaces --runs 2000 --forks 200
+#
+# Every run executes a module the way Ansible does, as its own Python process
+# reading its arguments from a file, so import and startup costs are included.
+# The driver reports the throughput and latency percentiles of the module runs,
+# and of the API requests they made (from trafficjam_requests).
+#
+# Custom workloads pass a module and its arguments.  {n} in a string value is
+# replaced by the number of the run:
+#
+#   python tools/load_driver.py --module trafficjam_dummy_interfaces \
+#       --args '{"state": "present", "config": {"name": "load{n}"}}'
+#
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from collection_tree import COLLECTION_ROOT, collection_path
+
+# module_utils/latency.py imports nothing from the collection, so it is loaded straight from the checkout
+sys.path.insert(0, os.path.join(COLLECTION_ROOT, 'plugins', 'module_utils'))
+from latency import latency_summary  # noqa: E402
+
+# name: (module, arguments)
+SCENARIOS = {
+    'query': ('trafficjam_interfaces', {}),
+    'query_vrfs': ('trafficjam_vrfs', {'state': 'query'}),
+    'vrfs': ('trafficjam_vrfs', {'state': 'present', 'vrf_name': 'load{n}'}),
+    'dummies': ('trafficjam_dummy_interfaces', {'state': 'present', 'config': {'name': 'load{n}'}}),
+    'bridges': ('trafficjam_bridge_interfaces', {'state': 'present', 'config': {'name': 'load{n}'}}),
+    'subinterfaces': ('trafficjam_physical_interfaces',
+                      {'state': 'present', 'subinterface': True, 'config': {'physical_id': 1, 'vlan_id': '{vlan}'}}),
+    'loopback': ('trafficjam_loopback_interfaces', {'state': 'present', 'config': {'description': 'load{n}'}})
+}
+
+def render(_value, _number):
+    # Substitute the run number into every string of the arguments
+    if isinstance(_value, dict):
+        return dict((_key, render(_item, _number)) for _key, _item in _value.items())
+    if isinstance(_value, list):
+        return [render(_item, _number) for _item in _value]
+    if isinstance(_value, str):
+        # VLAN IDs have to stay within 2-4094, and are passed on as integers
+        if _value == '{vlan}':
+            return 2 + _number % 4093
+        return _value.replace('{n}', str(_number))
+    return _value
+
+
+def run_module(_options, _environment, _module, _arguments, _number):
+    _arguments = render(_arguments, _number)
+    _arguments.update(host=_options.host, port=str(_options.port), timeout=_options.timeout,
+                      scheme=_options.scheme, validate_certs=_options.validate_certs, unix_socket=_options.unix_socket)
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as _file:
+        json.dump({'ANSIBLE_MODULE_ARGS': _arguments}, _file)
+
+    _started = time.monotonic()
+    try:
+        _process = subprocess.run(
+            [_options.python, '-m', f"ansible_collections.wwt.trafficjam.plugins.modules.{_module}", _file.name],
+            env=_environment, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=_options.run_timeout
+        )
+        _elapsed = time.monotonic() - _started
+        _output = _process.stdout.decode('utf-8', 'replace')
+    except subprocess.TimeoutExpired:
+        return {'elapsed': time.monotonic() - _started, 'failed': True, 'msg': 'module run timed out', 'requests': []}
+    finally:
+        os.unlink(_file.name)
+
+    try:
+        _result = json.loads(_output[_output.index('{'):])
+    except ValueError:
+        _error = _process.stderr.decode('utf-8', 'replace').strip().splitlines()
+        return {'elapsed': _elapsed, 'failed': True, 'msg': _error[-1] if _error else 'no module output', 'requests': []}
+
+    # Modules report rejected requests by their status code alone
+    _msg = _result.get('msg') or f"status_code {_result.get('status_code')}"
+    return {'elapsed': _elapsed, 'failed': bool(_result.get('failed')), 'msg': _msg,
+            'requests': _result.get('trafficjam_requests') or []}
+
+
+def report(_options, _module, _results, _wall):
+    _requests = [_request for _result in _results for _request in _result['requests']]
+    _failures = {}
+    for _result in _results:
+        if _result['failed']:
+            _failures[_result['msg']] = _failures.get(_result['msg'], 0) + 1
+
+    return {
+        'module': _module,
+        'runs': len(_results),
+        'forks': _options.forks,
+        'failed': sum(_count for _count in _failures.values()),
+        'wall_seconds': round(_wall, 3),
+        'runs_per_second': round(len(_results) / _wall, 2),
+        'requests_per_second': round(len(_requests) / _wall, 2),
+        'run_latency': latency_summary([_result['elapsed'] for _result in _results]),
+        'request_latency': latency_summary([_request[4] for _request in _requests]),
+        'request_errors': sum(1 for _request in _requests if not 200 <= _request[3] <= 299),
+        'failures': sorted(_failures.items(), key=lambda _item: -_item[1])[:10]
+    }
+
+
+def print_report(_report):
+    print(f"{_report['module']}: {_report['runs']} runs with {_report['forks']} forks in {_report['wall_seconds']}s, "
+          f"{_report['failed']} failed")
+    print(f"throughput: {_report['runs_per_second']} runs/s, {_report['requests_per_second']} requests/s")
+    for _name in ['run_latency', 'request_latency']:
+        _summary = _report[_name]
+        _percentiles = ' '.join(f"{_key}={_value * 1000:.1f}ms" for _key, _value in _summary.items() if _key != 'count')
+        print(f"{_name.replace('_', ' ')} ({_summary['count']}): {_percentiles}")
+    if _report['request_errors']:
+        print(f"request errors: {_report['request_errors']}")
+    for _msg, _count in _report['failures']:
+        print(f"  {_count} x {_msg}")
+
+
+def parse_arguments(_arguments=None):
+    parser = argparse.ArgumentParser(description="Run trafficjam_* modules concurrently and report throughput and tail latency.")
+    parser.add_argument('--host', default='127.0.0.1', help="TrafficJam host")
+    parser.add_argument('--port', type=int, default=8080, help="TrafficJam port")
+    parser.add_argument('--scheme', choices=['http', 'https'], default='http', help="scheme module parameter")
+    parser.add_argument('--no-validate-certs', dest='validate_certs', action='store_false',
+                        help="accept self-signed certificates of an https TrafficJam")
+    parser.add_argument('--unix-socket', help="unix_socket module parameter, for an emulator started with --unix-socket")
+    parser.add_argument('--timeout', type=int, default=10, help="timeout module parameter")
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='query', help="predefined workload")
+    parser.add_argument('--module', help="module to run instead of a scenario")
+    parser.add_argument('--args', type=json.loads, default={}, help="JSON module arguments for --module, {n} is the run number")
+    parser.add_argument('--runs', type=int, default=100, help="number of module runs")
+    parser.add_argument('--forks', type=int, default=10, help="number of concurrent module runs")
+    parser.add_argument('--run-timeout', type=float, default=300, help="seconds before a module run is killed")
+    parser.add_argument('--python', default=sys.executable, help="interpreter to run the modules with")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    return parser.parse_args(_arguments)
+
+
+def main():
+    options = parse_arguments()
+    module, arguments = (options.module, options.args) if options.module else SCENARIOS[options.scenario]
+
+    path = collection_path('trafficjam-load-')
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(filter(None, [path, environment.get('PYTHONPATH')]))
+
+    progress_lock = threading.Lock()
+    completed = [0]
+
+    def run(_number):
+        _result = run_module(options, environment, module, arguments, _number)
+        with progress_lock:
+            completed[0] += 1
+            if not options.json and completed[0] % max(1, options.runs // 10) == 0:
+                print(f"  {completed[0]}/{options.runs}", file=sys.stderr, flush=True)
+        return _result
+
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=options.forks) as executor:
+            results = list(executor.map(run, range(options.runs)))
+    finally:
+        shutil.rmtree(path)
+    result = report(options, module, results, time.monotonic() - started)
+
+    if options.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+    return 1 if result['failed'] == len(results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Memory of a decoded TrafficJam response, as dicts and as the records of
+# module_utils/records.py.
+#
+# A list response of --objects subinterfaces, shaped like the ones of
+# tools/trafficjam_emulator.py, is decoded both ways.  The report shows the
+# memory held by the decoded objects, the peak while decoding, and the time to
+# decode and to convert the records back to dicts with plain:
+#
+#   python tools/records_benchmark.py --objects 100000
+#
+# Each representation is measured in its own interpreter, so neither sees the
+# memory left behind by the other.  Decode times are taken without tracemalloc,
+# which slows allocations down.
+#
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+
+from collection_tree import collection_path
+
+MEASURE = '''
+import gc, json, sys, time, tracemalloc
+from ansible_collections.wwt.trafficjam.plugins.module_utils.client import decode_response
+from ansible_collections.wwt.trafficjam.plugins.module_utils.records import SubinterfaceRecord, plain
+with open(sys.argv[1], 'rb') as _file:
+    _body = _file.read().decode()
+_record_type = SubinterfaceRecord if sys.argv[2] == 'records' else None
+_started = time.perf_counter()
+decode_response(200, _body, _record_type)
+_decode = time.perf_counter() - _started
+gc.collect()
+tracemalloc.start()
+_response = decode_response(200, _body, _record_type)
+_current, _peak = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+_started = time.perf_counter()
+plain(_response['response'])
+print(json.dumps({"objects": len(_response['response']), "current": _current, "peak": _peak, "decode": _decode,
+                  "plain": time.perf_counter() - _started if _record_type is not None else None}))
+'''
+
+
+def response_body(_options):
+    # A list of subinterfaces like the emulator generates, half of them in a VRF
+    _random = random.Random(_options.seed)
+    _objects = []
+    for _index in range(_options.objects):
+        _object = {'id': _index + 1, 'vlan_id': 2 + _index // 64, 'description': f"generated {_index}",
+                   'v4_address': f"10.{_random.randrange(256)}.{_random.randrange(256)}.1/24"}
+        if _random.random() < 0.5:
+            _object['vrf_id'] = _random.randrange(1, 100)
+        _objects.append(_object)
+    return json.dumps(_objects)
+
+
+def measure(_options, _environment, _body_path, _representation):
+    # Records are opt-in, see module_utils/records.py
+    _environment = dict(_environment, TRAFFICJAM_RECORDS='1' if _representation == 'records' else '')
+    _output = subprocess.run([_options.python, '-c', MEASURE, _body_path, _representation], env=_environment,
+                             stdout=subprocess.PIPE, check=True).stdout
+    _sample = json.loads(_output)
+    return dict(representation=_representation, objects=_sample['objects'],
+                current_mb=round(_sample['current'] / 1048576, 1), peak_mb=round(_sample['peak'] / 1048576, 1),
+                bytes_per_object=round(_sample['current'] / max(_sample['objects'], 1)),
+                decode_ms=round(_sample['decode'] * 1000, 1),
+                plain_ms=round(_sample['plain'] * 1000, 1) if _sample['plain'] is not None else None)
+
+
+def parse_arguments(_arguments=None):
+    parser = argparse.ArgumentParser(description="Compare the memory of TrafficJam objects decoded as dicts and as records.")
+    parser.add_argument('--objects', type=int, default=100000, help="subinterfaces in the response")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the generated addresses and VRFs")
+    parser.add_argument('--python', default=sys.executable, help="interpreter to measure with")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    return parser.parse_args(_arguments)
+
+
+def main():
+    options = parse_arguments()
+    path = collection_path('trafficjam-records-')
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(filter(None, [path, environment.get('PYTHONPATH')]))
+
+    try:
+        body_path = os.path.join(path, 'response.json')
+        with open(body_path, 'w') as _file:
+            _file.write(response_body(options))
+        body_bytes = os.path.getsize(body_path)
+        results = [measure(options, environment, body_path, _representation) for _representation in ('dicts', 'records')]
+    finally:
+        shutil.rmtree(path)
+
+    if options.json:
+        print(json.dumps(dict(body_bytes=body_bytes, results=results), indent=2))
+        return
+
+    print(f"{options.objects} subinterfaces, {body_bytes / 1048576:.1f} MB response body")
+    print("representation  current MB  peak MB  bytes/object  decode ms  plain ms")
+    for _result in results:
+        _plain = f"{_result['plain_ms']:8.1f}" if _result['plain_ms'] is not None else '       -'
+        print(f"{_result['representation']:<14}  {_result['current_mb']:10.1f}  {_result['peak_mb']:7.1f}  "
+              f"{_result['bytes_per_object']:12d}  {_result['decode_ms']:9.1f}  {_plain}")
+    _dicts, _records = results
+    if _records['current_mb']:
+        print(f"records hold {_dicts['current_mb'] / _records['current_mb']:.1f}x less memory than dicts")
+
+
+if __name__ == '__main__':
+    main()
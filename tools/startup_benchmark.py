@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Startup cost of every trafficjam_* module.
+#
+# Each module is imported in a fresh interpreter --repeat times.  The report
+# shows the median time of the import alone and of the whole process, the
+# number of modules loaded, and whether requests was imported:
+#
+#   python tools/startup_benchmark.py --repeat 20
+#
+# --importtime lists the slowest direct imports of each module, from python -X importtime.
+#
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+from collection_tree import COLLECTION_ROOT, collection_path
+
+MEASURE = '''
+import sys, time, json
+_started = time.perf_counter()
+_loaded = len(sys.modules)
+import {module}
+print(json.dumps({{"import": time.perf_counter() - _started, "modules": len(sys.modules) - _loaded,
+                  "requests": "requests" in sys.modules}}))
+'''
+
+
+def module_names():
+    _directory = os.path.join(COLLECTION_ROOT, 'plugins', 'modules')
+    return sorted(_name[:-3] for _name in os.listdir(_directory) if _name.startswith('trafficjam_') and _name.endswith('.py'))
+
+
+def measure(_options, _environment, _module):
+    _imports, _processes = [], []
+    for _run in range(_options.repeat):
+        _started = time.perf_counter()
+        _output = subprocess.run([_options.python, '-c', MEASURE.format(module=_module)], env=_environment,
+                                 stdout=subprocess.PIPE, check=True).stdout
+        _processes.append(time.perf_counter() - _started)
+        _sample = json.loads(_output)
+        _imports.append(_sample['import'])
+
+    return dict(module=_module.rpartition('.')[2], import_ms=statistics.median(_imports) * 1000,
+                process_ms=statistics.median(_processes) * 1000, modules=_sample['modules'], requests=_sample['requests'])
+
+
+def slowest_imports(_options, _environment, _module, _count=5):
+    # The direct imports of _module taking the longest, including everything they import
+    _stderr = subprocess.run([_options.python, '-X', 'importtime', '-c', f"import {_module}"], env=_environment,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True).stderr.decode()
+    _imports = []
+    for _line in _stderr.splitlines():
+        # import time: self [us] | cumulative | imported package, indented two spaces per level
+        _fields = _line.split('|')
+        if len(_fields) != 3 or not _fields[1].strip().isdigit():
+            continue
+        # Everything before site is interpreter startup
+        if _fields[2].strip() == 'site':
+            _imports = []
+        elif len(_fields[2]) - len(_fields[2].lstrip()) == 3:
+            _imports.append((int(_fields[1]), _fields[2].strip()))
+    return sorted(_imports, reverse=True)[:_count]
+
+
+def parse_arguments(_arguments=None):
+    parser = argparse.ArgumentParser(description="Measure the import and startup time of the trafficjam_* modules.")
+    parser.add_argument('--repeat', type=int, default=10, help="fresh interpreters per module")
+    parser.add_argument('--module', action='append', help="module to measure, default all of them")
+    parser.add_argument('--python', default=sys.executable, help="interpreter to measure with")
+    parser.add_argument('--importtime', action='store_true', help="list the slowest direct imports of each module")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    return parser.parse_args(_arguments)
+
+
+def main():
+    options = parse_arguments()
+    path = collection_path('trafficjam-startup-')
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(filter(None, [path, environment.get('PYTHONPATH')]))
+
+    try:
+        # The interpreter itself, for reference
+        results = [measure(options, environment, 'json')]
+        results[0]['module'] = '(interpreter)'
+        for _name in options.module or module_names():
+            _module = f"ansible_collections.wwt.trafficjam.plugins.modules.{_name}"
+            _result = measure(options, environment, _module)
+            if options.importtime:
+                _result['slowest_imports'] = slowest_imports(options, environment, _module)
+            results.append(_result)
+    finally:
+        shutil.rmtree(path)
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    width = max(len(_result['module']) for _result in results)
+    print(f"{'module'.ljust(width)}  import ms  process ms  modules  requests")
+    for _result in results:
+        print(f"{_result['module'].ljust(width)}  {_result['import_ms']:9.1f}  {_result['process_ms']:10.1f}  "
+              f"{_result['modules']:7d}  {'yes' if _result['requests'] else 'no'}")
+        for _microseconds, _name in _result.get('slowest_imports', []):
+            print(f"{''.ljust(width)}    {_microseconds / 1000:7.1f} ms {_name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+
+# Copyright: (c) 2020, World Wide Technology, All Rights Reserved
+# Written By: Nick Thompson (nick.thompson@wwt.com)
+
+#
+# Emulator of the TrafficJam REST API for load and fault testing the collection.
+#
+# State is kept in memory and can be seeded with a large generated lab:
+#
+#   python tools/trafficjam_emulator.py --port 8080 --seed 1 --physicals 48 --bridges 500 \
+#       --dummies 1000 --vrfs 200 --subinterfaces 50000
+#
+# Faults are injected at random per request:
+#
+#   --latency lognormal:0.02,0.8    delay before answering, see LATENCY_DISTRIBUTIONS
+#   --error-rate 0.3                answer with a 500, 502 or 503
+#   --drop-rate 0.01                close the connection without answering
+#   --slow-body-rate 0.05           send the body in chunks, --slow-body-delay seconds apart
+#
+# Payloads arrive as query parameters, like the modules send them.  GET
+# /_emulator/stats returns the request and connection counters and object
+# counts, POST /_emulator/reset restores the seeded state.
+#
+# --tls-cert and --tls-key serve HTTPS instead.  The connection counters show
+# how many TLS handshakes were resumed from an earlier session.  --unix-socket
+# listens on a unix domain socket instead of TCP, for the unix_socket option.
+#
+
+import argparse
+import json
+import os
+import random
+import socket
+import socketserver
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+API_PREFIX = '/trafficjam/api/'
+
+# Interface collections below /interfaces, mapped to the kind reported in their objects
+INTERFACE_KINDS = {'physicals': 'physical', 'bridges': 'bridge', 'dummies': 'dummy'}
+
+# Integer fields of the API objects.  Everything else is kept as a string.
+INTEGER_FIELDS = ['id', 'table', 'vrf_id', 'bridge_id', 'vlan_id', 'mtu', 'interface_id']
+
+# name: (parameter names, sampler)
+LATENCY_DISTRIBUTIONS = {
+    'none': ([], lambda _random: 0.0),
+    'constant': (['seconds'], lambda _random, _seconds: _seconds),
+    'uniform': (['low', 'high'], lambda _random, _low, _high: _random.uniform(_low, _high)),
+    'normal': (['mean', 'stddev'], lambda _random, _mean, _stddev: max(0.0, _random.gauss(_mean, _stddev))),
+    'lognormal': (['median', 'sigma'], lambda _random, _median, _sigma: _random.lognormvariate(0, _sigma) * _median),
+    'exponential': (['mean'], lambda _random, _mean: _random.expovariate(1 / _mean)),
+    'pareto': (['scale', 'alpha'], lambda _random, _scale, _alpha: _scale * _random.paretovariate(_alpha))
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status_code, message):
+        super(ApiError, self).__init__(message)
+        self.status_code = status_code
+
+
+def parse_latency(_spec):
+    # 'lognormal:0.02,0.8' -> sampler taking a Random instance
+    _name, _separator, _arguments = _spec.partition(':')
+    if _name not in LATENCY_DISTRIBUTIONS:
+        raise argparse.ArgumentTypeError(f"unknown distribution {_name}, choose from {', '.join(LATENCY_DISTRIBUTIONS)}")
+
+    _parameters, _sampler = LATENCY_DISTRIBUTIONS[_name]
+    _values = [float(_value) for _value in _arguments.split(',') if _value]
+    if len(_values) != len(_parameters):
+        raise argparse.ArgumentTypeError(f"{_name} takes {len(_parameters)} parameter(s): {','.join(_parameters)}")
+    return lambda _random: _sampler(_random, *_values)
+
+
+def coerce(_payload):
+    _object = {}
+    for _key, _value in _payload.items():
+        if _key in INTEGER_FIELDS:
+            try:
+                _value = int(_value)
+            except ValueError:
+                raise ApiError(400, f"{_key} must be an integer")
+        _object[_key] = _value
+    return _object
+
+
+class TrafficJamState(object):
+    #
+    # In-memory TrafficJam objects.  Every collection maps an ID to an object,
+    # subinterfaces are kept per parent interface.
+    #
+
+    def __init__(self, options):
+        self.options = options
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.vrfs = {}
+            self.interfaces = {_collection: {} for _collection in INTERFACE_KINDS}
+            self.loopback = {'id': 0, 'name': 'lo', 'kind': 'loopback'}
+            self.subinterfaces = {}
+            self.next_id = 1
+            self.generate(random.Random(self.options.seed))
+
+    def new_id(self):
+        _id = self.next_id
+        self.next_id += 1
+        return _id
+
+    def generate(self, _random):
+        # Build a lab of the requested size.  The same seed always builds the same lab.
+        _options = self.options
+        for _index in range(_options.physicals):
+            _id = self.new_id()
+            self.interfaces['physicals'][_id] = {'id': _id, 'name': f"eth{_index}", 'kind': 'physical', 'mtu': 1500}
+
+        for _index in range(_options.vrfs):
+            _id = self.new_id()
+            self.vrfs[_id] = {'id': _id, 'name': f"vrf{_index}", 'table': 1000 + _index, 'interfaces': []}
+
+        _vrf_ids = list(self.vrfs)
+        for _collection, _count, _prefix in [('bridges', _options.bridges, 'br'), ('dummies', _options.dummies, 'dummy')]:
+            for _index in range(_count):
+                _id = self.new_id()
+                _object = {'id': _id, 'name': f"{_prefix}{_index}", 'kind': INTERFACE_KINDS[_collection]}
+                if _vrf_ids and _random.random() < 0.5:
+                    _object['vrf_id'] = _random.choice(_vrf_ids)
+                self.interfaces[_collection][_id] = _object
+
+        # Subinterfaces are spread over every physical and bridge interface
+        _parents = [('physicals', _id) for _id in self.interfaces['physicals']] + \
+                   [('bridges', _id) for _id in self.interfaces['bridges']]
+        for _index in range(_options.subinterfaces if _parents else 0):
+            _parent = _parents[_index % len(_parents)]
+            _vlan_id = 2 + _index // len(_parents)
+            _id = self.new_id()
+            _object = {'id': _id, 'vlan_id': _vlan_id, 'description': f"generated {_index}",
+                       'v4_address': f"10.{_random.randrange(256)}.{_random.randrange(256)}.1/24"}
+            if _vrf_ids and _random.random() < 0.5:
+                _object['vrf_id'] = _random.choice(_vrf_ids)
+            self.subinterfaces.setdefault(_parent, {})[_id] = _object
+
+    def counts(self):
+        with self.lock:
+            _counts = {'vrfs': len(self.vrfs), 'subinterfaces': sum(len(_subs) for _subs in self.subinterfaces.values())}
+            _counts.update((_collection, len(_objects)) for _collection, _objects in self.interfaces.items())
+            return _counts
+
+    def find_interface(self, _id):
+        for _objects in self.interfaces.values():
+            if _id in _objects:
+                return _objects[_id]
+        for _subinterfaces in self.subinterfaces.values():
+            if _id in _subinterfaces:
+                return _subinterfaces[_id]
+        if _id == self.loopback['id']:
+            return self.loopback
+        raise ApiError(404, f"interface {_id} not found")
+
+    def handle(self, _method, _path, _payload):
+        # Returns (status_code, body object) for an API request
+        _segments = [_segment for _segment in _path.split('/') if _segment]
+        with self.lock:
+            if _segments[:1] == ['vrfs']:
+                return self.handle_vrfs(_method, _segments[1:], _payload)
+            if _segments[:1] == ['interfaces']:
+                return self.handle_interfaces(_method, _segments[1:], _payload)
+        raise ApiError(404, f"no such path /{_path}")
+
+    def handle_collection(self, _method, _objects, _segments, _payload, _clear_on_delete=False, _defaults=None):
+        # Generic list/create/read/update/delete of a collection
+        if not _segments:
+            if _method == 'GET':
+                return 200, list(_objects.values())
+            if _method == 'POST':
+                _object = dict(_defaults or {})
+                _object.update(coerce(_payload))
+                _object['id'] = self.new_id()
+                _objects[_object['id']] = _object
+                return 201, _object
+            raise ApiError(405, f"{_method} is not allowed on a collection")
+
+        _object = _objects.get(self.object_id(_segments[0]))
+        if _object is None:
+            raise ApiError(404, f"object {_segments[0]} not found")
+
+        if _method == 'GET':
+            return 200, _object
+        if _method == 'PUT':
+            _object.update(coerce(_payload))
+            return 200, _object
+        if _method == 'DELETE':
+            if _clear_on_delete:
+                for _key in _payload:
+                    _object.pop(_key, None)
+                return 200, _object
+            del _objects[_object['id']]
+            return 200, {}
+        raise ApiError(405, f"{_method} is not allowed on an object")
+
+    def object_id(self, _segment):
+        try:
+            return int(_segment)
+        except ValueError:
+            raise ApiError(400, f"invalid id {_segment}")
+
+    def handle_vrfs(self, _method, _segments, _payload):
+        if not _segments and _method == 'POST':
+            if not _payload.get('name'):
+                raise ApiError(400, "name is required")
+            if any(_vrf['name'] == _payload['name'] for _vrf in self.vrfs.values()):
+                raise ApiError(409, f"vrf {_payload['name']} already exists")
+
+        # Binding an interface to a VRF
+        if len(_segments) == 1 and _method == 'PUT' and 'interface_id' in _payload:
+            _vrf = self.vrfs.get(self.object_id(_segments[0]))
+            if _vrf is None:
+                raise ApiError(404, f"vrf {_segments[0]} not found")
+            _interface = self.find_interface(self.object_id(_payload['interface_id']))
+            _interface['vrf_id'] = _vrf['id']
+            if _interface['id'] not in _vrf['interfaces']:
+                _vrf['interfaces'].append(_interface['id'])
+            return 200, _vrf
+
+        return self.handle_collection(_method, self.vrfs, _segments, _payload, _defaults={'interfaces': []})
+
+    def handle_interfaces(self, _method, _segments, _payload):
+        if not _segments:
+            if _method != 'GET':
+                raise ApiError(405, f"{_method} is not allowed on /interfaces")
+            _all = [self.loopback]
+            for _objects in self.interfaces.values():
+                _all.extend(_objects.values())
+            return 200, _all
+
+        _collection = _segments[0]
+        if _collection == 'loopback':
+            return self.handle_loopback(_method, _segments[1:], _payload)
+        if _collection not in self.interfaces:
+            raise ApiError(404, f"no such interface type {_collection}")
+
+        _objects = self.interfaces[_collection]
+        _kind = INTERFACE_KINDS[_collection]
+        if len(_segments) <= 2:
+            if _collection == 'physicals' and len(_segments) == 1 and _method == 'POST':
+                raise ApiError(405, "physical interfaces cannot be created")
+            return self.handle_collection(_method, _objects, _segments[1:], _payload,
+                                          _clear_on_delete=_collection == 'physicals', _defaults={'kind': _kind})
+
+        if _segments[2] != 'subinterfaces' or _collection == 'dummies':
+            raise ApiError(404, f"no such path /interfaces/{'/'.join(_segments)}")
+
+        _parent = self.object_id(_segments[1])
+        if _parent not in _objects:
+            raise ApiError(404, f"{_kind} interface {_parent} not found")
+        _subinterfaces = self.subinterfaces.setdefault((_collection, _parent), {})
+
+        if len(_segments) == 3 and _method == 'POST':
+            if 'vlan_id' not in _payload:
+                raise ApiError(400, "vlan_id is required")
+            if any(str(_sub['vlan_id']) == _payload['vlan_id'] for _sub in _subinterfaces.values()):
+                raise ApiError(409, f"vlan {_payload['vlan_id']} already exists on {_kind} interface {_parent}")
+        return self.handle_collection(_method, _subinterfaces, _segments[3:], _payload)
+
+    def handle_loopback(self, _method, _segments, _payload):
+        if _segments:
+            raise ApiError(404, "there is only one loopback interface")
+        if _method == 'GET':
+            return 200, self.loopback
+        if _method == 'PUT':
+            self.loopback.update(coerce(_payload))
+            return 200, self.loopback
+        if _method == 'DELETE':
+            for _key in _payload:
+                if _key not in ('id', 'name', 'kind'):
+                    self.loopback.pop(_key, None)
+            return 200, self.loopback
+        raise ApiError(405, f"{_method} is not allowed on the loopback interface")
+
+
+class Statistics(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = {}
+        self.faults = {'errors': 0, 'drops': 0, 'slow_bodies': 0}
+        self.connections = {'opened': 0, 'tls_resumed': 0}
+
+    def count(self, _method, _status_code):
+        with self.lock:
+            _key = f"{_method} {_status_code}"
+            self.requests[_key] = self.requests.get(_key, 0) + 1
+
+    def connection(self, _socket):
+        with self.lock:
+            self.connections['opened'] += 1
+            if isinstance(_socket, ssl.SSLSocket) and _socket.session_reused:
+                self.connections['tls_resumed'] += 1
+
+    def fault(self, _name):
+        with self.lock:
+            self.faults[_name] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {'uptime': round(time.time() - self.started, 3), 'requests': dict(self.requests), 'faults': dict(self.faults),
+                    'connections': dict(self.connections)}
+
+
+class EmulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'TrafficJamEmulator/1.0'
+
+    def setup(self):
+        # TLS handshakes run here, in the connection's own thread, rather than in the accepting one
+        if isinstance(self.request, ssl.SSLSocket):
+            self.request.do_handshake()
+        # Headers and body are written separately, so Nagle's algorithm would hold the body back
+        # until the client's delayed ACK on every request of a keep-alive connection
+        if self.request.family in (socket.AF_INET, socket.AF_INET6):
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        super(EmulatorHandler, self).setup()
+        self.server.statistics.connection(self.request)
+
+    def address_string(self):
+        # Clients of a unix domain socket have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.options.verbose:
+            super(EmulatorHandler, self).log_message(format, *args)
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        server = self.server
+        url = urlsplit(self.path)
+        payload = dict(parse_qsl(url.query))
+
+        # The modules send everything as query parameters, but accept a body as well
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length)
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                payload.update(json.loads(body or b'{}'))
+            else:
+                payload.update(parse_qsl(body.decode()))
+
+        if url.path.startswith('/_emulator/'):
+            return self.handle_admin(method, url.path)
+
+        with server.random_lock:
+            delay = server.options.latency(server.random)
+            roll = server.random.random()
+
+        if delay:
+            time.sleep(delay)
+
+        options = server.options
+        if roll < options.drop_rate:
+            server.statistics.fault('drops')
+            self.drop()
+            return
+        roll -= options.drop_rate
+
+        if roll < options.error_rate:
+            server.statistics.fault('errors')
+            with server.random_lock:
+                status_code = server.random.choice([500, 502, 503])
+            return self.send(method, status_code, {'error': 'injected fault'})
+        roll -= options.error_rate
+
+        try:
+            if not url.path.startswith(API_PREFIX):
+                raise ApiError(404, f"no such path {url.path}")
+            status_code, body = server.state.handle(method, url.path[len(API_PREFIX):], payload)
+        except ApiError as e:
+            status_code, body = e.status_code, {'error': str(e)}
+
+        self.send(method, status_code, body, slow=roll < options.slow_body_rate)
+
+    def handle_admin(self, method, path):
+        if path == '/_emulator/stats' and method == 'GET':
+            stats = self.server.statistics.snapshot()
+            stats['objects'] = self.server.state.counts()
+            return self.send(method, 200, stats)
+        if path == '/_emulator/reset' and method == 'POST':
+            self.server.state.reset()
+            return self.send(method, 200, self.server.state.counts())
+        self.send(method, 404, {'error': f"no such path {path}"})
+
+    def send(self, method, status_code, body, slow=False):
+        self.server.statistics.count(method, status_code)
+        data = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+
+        if not slow:
+            self.wfile.write(data)
+            return
+
+        # Trickle the body out so clients spend their read timeout on it
+        self.server.statistics.fault('slow_bodies')
+        chunk = max(1, len(data) // self.server.options.slow_body_chunks)
+        for _offset in range(0, len(data), chunk):
+            self.wfile.write(data[_offset:_offset + chunk])
+            self.wfile.flush()
+            time.sleep(self.server.options.slow_body_delay)
+
+    def drop(self):
+        # Reset the connection instead of closing it cleanly
+        self.close_connection = True
+        try:
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, b'\x01\x00\x00\x00\x00\x00\x00\x00')
+        except OSError:
+            pass
+
+
+def setup_emulator(_server, _options):
+    _server.options = _options
+    _server.state = TrafficJamState(_options)
+    _server.statistics = Statistics()
+    _server.random = random.Random(_options.seed)
+    _server.random_lock = threading.Lock()
+
+    if _options.tls_cert:
+        _context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        _context.load_cert_chain(_options.tls_cert, _options.tls_key)
+        _server.socket = _context.wrap_socket(_server.socket, server_side=True, do_handshake_on_connect=False)
+
+
+class EmulatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, options):
+        ThreadingHTTPServer.__init__(self, (options.host, options.port), EmulatorHandler)
+        setup_emulator(self, options)
+
+    def describe(self):
+        return f"{'https' if self.options.tls_cert else 'http'}://{self.options.host}:{self.server_address[1]}"
+
+
+class UnixEmulatorServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, options):
+        # A socket left behind by an earlier run would make bind fail
+        if os.path.exists(options.unix_socket):
+            os.unlink(options.unix_socket)
+        socketserver.ThreadingUnixStreamServer.__init__(self, options.unix_socket, EmulatorHandler)
+        setup_emulator(self, options)
+
+    def describe(self):
+        return f"unix socket {self.options.unix_socket}"
+
+    def server_close(self):
+        socketserver.ThreadingUnixStreamServer.server_close(self)
+        if os.path.exists(self.options.unix_socket):
+            os.unlink(self.options.unix_socket)
+
+
+def parse_arguments(_arguments=None):
+    parser = argparse.ArgumentParser(description="Emulate the TrafficJam REST API with generated state and injected faults.")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--port', type=int, default=8080, help="port to listen on")
+    parser.add_argument('--unix-socket', help="listen on this unix domain socket instead of --host and --port")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the generated lab and of the injected faults")
+    parser.add_argument('--physicals', type=int, default=8, help="number of physical interfaces")
+    parser.add_argument('--bridges', type=int, default=0, help="number of generated bridge interfaces")
+    parser.add_argument('--dummies', type=int, default=0, help="number of generated dummy interfaces")
+    parser.add_argument('--vrfs', type=int, default=0, help="number of generated VRFs")
+    parser.add_argument('--subinterfaces', type=int, default=0,
+                        help="number of generated subinterfaces, spread over the physical and bridge interfaces")
+    parser.add_argument('--latency', type=parse_latency, default=parse_latency('none'),
+                        help="latency distribution, e.g. constant:0.01, uniform:0.005,0.05 or lognormal:0.02,0.8")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with a 5xx")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="fraction of connections reset without an answer")
+    parser.add_argument('--slow-body-rate', type=float, default=0.0, help="fraction of responses sent slowly")
+    parser.add_argument('--slow-body-delay', type=float, default=0.5, help="seconds between the chunks of a slow body")
+    parser.add_argument('--slow-body-chunks', type=int, default=4, help="number of chunks of a slow body")
+    parser.add_argument('--tls-cert', help="PEM certificate to serve HTTPS with")
+    parser.add_argument('--tls-key', help="PEM private key of --tls-cert, if not included in it")
+    parser.add_argument('--verbose', action='store_true', help="log every request")
+    options = parser.parse_args(_arguments)
+
+    if options.error_rate + options.drop_rate + options.slow_body_rate > 1:
+        parser.error("--error-rate, --drop-rate and --slow-body-rate must add up to at most 1")
+    return options
+
+
+def main():
+    options = parse_arguments()
+    server = UnixEmulatorServer(options) if options.unix_socket else EmulatorServer(options)
+    print(f"TrafficJam emulator listening on {server.describe()} with {json.dumps(server.state.counts())}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()